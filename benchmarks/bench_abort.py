@@ -0,0 +1,73 @@
+"""
+Measures the abort-to-safe-state latency of the pickup tree, with moves that block for a while.
+An abort is requested from another thread at a random time while the tree is ticked continuously.
+With cancellation, the move in progress is stopped right away. Without it, the abort has to wait
+for the move to finish.
+
+Run from the root of the project:
+
+    python3 benchmarks/bench_abort.py --aborts 200 --motion-duration 0.02
+"""
+import argparse
+import contextlib
+import io
+import random
+import threading
+
+import py_trees
+
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.mock_object_detector import MockObjectDetector
+from pick_place_trees.mock_force_feedback_sensor import MockForceFeedbackSensor
+from pick_place_trees.world_state import WorldState
+
+from pick_place_trees.abort import AbortController, LatencyHistogram
+from pick_place_trees.behavior_tree import create_pickup_tree
+
+
+def create_tree(motion_duration, rng):
+    manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+    world_state = WorldState(
+        manipulator_state=manipulator_state, object_slip_probability=0.3, object_position=(1, 2, 3), rng=rng)
+    manipulator = MockManipulator(state=manipulator_state, world_state=world_state, grasp_success_rate=0.9,
+                                  move_success_rate=0.9, rng=rng, motion_duration=motion_duration)
+    object_detector = MockObjectDetector(world_state=world_state, detection_success=0.8, rng=rng)
+    force_sensor = MockForceFeedbackSensor(
+        manipulator_state=manipulator_state, world_state=world_state, detection_success=0.9, rng=rng)
+    tree = py_trees.trees.BehaviourTree(create_pickup_tree(manipulator, object_detector, force_sensor))
+    tree.setup(15)
+    return tree, manipulator
+
+
+def measure(num_aborts, motion_duration, cancel, seed):
+    """Returns the latency histogram of num_aborts aborts, each one of a fresh task"""
+    rng = random.Random(seed)
+    latencies = LatencyHistogram()
+    for _ in range(num_aborts):
+        tree, manipulator = create_tree(motion_duration, rng)
+        # without cancellation, the manipulator is only stopped once the tree has been preempted
+        abort = AbortController(manipulator if cancel else None)
+        threading.Timer(rng.uniform(0, 3 * motion_duration), abort.request).start()
+        while abort.tick(tree):
+            if tree.root.status != py_trees.common.Status.RUNNING:
+                tree.root.stop(py_trees.common.Status.INVALID)
+        latencies.record(abort.abort(tree))
+    return latencies
+
+
+def main(num_aborts=200, motion_duration=0.02, seed=0):
+    py_trees.logging.level = py_trees.logging.Level.ERROR
+    with contextlib.redirect_stdout(io.StringIO()):
+        histograms = {cancel: measure(num_aborts, motion_duration, cancel, seed) for cancel in (False, True)}
+    print(f"moves take {motion_duration * 1000:.1f} ms")
+    print(f"without cancellation: {histograms[False]}")
+    print(f"with cancellation:    {histograms[True]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure abort-to-safe-state latencies of the pickup tree.")
+    parser.add_argument('--aborts', type=int, default=200, help="Number of aborts per measurement")
+    parser.add_argument('--motion-duration', type=float, default=0.02, help="Duration of a move in seconds")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the mocks and the abort times")
+    args = parser.parse_args()
+    main(num_aborts=args.aborts, motion_duration=args.motion_duration, seed=args.seed)
@@ -0,0 +1,50 @@
+"""
+Benchmarks the mean cycle time (ticks per episode) of the pickup tree with the fixed grasp recovery
+against the adaptive recovery, for a range of slip probabilities.
+
+Run from the root of the project:
+
+    python3 benchmarks/bench_adaptive_selector.py --episodes 3000
+"""
+import argparse
+import functools
+import math
+import random
+import statistics
+
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.simulation import PickupSimulation, quiet
+
+
+def run_episodes(adaptive_recovery, slip_probability, num_episodes, seed):
+    """Returns the success rate, mean ticks and standard error of the mean ticks of num_episodes episodes"""
+    tree_factory = functools.partial(
+        create_pickup_tree, adaptive_recovery=adaptive_recovery, rng=random.Random(seed))
+    simulation = PickupSimulation(
+        slip_probability=slip_probability, rng=random.Random(seed), tree_factory=tree_factory)
+    with quiet():
+        episodes = [simulation.run_episode() for _ in range(num_episodes)]
+    ticks = [ticks for _, ticks in episodes]
+    return (statistics.mean(success for success, _ in episodes),
+            statistics.mean(ticks),
+            statistics.stdev(ticks) / math.sqrt(num_episodes))
+
+
+def main(num_episodes=3000, slip_probabilities=(0.3, 0.5, 0.7, 0.9), seed=0):
+    print(f"{'slip':>5} {'fixed ticks':>16} {'adaptive ticks':>16} {'reduction':>10} "
+          f"{'fixed success':>14} {'adaptive success':>17}")
+    for slip_probability in slip_probabilities:
+        fixed = run_episodes(False, slip_probability, num_episodes, seed)
+        adaptive = run_episodes(True, slip_probability, num_episodes, seed)
+        print(f"{slip_probability:5.2f} {fixed[1]:9.2f} ± {fixed[2]:4.2f} {adaptive[1]:9.2f} ± {adaptive[2]:4.2f} "
+              f"{1 - adaptive[1] / fixed[1]:9.0%} {fixed[0]:14.3f} {adaptive[0]:17.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the adaptive grasp recovery against the fixed one.")
+    parser.add_argument('--episodes', type=int, default=3000, help="Number of episodes per slip probability")
+    parser.add_argument('--slip', type=float, nargs='+', default=[0.3, 0.5, 0.7, 0.9],
+                        help="Probabilities for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the mocks and the exploration")
+    args = parser.parse_args()
+    main(num_episodes=args.episodes, slip_probabilities=args.slip, seed=args.seed)
@@ -0,0 +1,77 @@
+"""
+Benchmarks ticking the pickup tree with py_trees against the compiled flat interpreter.
+
+Run from the root of the project:
+
+    python3 benchmarks/bench_compiled_tree.py --ticks 20000
+"""
+import argparse
+import contextlib
+import io
+import random
+import time
+
+import py_trees
+
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.mock_object_detector import MockObjectDetector
+from pick_place_trees.mock_force_feedback_sensor import MockForceFeedbackSensor
+from pick_place_trees.world_state import WorldState
+
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.compiled_tree import compile_tree
+
+
+def create_tree(slip_probability):
+    manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+    world_state = WorldState(
+        manipulator_state=manipulator_state,
+        object_slip_probability=slip_probability,
+        object_position=(1, 2, 3))
+    manipulator = MockManipulator(
+        state=manipulator_state, world_state=world_state, grasp_success_rate=0.9, move_success_rate=0.9)
+    object_detector = MockObjectDetector(world_state=world_state, detection_success=0.8)
+    force_sensor = MockForceFeedbackSensor(
+        manipulator_state=manipulator_state, world_state=world_state, detection_success=0.9)
+    return create_pickup_tree(manipulator, object_detector, force_sensor)
+
+
+def time_ticks(tree, num_ticks, seed):
+    """Returns the ticks per second for num_ticks ticks of tree"""
+    random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(num_ticks):
+            tree.tick()
+        elapsed = time.perf_counter() - start
+    return num_ticks / elapsed
+
+
+def main(num_ticks=20000, slip_probability=0.3, repeats=3, seed=0):
+    py_trees.logging.level = py_trees.logging.Level.ERROR
+
+    results = {"py_trees": [], "compiled": []}
+    for _ in range(repeats):
+        reference = py_trees.trees.BehaviourTree(create_tree(slip_probability))
+        reference.setup(15)
+        results["py_trees"].append(time_ticks(reference, num_ticks, seed))
+
+        compiled = compile_tree(create_tree(slip_probability))
+        compiled.setup(15)
+        results["compiled"].append(time_ticks(compiled, num_ticks, seed))
+
+    reference_rate = max(results["py_trees"])
+    compiled_rate = max(results["compiled"])
+    print(f"py_trees: {reference_rate:10.0f} ticks/s")
+    print(f"compiled: {compiled_rate:10.0f} ticks/s")
+    print(f"speedup:  {compiled_rate / reference_rate:10.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark py_trees ticking against the compiled tree.")
+    parser.add_argument('--ticks', type=int, default=20000, help="Number of ticks per measurement")
+    parser.add_argument('--slip', type=float, default=0.3,
+                        help="Probability for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--repeats', type=int, default=3, help="Number of measurements, the best one is reported")
+    args = parser.parse_args()
+    main(num_ticks=args.ticks, slip_probability=args.slip, repeats=args.repeats)
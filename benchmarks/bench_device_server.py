@@ -0,0 +1,79 @@
+"""
+Benchmarks the device server: round-trip latency of single and pipelined calls, and the tick rate
+of the pickup tree with in-process mocks against network adapters. The server runs in its own process.
+
+Run from the root of the project:
+
+    python3 benchmarks/bench_device_server.py --calls 5000 --ticks 5000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+from pick_place_trees.device_server import FORCE_SENSOR, MANIPULATOR, DeviceClient, create_mock_server, parse_address
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.compiled_tree import compile_tree
+from pick_place_trees.simulation import PickupSimulation, quiet
+
+
+def serve(connection, address, seed):
+    server = create_mock_server(address=address, rng=random.Random(seed))
+    connection.send(server.address)
+    with quiet():
+        server.serve_forever()
+
+
+def ticks_per_second(tree, num_ticks):
+    with quiet():
+        start = time.perf_counter()
+        for _ in range(num_ticks):
+            tree.tick()
+        elapsed = time.perf_counter() - start
+    return num_ticks / elapsed
+
+
+def main(num_calls=5000, num_ticks=5000, batch_size=10, address="127.0.0.1:0", seed=0):
+    connection, server_connection = multiprocessing.Pipe()
+    server_address = parse_address(address)
+    server = multiprocessing.Process(target=serve, args=(server_connection, server_address, seed), daemon=True)
+    server.start()
+    client = DeviceClient(connection.recv())
+
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        client.call(FORCE_SENSOR, "detect_force")
+    round_trip = (time.perf_counter() - start) / num_calls
+
+    start = time.perf_counter()
+    for _ in range(num_calls // batch_size):
+        client.pipeline([(MANIPULATOR, "state")] * batch_size)
+    pipelined = (time.perf_counter() - start) / (num_calls // batch_size * batch_size)
+
+    local_rate = ticks_per_second(PickupSimulation(rng=random.Random(seed)).tree, num_ticks)
+    remote_tree = compile_tree(create_pickup_tree(client.manipulator(), client.object_detector(),
+                                                  client.force_sensor()))
+    remote_tree.setup(15)
+    remote_rate = ticks_per_second(remote_tree, num_ticks)
+
+    client.close()
+    server.terminate()
+    server.join()
+    if isinstance(server_address, str):
+        os.unlink(server_address)
+
+    print(f"round trip:               {round_trip * 1e6:8.1f} us")
+    print(f"pipelined ({batch_size:3d} per batch): {pipelined * 1e6:7.1f} us per call")
+    print(f"tick rate in-process:     {local_rate:8.0f} ticks/s")
+    print(f"tick rate over sockets:   {remote_rate:8.0f} ticks/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the device server and its client.")
+    parser.add_argument('--calls', type=int, default=5000, help="Number of calls per latency measurement")
+    parser.add_argument('--ticks', type=int, default=5000, help="Number of ticks per tick rate measurement")
+    parser.add_argument('--batch', type=int, default=10, help="Number of pipelined calls per batch")
+    parser.add_argument('--address', default="127.0.0.1:0", help="host:port or path of a unix socket")
+    args = parser.parse_args()
+    main(num_calls=args.calls, num_ticks=args.ticks, batch_size=args.batch, address=args.address)
@@ -0,0 +1,41 @@
+"""
+Measures how the tick throughput of independent pickup cells scales with the number of threads,
+one cell per thread, against the same cells run one after the other in a single thread. The total
+number of episodes is kept constant.
+
+The threads only run in parallel on a free-threaded interpreter (CPython 3.13+ built with
+--disable-gil, e.g. python3.13t); with the GIL, the speedup stays at about 1.
+
+Run from the root of the project:
+
+    python3.13t benchmarks/bench_multi_tree.py --episodes 8000 --threads 1 2 4 8
+"""
+import argparse
+import os
+
+from pick_place_trees.multi_tree import MultiTreeRunner, gil_enabled
+
+
+def main(episodes=8000, thread_counts=(1, 2, 4, 8), seed=0):
+    print(f"GIL enabled: {gil_enabled()}, {os.cpu_count()} CPUs")
+    baseline = None
+    for threads in thread_counts:
+        runner = MultiTreeRunner(cells=threads, seed=seed)
+        sequential = runner.run(episodes // threads, threaded=False)
+        runner = MultiTreeRunner(cells=threads, seed=seed)
+        threaded = runner.run(episodes // threads)
+        assert threaded.outcomes == sequential.outcomes
+        if baseline is None:
+            baseline = sequential.ticks_per_second
+        print(f"{threads:3d} threads: {threaded.ticks_per_second:9.0f} ticks/s threaded, "
+              f"{sequential.ticks_per_second:9.0f} ticks/s sequential, "
+              f"speedup {threaded.ticks_per_second / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the tick throughput of pickup cells in several threads.")
+    parser.add_argument('--episodes', type=int, default=8000, help="Total number of episodes of all cells")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8], help="Numbers of threads")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first cell")
+    args = parser.parse_args()
+    main(episodes=args.episodes, thread_counts=args.threads, seed=args.seed)
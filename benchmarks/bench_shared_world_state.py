@@ -0,0 +1,86 @@
+"""
+Benchmarks reading the world state from another process: a seqlock read of the shared memory block
+(idle, and while the driver process keeps publishing) against a query over a pipe.
+
+Run from the root of the project:
+
+    python3 benchmarks/bench_shared_world_state.py --reads 100000
+"""
+import argparse
+import multiprocessing
+import time
+
+from pick_place_trees.mock_manipulator import MockManipulatorState
+from pick_place_trees.shared_world_state import SharedWorldState
+from pick_place_trees.world_state import WorldState
+
+
+def create_state():
+    manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+    manipulator_state.endeffector_position = (1, 2, 2.9)
+    return WorldState(manipulator_state=manipulator_state, object_position=(1, 2, 3)), manipulator_state
+
+
+def publish_continuously(block_name, stop):
+    block = SharedWorldState(block_name)
+    world_state, manipulator_state = create_state()
+    while not stop.is_set():
+        block.publish(world_state, manipulator_state)
+    block.close()
+
+
+def serve_queries(connection):
+    block_state = create_state()
+    while connection.recv() is not None:
+        world_state, manipulator_state = block_state
+        connection.send((world_state.object_position, manipulator_state.endeffector_position,
+                         world_state.holding_object, manipulator_state.gripper_closed))
+
+
+def time_reads(read, num_reads):
+    """Returns the mean latency of read() in microseconds"""
+    start = time.perf_counter()
+    for _ in range(num_reads):
+        read()
+    return (time.perf_counter() - start) / num_reads * 1e6
+
+
+def main(num_reads=100000):
+    block = SharedWorldState(create=True)
+    try:
+        block.publish(*create_state())
+        idle = time_reads(block.read, num_reads)
+
+        stop = multiprocessing.Event()
+        writer = multiprocessing.Process(target=publish_continuously, args=(block.name, stop))
+        writer.start()
+        time.sleep(0.1)
+        contended = time_reads(block.read, num_reads)
+        stop.set()
+        writer.join()
+        retries = block.read_retries
+    finally:
+        block.close()
+        block.unlink()
+
+    connection, driver_connection = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve_queries, args=(driver_connection,))
+    server.start()
+
+    def query():
+        connection.send(True)
+        return connection.recv()
+    piped = time_reads(query, num_reads // 10)
+    connection.send(None)
+    server.join()
+
+    print(f"shared memory read:                 {idle:8.2f} us")
+    print(f"shared memory read while publishing: {contended:7.2f} us ({retries} retries)")
+    print(f"pipe query:                         {piped:8.2f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark cross-process reads of the world state.")
+    parser.add_argument('--reads', type=int, default=100000, help="Number of reads per measurement")
+    args = parser.parse_args()
+    main(num_reads=args.reads)
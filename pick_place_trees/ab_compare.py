@@ -0,0 +1,219 @@
+import argparse
+import functools
+import math
+import random
+
+from .behavior_tree import create_pickup_tree
+from .simulation import DEVICES, PickupSimulation, quiet
+
+# The random number streams of a variant: one per mock, and one for the tree (the adaptive recovery)
+STREAMS = DEVICES + ("tree",)
+
+# Tree variants selectable on the command line
+VARIANTS = {
+    "baseline": create_pickup_tree,
+    "adaptive": functools.partial(create_pickup_tree, adaptive_recovery=True),
+}
+
+
+class PairedDifference:
+    """
+    Difference of a per-episode measure between a variant and the baseline, from paired episodes.
+
+    Accumulates the sums of both measures and of their difference, in constant memory. As both
+    variants of a pair see the same device outcomes, their measures are positively correlated and
+    the difference varies much less than with independent episodes. independent_standard_error is
+    the standard error the same number of independent episodes per variant would have had (estimated
+    from the variances of the two measures), variance_reduction the factor of episodes saved.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.episodes = 0
+        self._sums = [0.0] * 5  # baseline, variant, baseline², variant², difference²
+
+    def add(self, baseline: float, variant: float) -> None:
+        sums = self._sums
+        sums[0] += baseline
+        sums[1] += variant
+        sums[2] += baseline * baseline
+        sums[3] += variant * variant
+        sums[4] += (variant - baseline) * (variant - baseline)
+        self.episodes += 1
+
+    def _variance(self, square_sum: float, total: float) -> float:
+        """Sample variance from the sum of squares and the sum."""
+        n = self.episodes
+        return max(square_sum - total * total / n, 0.0) / (n - 1) if n > 1 else math.inf
+
+    @property
+    def baseline_mean(self) -> float:
+        return self._sums[0] / self.episodes if self.episodes else math.nan
+
+    @property
+    def variant_mean(self) -> float:
+        return self._sums[1] / self.episodes if self.episodes else math.nan
+
+    @property
+    def mean(self) -> float:
+        """Mean difference, variant minus baseline."""
+        return self.variant_mean - self.baseline_mean
+
+    @property
+    def standard_error(self) -> float:
+        return math.sqrt(self._variance(self._sums[4], self._sums[1] - self._sums[0]) / self.episodes)
+
+    @property
+    def independent_standard_error(self) -> float:
+        sums = self._sums
+        return math.sqrt((self._variance(sums[2], sums[0]) + self._variance(sums[3], sums[1])) / self.episodes)
+
+    @property
+    def variance_reduction(self) -> float:
+        """How many times more episodes independent runs would need for the same standard error."""
+        if self.standard_error == 0.0:
+            return math.inf if self.independent_standard_error > 0.0 else 1.0
+        return (self.independent_standard_error / self.standard_error) ** 2
+
+    def interval(self, z=1.96) -> tuple[float, float]:
+        """Normal confidence interval of the mean difference, 95% for z=1.96."""
+        return self.mean - z * self.standard_error, self.mean + z * self.standard_error
+
+    def __str__(self):
+        low, high = self.interval()
+        return (f"{self.name}: {self.variant_mean:.4f} - {self.baseline_mean:.4f} = {self.mean:+.4f} "
+                f"[{low:+.4f}, {high:+.4f}], standard error {self.standard_error:.4f} "
+                f"(independent {self.independent_standard_error:.4f}, variance reduction {self.variance_reduction:.1f}x)")
+
+
+class Comparison:
+    """Paired differences of the success rate and of the ticks per episode of a variant against the baseline."""
+    def __init__(self, baseline: str, variant: str):
+        self.baseline = baseline
+        self.variant = variant
+        self.success = PairedDifference("success rate")
+        self.ticks = PairedDifference("ticks")
+
+    def __str__(self):
+        return f"{self.variant} vs {self.baseline}, {self.success.episodes} episodes:\n  {self.success}\n  {self.ticks}"
+
+
+class ABComparison:
+    """
+    Compares tree variants with common random numbers.
+
+    Every variant runs in its own PickupSimulation, with the same mock parameters. In every episode,
+    every mock of every variant draws from a random number generator of its own that is seeded with
+    the same per-episode, per-device seed, so that e.g. the n-th grasp of an episode succeeds in all
+    variants or in none, and the n-th detection finds the object in all of them or in none. The tree
+    gets a generator of its own as well, e.g. for the exploration of the adaptive recovery. The
+    variants thus differ only by what their trees do with the outcomes, and the paired differences
+    of their results have a much smaller variance than the results of independent episodes.
+
+        comparison = ABComparison({"baseline": create_pickup_tree,
+                                   "adaptive": functools.partial(create_pickup_tree, adaptive_recovery=True)})
+        for result in comparison.run(2000):
+            print(result)
+    """
+    def __init__(self, variants: dict, object_detect_success=0.8, move_success=0.9, grasp_success=0.9,
+                 slip_probability=0.3, force_detect_success=0.9, seed=0, max_ticks=None):
+        """
+        Args:
+            variants (dict[str, callable]): tree factories by name, taking (manipulator, object_detector,
+                force_sensor, rng), e.g. create_pickup_tree. The first one is the baseline.
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            seed (int): seed of the per-episode device seeds
+            max_ticks (int): limit of the ticks per episode, see PickupSimulation.run_episode()
+        """
+        if len(variants) < 2:
+            raise ValueError("at least two variants are needed for a comparison")
+        self.names = list(variants)
+        self.rngs = {name: {stream: random.Random() for stream in STREAMS} for name in self.names}
+        self.simulations = {
+            name: PickupSimulation(
+                object_detect_success=object_detect_success,
+                move_success=move_success,
+                grasp_success=grasp_success,
+                slip_probability=slip_probability,
+                force_detect_success=force_detect_success,
+                tree_factory=factory,
+                device_rngs={device: self.rngs[name][device] for device in DEVICES},
+                tree_rng=self.rngs[name]["tree"])
+            for name, factory in variants.items()}
+        self.max_ticks = max_ticks
+        self._seeds = random.Random(seed)
+        self.comparisons = [Comparison(self.names[0], name) for name in self.names[1:]]
+
+    def run_episode(self) -> dict:
+        """
+        Runs an episode of every variant, with the same device seeds.
+
+        Returns:
+            dict[str, tuple[bool, int]]: whether the task succeeded, and the number of ticks it took, by variant.
+        """
+        seeds = [self._seeds.getrandbits(64) for _ in STREAMS]
+        results = {}
+        for name in self.names:
+            for rng, seed in zip(self.rngs[name].values(), seeds):
+                rng.seed(seed)
+            # the variants share blackboard keys, every episode starts with a reset of the own ones
+            results[name] = self.simulations[name].run_episode(self.max_ticks)
+        return results
+
+    def run(self, episodes: int) -> list:
+        """
+        Runs paired episodes, adding to the results of the previous runs.
+
+        Args:
+            episodes (int): number of episodes per variant
+
+        Returns:
+            list[Comparison]: the comparisons of every variant with the baseline.
+        """
+        baseline = self.names[0]
+        with quiet():
+            for _ in range(episodes):
+                results = self.run_episode()
+                success, ticks = results[baseline]
+                for comparison in self.comparisons:
+                    variant_success, variant_ticks = results[comparison.variant]
+                    comparison.success.add(success, variant_success)
+                    comparison.ticks.add(ticks, variant_ticks)
+        return self.comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare pickup tree variants with common random numbers.")
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=["baseline", "adaptive"],
+                        help="Variants to compare, the first one is the baseline")
+    parser.add_argument('--episodes', type=int, default=2000, help="Episodes per variant")
+    parser.add_argument('--object-detect', type=float, default=0.8,
+                        help="Object detection success probability, [0.0..1.0]")
+    parser.add_argument('--move', type=float, default=0.9,
+                        help="Manipulator moving success probability, [0.0..1.0]")
+    parser.add_argument('--grasp', type=float, default=0.9,
+                        help="Manipulator grasp success probability, [0.0..1.0]")
+    parser.add_argument('--slip', type=float, default=0.3,
+                        help="Probability for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--force-detect', type=float, default=0.9,
+                        help="Force-feedback detection success probability, [0.0..1.0]")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the device outcomes")
+    args = parser.parse_args(argv)
+
+    comparison = ABComparison(
+        {name: VARIANTS[name] for name in args.variants},
+        object_detect_success=args.object_detect,
+        move_success=args.move,
+        grasp_success=args.grasp,
+        slip_probability=args.slip,
+        force_detect_success=args.force_detect,
+        seed=args.seed)
+    for result in comparison.run(args.episodes):
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import bisect
+import os
+import signal
+import threading
+import time
+
+import py_trees
+from py_trees.common import Status
+
+# Gripper behaviour in the safe state
+GRIPPER_HOLD = "hold"  # keep the gripper as it is, do not drop a held object
+GRIPPER_OPEN = "open"  # open the gripper
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with logarithmic buckets (10 per decade, from 1 us to 100 s), in constant
+    memory. Quantiles are reported as the upper edge of their bucket, i.e. they are never underestimated.
+    """
+    EDGES = tuple(10 ** (exponent / 10) for exponent in range(-60, 21))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES) + 1)  # the last bucket holds latencies above 100 s
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency: float) -> None:
+        """Adds a latency in seconds."""
+        self.counts[bisect.bisect_left(self.EDGES, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns an upper bound of the q-quantile [0..1] of the recorded latencies, in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if count and cumulative >= rank:
+                return min(self.EDGES[bucket], self.max) if bucket < len(self.EDGES) else self.max
+        return self.max
+
+    def __str__(self):
+        return (f"n={self.count} mean={self.mean * 1000:.3f} ms p50={self.quantile(0.5) * 1000:.3f} ms "
+                f"p99={self.quantile(0.99) * 1000:.3f} ms max={self.max * 1000:.3f} ms")
+
+
+class AbortController:
+    """
+    Aborts a running behavior tree and drives the manipulator to a safe state.
+
+    An abort can be requested from any thread with request(), or by a signal. It cancels a
+    move of the manipulator that is in progress right away (MockManipulator.stop()), and the tree is
+    preempted at the next boundary between behaviours, so no further leaf is executed. abort() then
+    stops all behaviours of the tree, applies the gripper policy, and records the latency from the
+    request until the safe state has been reached.
+
+        abort = AbortController(manipulator)
+        previous_handlers = abort.install_signal_handler()
+        try:
+            while not abort.requested:
+                if not abort.tick(behaviour_tree):
+                    break
+                abort.wait(0.5)
+            if abort.requested:
+                abort.abort(behaviour_tree)
+        finally:
+            abort.restore_signal_handlers(previous_handlers)
+    """
+    def __init__(self, manipulator=None, gripper_policy=GRIPPER_HOLD, clock=time.perf_counter):
+        """
+        Args:
+            manipulator (MockManipulator): the manipulator to stop, no device is stopped if None
+            gripper_policy (str): GRIPPER_HOLD or GRIPPER_OPEN, what to do with the gripper in the safe state
+            clock (callable): returns the current time in seconds, used to measure the abort latency
+        """
+        if gripper_policy not in (GRIPPER_HOLD, GRIPPER_OPEN):
+            raise ValueError(f"Unknown gripper policy '{gripper_policy}'")
+        self._manipulator = manipulator
+        self._gripper_policy = gripper_policy
+        self._clock = clock
+        self._requested = threading.Event()
+        self.reason = None
+        self.requested_at = None
+        self.latencies = LatencyHistogram()
+        self._signal_pipe = None  # write end of the pipe to the signal watcher thread
+
+    @property
+    def requested(self) -> bool:
+        """Returns whether an abort has been requested"""
+        return self._requested.is_set()
+
+    def request(self, reason="abort requested") -> None:
+        """
+        Requests an abort and cancels the manipulator's motion. Further requests are ignored until
+        reset(). Safe to call from any thread, but not from a signal handler: setting the events takes
+        locks, which the interrupted thread may hold. Use install_signal_handler() for signals.
+
+        Args:
+            reason (str): why the task is aborted
+        """
+        if self._requested.is_set():
+            return
+        self.requested_at = self._clock()
+        self.reason = reason
+        self._requested.set()
+        if self._manipulator is not None:
+            self._manipulator.stop()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleeps for timeout seconds, waking up early when an abort is requested.
+
+        Returns:
+            bool: whether an abort has been requested
+        """
+        return self._requested.wait(timeout)
+
+    def install_signal_handler(self, signals=(signal.SIGINT, signal.SIGTERM)) -> dict:
+        """
+        Requests an abort on the given signals. Must be called from the main thread.
+
+        The handler only writes the signal number to a pipe, the abort is requested by a watcher thread
+        reading it, so that no lock is taken in the handler.
+
+        Returns:
+            dict: the previous handler of each signal, to restore them with restore_signal_handlers()
+        """
+        read_fd, write_fd = os.pipe()
+
+        def handler(signum, frame):
+            os.write(write_fd, bytes([signum]))
+
+        def watch():
+            with os.fdopen(read_fd, "rb", buffering=0) as pipe:
+                while signum := pipe.read(1):  # empty once the write end is closed
+                    self.request(f"signal {signal.Signals(signum[0]).name}")
+
+        threading.Thread(target=watch, name="abort signal watcher", daemon=True).start()
+        self._signal_pipe = write_fd
+        return {signum: signal.signal(signum, handler) for signum in signals}
+
+    def restore_signal_handlers(self, previous: dict) -> None:
+        """
+        Restores the signal handlers returned by install_signal_handler() and stops the watcher thread.
+        """
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        if self._signal_pipe is not None:
+            os.close(self._signal_pipe)
+            self._signal_pipe = None
+
+    def tick(self, behaviour_tree: py_trees.trees.BehaviourTree) -> bool:
+        """
+        Ticks the tree once like BehaviourTree.tick(), but stops ticking as soon as an abort is requested.
+
+        Returns:
+            bool: True if the tick was completed, False if it was preempted.
+        """
+        if self.requested:
+            return False
+        for handler in behaviour_tree.pre_tick_handlers:
+            handler(behaviour_tree)
+        for visitor in behaviour_tree.visitors:
+            visitor.initialise()
+
+        ticking = behaviour_tree.root.tick()
+        for node in ticking:
+            if self._requested.is_set():
+                ticking.close()
+                return False
+            for visitor in behaviour_tree.visitors:
+                if not visitor.full:
+                    node.visit(visitor)
+
+        for node in behaviour_tree.root.iterate():
+            for visitor in behaviour_tree.visitors:
+                if visitor.full:
+                    node.visit(visitor)
+        for visitor in behaviour_tree.visitors:
+            visitor.finalise()
+        for handler in behaviour_tree.post_tick_handlers:
+            handler(behaviour_tree)
+        behaviour_tree.count += 1
+        return True
+
+    def abort(self, behaviour_tree: py_trees.trees.BehaviourTree) -> float:
+        """
+        Stops all behaviours of the tree and drives the manipulator to the safe state: motion stopped,
+        gripper according to the gripper policy. Requests an abort if none has been requested yet.
+
+        Returns:
+            float: the latency in seconds from the request until the safe state was reached.
+        """
+        self.request()
+        behaviour_tree.root.stop(Status.INVALID)
+        if self._manipulator is not None:
+            self._manipulator.stop()
+            if self._gripper_policy == GRIPPER_OPEN:
+                self._manipulator.release()
+        latency = self._clock() - self.requested_at
+        self.latencies.record(latency)
+        return latency
+
+    def reset(self) -> None:
+        """Clears the abort request and lets the manipulator move again, e.g. to restart the task."""
+        self._requested.clear()
+        self.reason = None
+        self.requested_at = None
+        if self._manipulator is not None:
+            self._manipulator.resume()
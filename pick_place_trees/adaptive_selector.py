@@ -0,0 +1,117 @@
+import random
+
+import py_trees
+from py_trees.common import Status
+
+
+class AlternativeStatistics:
+    """
+    Online estimates for one alternative of an AdaptiveSelector: a Beta posterior of its success
+    probability and the mean cost (ticks) of an attempt.
+    """
+    def __init__(self, prior_successes=1.0, prior_failures=1.0, prior_cost=1.0):
+        self.successes = prior_successes
+        self.failures = prior_failures
+        self.total_cost = prior_cost
+        self.attempts = 1  # the prior cost counts as one attempt
+        self.pending_cost = 0  # cost of the attempt in progress
+
+    @property
+    def success_probability(self) -> float:
+        """Posterior mean of the success probability."""
+        return self.successes / (self.successes + self.failures)
+
+    @property
+    def mean_cost(self) -> float:
+        return self.total_cost / self.attempts
+
+    def sample_success_probability(self, rng) -> float:
+        """Draws a success probability from the posterior (Thompson sampling)."""
+        return rng.betavariate(self.successes, self.failures)
+
+    def record(self, success: bool) -> None:
+        """Finishes the attempt in progress."""
+        if success:
+            self.successes += 1
+        else:
+            self.failures += 1
+        self.total_cost += self.pending_cost
+        self.attempts += 1
+        self.pending_cost = 0
+
+
+class AdaptiveSelector(py_trees.composites.Selector):
+    """
+    A selector that orders its alternatives to minimise the expected time to success.
+
+    Trying alternatives one after the other until one succeeds has the smallest expected cost when
+    they are ordered by mean cost / success probability. Both are estimated online per child (Beta
+    posterior of the success probability, mean number of ticks of an attempt), and the children are
+    re-ordered whenever the selector starts afresh. With probability `exploration`, the order uses
+    success probabilities sampled from the posteriors instead of their means, which bounds the
+    amount of exploration while still revisiting alternatives that looked bad early on.
+
+    The selector has memory: once an alternative is running, it is ticked until it finishes.
+    """
+    def __init__(self, name: str, children=None, exploration=0.1, prior_successes=1.0, prior_failures=1.0,
+                 rng=None):
+        """
+        Args:
+            name (str): the composite behaviour name
+            children (list[py_trees.behaviour.Behaviour]): the alternatives
+            exploration (float): probability [0..1] of ordering by sampled instead of mean success probabilities
+            prior_successes (float): Beta prior of the success probability of every alternative
+            prior_failures (float): Beta prior of the failure probability of every alternative
+            rng (random.Random): source of randomness for exploration, the random module is used if None.
+        """
+        super(AdaptiveSelector, self).__init__(name=name, memory=True, children=children)
+        self.exploration = exploration
+        self._prior = (prior_successes, prior_failures)
+        self._rng = rng if rng is not None else random
+        self.statistics = {}
+
+    def statistics_for(self, child: py_trees.behaviour.Behaviour) -> AlternativeStatistics:
+        """Returns the estimates for a child."""
+        if child.id not in self.statistics:
+            self.statistics[child.id] = AlternativeStatistics(*self._prior)
+        return self.statistics[child.id]
+
+    def order_children(self) -> None:
+        """Orders the children by expected cost per success, keeping the current order on ties."""
+        explore = self._rng.random() < self.exploration
+
+        def expected_cost(indexed_child):
+            index, child = indexed_child
+            statistics = self.statistics_for(child)
+            if explore:
+                probability = statistics.sample_success_probability(self._rng)
+            else:
+                probability = statistics.success_probability
+            return statistics.mean_cost / max(probability, 1e-9), index
+
+        self.children[:] = [child for _, child in sorted(enumerate(self.children), key=expected_cost)]
+
+    def tick(self):
+        """
+        Orders the children when starting afresh, then ticks like a selector while recording the
+        outcome and cost of every attempt of a child.
+
+        Yields:
+            py_trees.behaviour.Behaviour: a reference to itself or one of its children
+        """
+        if self.status != Status.RUNNING:
+            self.order_children()
+        for node in super(AdaptiveSelector, self).tick():
+            if node.parent is self:
+                statistics = self.statistics_for(node)
+                statistics.pending_cost += 1
+                if node.status in (Status.SUCCESS, Status.FAILURE):
+                    statistics.record(node.status == Status.SUCCESS)
+            yield node
+
+    def stop(self, new_status: Status = Status.INVALID) -> None:
+        """Abandons the attempts in progress when interrupted, see Selector.stop()."""
+        if new_status == Status.INVALID:
+            for child in self.children:
+                self.statistics_for(child).pending_cost = 0
+        super(AdaptiveSelector, self).stop(new_status)
@@ -0,0 +1,511 @@
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+import py_trees
+from py_trees.decorators import Retry, SuccessIsFailure
+
+from .task_gripper import GripperClose, GripperIsClosed, GripperOpen
+from .task_manipulator import ManipulatorCalculatePosition, ManipulatorMoveToPosition
+
+
+def _distances(point, points) -> np.ndarray:
+    return np.sqrt(((points - point) ** 2).sum(axis=-1))
+
+
+def travel_length(points) -> float:
+    """The length of the path through the points, in the given order."""
+    points = np.asarray(points, dtype=float)
+    if len(points) < 2:
+        return 0.0
+    return float(np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1)).sum())
+
+
+def sequence_path(sequence, picks, places, start, end=None, return_home=False) -> list:
+    """
+    The end effector path of a sequence of parts.
+
+    Args:
+        sequence (list[tuple[int, int]]): the (pick index, place index) of every part, in order
+        picks (list[tuple[float, float, float]]): the pick positions
+        places (list[tuple[float, float, float]]): the place positions
+        start (tuple[float, float, float]): where the path starts
+        end (tuple[float, float, float]): where the path ends, at the last place position if None
+        return_home (bool): move back to start after every part, like running one pickup tree per part
+
+    Returns:
+        list[tuple[float, float, float]]: the positions the end effector moves to, in order.
+    """
+    path = [tuple(start)]
+    for pick, place in sequence:
+        path += [tuple(picks[pick]), tuple(places[place])]
+        if return_home:
+            path.append(tuple(start))
+    if end is not None and path[-1] != tuple(end):
+        path.append(tuple(end))
+    return path
+
+
+def _nearest_neighbour(picks, places, start, fixed_slots) -> tuple[list, list]:
+    """Greedy sequence: the nearest remaining part, then (without fixed slots) the nearest free slot."""
+    num_parts = len(picks)
+    picked = np.zeros(num_parts, dtype=bool)
+    used = np.zeros(len(places), dtype=bool)
+    order, slots = [], []
+    position = np.asarray(start, dtype=float)
+    for _ in range(num_parts):
+        distances = _distances(position, picks)
+        distances[picked] = np.inf
+        part = int(np.argmin(distances))
+        picked[part] = True
+        if fixed_slots:
+            slot = part
+        else:
+            distances = _distances(picks[part], places)
+            distances[used] = np.inf
+            slot = int(np.argmin(distances))
+            used[slot] = True
+        order.append(part)
+        slots.append(slot)
+        position = places[slot]
+    return order, slots
+
+
+def _two_opt(order, slots, picks, places, start, end) -> bool:
+    """
+    Improves the order of the parts (with their slots) by reversing segments, in place.
+
+    As every part is a directed pick -> place edge, reversing a segment also reverses the links inside
+    it. Prefix sums of the forward and of the reversed links make evaluating a reversal O(1), and all
+    reversals starting at a part are evaluated at once.
+
+    Returns:
+        bool: whether the order was improved.
+    """
+    improved = False
+    num_parts = len(order)
+    changed = True
+    i = 0
+    while i < num_parts - 1:
+        if changed:
+            a = picks[order]
+            b = places[slots]
+            forward = np.concatenate(([0.0], np.cumsum(_distances(b[:-1], a[1:]))))
+            backward = np.concatenate(([0.0], np.cumsum(_distances(b[1:], a[:-1]))))
+            following = np.vstack((a[1:], [end if end is not None else b[-1]]))
+            leaving = _distances(b, following)  # link from the place of every part to what follows it
+            if end is None:
+                leaving[-1] = 0.0
+            changed = False
+        previous = b[i - 1] if i > 0 else start
+        segment = slice(i + 1, num_parts)
+        from_b_i = _distances(b[i], following[segment])
+        if end is None:
+            from_b_i[-1] = 0.0
+        delta = (_distances(previous, a[segment]) + from_b_i + backward[segment] - backward[i]
+                 - math.dist(previous, a[i]) - leaving[segment] - (forward[segment] - forward[i]))
+        j = int(np.argmin(delta))
+        if delta[j] < -1e-9:
+            j += i + 1
+            order[i:j + 1] = order[i:j + 1][::-1]
+            slots[i:j + 1] = slots[i:j + 1][::-1]
+            improved = changed = True
+        else:
+            i += 1
+    return improved
+
+
+def _or_opt(order, slots, picks, places, start, end, max_segment=3) -> bool:
+    """
+    Improves the order of the parts by moving segments of up to max_segment parts elsewhere in the
+    sequence, in place. Unlike 2-opt, this keeps the direction of all links, which suits the directed
+    pick -> place edges. All insertion points of a segment are evaluated at once.
+
+    Returns:
+        bool: whether the order was improved.
+    """
+    improved = False
+    num_parts = len(order)
+    for length in range(1, max_segment + 1):
+        changed = True
+        i = 0
+        while i + length <= num_parts:
+            if changed:
+                a = picks[order]
+                b = places[slots]
+                # link k leads from sources[k] (start or the place before part k) to targets[k] (part k or the end)
+                sources = np.vstack(([start], b))
+                targets = np.vstack((a, [end if end is not None else start]))
+                links = _distances(sources, targets)
+                if end is None:
+                    links[-1] = 0.0
+                changed = False
+
+            def to_targets(point, gaps):
+                distances = _distances(point, targets[gaps])
+                if end is None:
+                    distances[gaps == num_parts] = 0.0
+                return distances
+
+            last = i + length - 1
+            gain = links[i] + links[i + length] - to_targets(sources[i], np.array([i + length]))[0]
+            gaps = np.concatenate((np.arange(0, i), np.arange(i + length + 1, num_parts + 1)))
+            if not len(gaps):
+                break
+            insertion = _distances(sources[gaps], a[i]) + to_targets(b[last], gaps) - links[gaps]
+            best = int(np.argmin(insertion))
+            if insertion[best] - gain < -1e-9:
+                gap = int(gaps[best])
+                for sequence in (order, slots):
+                    segment = sequence[i:i + length]
+                    if gap < i:
+                        sequence[gap:i + length] = segment + sequence[gap:i]
+                    else:
+                        sequence[i:gap] = sequence[i + length:gap] + segment
+                improved = changed = True
+            else:
+                i += 1
+    return improved
+
+
+def _exchange_slots(order, slots, picks, places, end) -> bool:
+    """
+    Improves the slots of the parts by exchanging the slots of two parts, or by moving a part to a free slot.
+
+    Returns:
+        bool: whether the slots were improved.
+    """
+    improved = False
+    num_parts = len(order)
+    free = np.ones(len(places), dtype=bool)
+    free[slots] = False
+    assigned = np.array(slots)
+    a = picks[order]
+    # what follows the place move of every part, the end point (if any) after the last one
+    following = np.vstack((a[1:], [end if end is not None else a[-1]]))
+    has_following = np.ones(num_parts)
+    if end is None:
+        has_following[-1] = 0.0
+
+    def cost(parts, candidate_slots):
+        """Cost of the place moves of parts when put into candidate_slots."""
+        slot_positions = places[candidate_slots]
+        return (_distances(a[parts], slot_positions)
+                + has_following[parts] * _distances(slot_positions, following[parts]))
+
+    current = cost(np.arange(num_parts), assigned)
+    for i in range(num_parts):
+        others = np.arange(i + 1, num_parts)
+        delta = (cost(i, assigned[others]) + cost(others, assigned[i]) - current[i] - current[others])
+        free_slots = np.flatnonzero(free)
+        delta_free = cost(i, free_slots) - current[i]
+        best = int(np.argmin(delta)) if len(delta) else -1
+        best_free = int(np.argmin(delta_free)) if len(delta_free) else -1
+        if best_free >= 0 and delta_free[best_free] < -1e-9 and (best < 0 or delta_free[best_free] < delta[best]):
+            free[assigned[i]] = True
+            assigned[i] = free_slots[best_free]
+            free[assigned[i]] = False
+            current[i] += delta_free[best_free]
+            improved = True
+        elif best >= 0 and delta[best] < -1e-9:
+            j = int(others[best])
+            assigned[[i, j]] = assigned[[j, i]]
+            current[[i, j]] = cost(np.array([i, j]), assigned[[i, j]])
+            improved = True
+    slots[:] = assigned.tolist()
+    return improved
+
+
+def plan_sequence(picks, places, start, end=None, fixed_slots=False, max_passes=20, tolerance=1e-3) -> list:
+    """
+    Computes a travel-minimizing order of pick and place moves for a batch of parts.
+
+    Starts from the nearest neighbour sequence, which is improved by reversing segments (2-opt) and
+    either moving segments (or-opt) with fixed slots, or exchanging slots if any part may be put into
+    any slot, until the improvements become small.
+
+    Args:
+        picks (list[tuple[float, float, float]]): the end effector positions to pick the parts at
+        places (list[tuple[float, float, float]]): the end effector positions to place the parts at
+        start (tuple[float, float, float]): where the end effector starts
+        end (tuple[float, float, float]): where the end effector has to end, anywhere if None
+        fixed_slots (bool): if True, part i has to be placed at places[i], otherwise at any free place
+        max_passes (int): maximum number of improvement passes
+        tolerance (float): stop once a pass shortens the travel by less than this fraction
+
+    Returns:
+        list[tuple[int, int]]: the (pick index, place index) of every part, in order.
+
+    Raises:
+        ValueError: if there are fewer places than parts, or not one place per part with fixed slots
+    """
+    picks = np.asarray(picks, dtype=float).reshape(-1, 3)
+    places = np.asarray(places, dtype=float).reshape(-1, 3)
+    if len(places) < len(picks) or (fixed_slots and len(places) != len(picks)):
+        raise ValueError(f"{len(picks)} parts can not be placed at {len(places)} places")
+    if not len(picks):
+        return []
+    start = np.asarray(start, dtype=float)
+    end = np.asarray(end, dtype=float) if end is not None else None
+    order, slots = _nearest_neighbour(picks, places, start, fixed_slots)
+
+    def length():
+        return travel_length(sequence_path(zip(order, slots), picks, places, start, end))
+
+    previous = length()
+    for _ in range(max_passes):
+        improved = _two_opt(order, slots, picks, places, start, end)
+        if fixed_slots:
+            # with fixed slots, reversals rarely pay off as the pick -> place edges are long and directed
+            improved = _or_opt(order, slots, picks, places, start, end) or improved
+        else:
+            improved = _exchange_slots(order, slots, picks, places, end) or improved
+        current = length()
+        if not improved or current > (1.0 - tolerance) * previous:
+            break
+        previous = current
+    return list(zip(order, slots))
+
+
+class TravelReport:
+    """End effector travel of a batch, planned against the naive order."""
+    def __init__(self, naive: float, naive_without_home: float, planned: float, planning_time: float):
+        self.naive = naive  # given order, moving home after every part
+        self.naive_without_home = naive_without_home  # given order, moving home after the last part
+        self.planned = planned
+        self.planning_time = planning_time
+
+    @property
+    def saving(self) -> float:
+        """Fraction of the naive travel saved by the planned sequence."""
+        return 1.0 - self.planned / self.naive if self.naive else 0.0
+
+    def __str__(self):
+        return (f"Travel: naive {self.naive:.1f}, without home moves {self.naive_without_home:.1f}, "
+                f"planned {self.planned:.1f} ({self.saving:.1%} less, planned in {self.planning_time:.2f} s)")
+
+
+class FeedPart(py_trees.behaviour.Behaviour):
+    """
+    Presents the next part to a simulated world, which only models a single object: calls feed_part with
+    the pick position of the part and succeeds.
+    """
+    def __init__(self, name="Feed part", feed_part=None, position: tuple[float, float, float] = None):
+        super(FeedPart, self).__init__(name=name)
+        self.feed_part = feed_part
+        self.position = position
+
+    def update(self) -> py_trees.common.Status:
+        self.feed_part(self.position)
+        return py_trees.common.Status.SUCCESS
+
+
+class BatchJob:
+    """
+    Picks and places a batch of parts in a travel-minimizing order, see plan_sequence(), moving home
+    only after the last part.
+
+    The tree is a sequence of per-part subtrees made of the behaviours of create_pickup_tree(): move to
+    the known pick position and grasp (retried, with the same recovery), then move to the place position
+    with the gripper monitor and release. Object detection is not part of the subtrees, as the positions
+    of the parts are given.
+
+        job = BatchJob(manipulator, force_sensor, picks, places)
+        print(job.report())
+        tree = py_trees.trees.BehaviourTree(job.create_tree())
+    """
+    def __init__(self, manipulator, force_sensor, picks, places, home_position=(15, 15, 15), fixed_slots=False,
+                 pick_retries=100):
+        """
+        Args:
+            manipulator (MockManipulator): the manipulator performing the job
+            force_sensor (MockForceFeedbackSensor): the force feedback sensor used to confirm grasp success
+            picks (list[tuple[float, float, float]]): object positions of the parts
+            places (list[tuple[float, float, float]]): object positions of the slots to place the parts at
+            home_position (tuple[float, float, float]): end effector position before and after the job
+            fixed_slots (bool): if True, part i has to be placed at places[i], otherwise at any free place
+            pick_retries (int): number of failed pick attempts after which a part (and the job) fails
+        """
+        self.manipulator = manipulator
+        self.force_sensor = force_sensor
+        self.picks = [tuple(pick) for pick in picks]
+        self.places = [tuple(place) for place in places]
+        self.home_position = tuple(home_position)
+        self.fixed_slots = fixed_slots
+        self.pick_retries = pick_retries
+        # plan with end effector positions, the grasp offset is not necessarily a translation
+        self._pick_targets = [manipulator.get_grasp_position_for(pick) for pick in self.picks]
+        self._place_targets = [manipulator.get_grasp_position_for(place) for place in self.places]
+        started = time.perf_counter()
+        self.sequence = plan_sequence(self._pick_targets, self._place_targets, self.home_position,
+                                      self.home_position, fixed_slots=fixed_slots)
+        self.planning_time = time.perf_counter() - started
+
+    def report(self) -> TravelReport:
+        """Compares the planned travel with placing part i at slot i in the given order."""
+        naive = [(i, i) for i in range(len(self.picks))]
+        home = self.home_position
+        return TravelReport(
+            naive=travel_length(sequence_path(naive, self._pick_targets, self._place_targets, home, home,
+                                              return_home=True)),
+            naive_without_home=travel_length(sequence_path(naive, self._pick_targets, self._place_targets,
+                                                           home, home)),
+            planned=travel_length(sequence_path(self.sequence, self._pick_targets, self._place_targets,
+                                                home, home)),
+            planning_time=self.planning_time)
+
+    def create_part_tree(self, number: int, pick: int, place: int, feed_part=None) -> py_trees.behaviour.Behaviour:
+        """
+        Creates the subtree that picks and places one part.
+
+        Args:
+            number (int): position of the part in the sequence, used in the behaviour names
+            pick (int): index of the pick position
+            place (int): index of the place position
+            feed_part (callable): see create_tree()
+        """
+        manipulator, force_sensor = self.manipulator, self.force_sensor
+        calculate_pick_position = ManipulatorCalculatePosition(
+            name=f"Calculate Pick Position {number}", manipulator=manipulator, object_position=self.picks[pick])
+        move_to_grasp = Retry(
+            name=f"Retry Move To Grasp {number}",
+            child=ManipulatorMoveToPosition(
+                name=f"Move To Grasp {number}",
+                manipulator=manipulator,
+                key_target_pose=calculate_pick_position.key_manipulator_target_position),
+            num_failures=10)
+        grasp_and_recovery = py_trees.composites.Selector(name=f"Grasp and Recovery {number}", memory=False, children=[
+            GripperClose(name=f"Grasp Object {number}", manipulator=manipulator, force_sensor=force_sensor),
+            SuccessIsFailure(
+                name=f"Recovery is error for sequence {number}",
+                child=Retry(name=f"Retry Recovery Grasp {number}",
+                            child=GripperOpen(name=f"Recovery Grasp {number}", manipulator=manipulator,
+                                              force_sensor=force_sensor),
+                            num_failures=10))
+        ])
+        pick_sequence = Retry(
+            name=f"Retry Pick {number}",
+            child=py_trees.composites.Sequence(name=f"Pick {number}", memory=False, children=[
+                calculate_pick_position,
+                move_to_grasp,
+                grasp_and_recovery
+            ]),
+            num_failures=self.pick_retries)
+
+        calculate_place_position = ManipulatorCalculatePosition(
+            name=f"Calculate Place Position {number}", manipulator=manipulator, object_position=self.places[place])
+        move_to_place_with_monitor = py_trees.composites.Parallel(
+            name=f"Move to place with monitor {number}",
+            policy=py_trees.common.ParallelPolicy.SuccessOnAll(synchronise=True),
+            children=[
+                ManipulatorMoveToPosition(
+                    name=f"Move To Place {number}",
+                    manipulator=manipulator,
+                    key_target_pose=calculate_place_position.key_manipulator_target_position),
+                GripperIsClosed(name=f"Monitor Gripper Closed {number}", force_sensor=force_sensor)
+            ])
+        release_object = Retry(
+            name=f"Retry release object {number}",
+            child=GripperOpen(name=f"Release Object {number}", manipulator=manipulator, force_sensor=force_sensor),
+            num_failures=10)
+
+        children = []
+        if feed_part is not None:
+            children.append(FeedPart(name=f"Feed part {number}", feed_part=feed_part, position=self.picks[pick]))
+        children += [
+            pick_sequence,
+            py_trees.composites.Sequence(name=f"Place {number}", memory=False, children=[
+                calculate_place_position,
+                move_to_place_with_monitor,
+                release_object
+            ])
+        ]
+        return py_trees.composites.Sequence(name=f"Part {number}", memory=True, children=children)
+
+    def create_tree(self, feed_part=None) -> py_trees.behaviour.Behaviour:
+        """
+        Creates the tree of the job: the part subtrees in the planned order, and moving home.
+
+        Args:
+            feed_part (callable): for simulated worlds with a single object, called with the pick position of
+                every part before it is picked, e.g. to set the object position of the WorldState
+
+        Returns:
+            The root of the tree.
+        """
+        move_home = Retry(
+            name="Retry move home",
+            child=ManipulatorMoveToPosition(
+                name="Move Home",
+                manipulator=self.manipulator,
+                target_position=self.home_position),
+            num_failures=10)
+        parts = [self.create_part_tree(number, pick, place, feed_part)
+                 for number, (pick, place) in enumerate(self.sequence)]
+        return py_trees.composites.Sequence(name="Batch", memory=True, children=parts + [move_home])
+
+
+class TravelMeter:
+    """
+    A manipulator that measures the distance travelled by the end effector in successful moves.
+    All other attributes are those of the wrapped manipulator.
+    """
+    def __init__(self, manipulator):
+        self._manipulator = manipulator
+        self.travel = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._manipulator, name)
+
+    def move_to_position(self, target_position: tuple[float, float, float]) -> bool:
+        """See MockManipulator.move_to_position()."""
+        position = self._manipulator.endeffector_position
+        moved = self._manipulator.move_to_position(target_position)
+        if moved and position is not None:
+            self.travel += math.dist(position, target_position)
+        return moved
+
+
+def main(argv=None):
+    from .compiled_tree import FAILURE, SUCCESS, compile_tree
+    from .simulation import PickupSimulation, quiet
+
+    parser = argparse.ArgumentParser(description="Plan and simulate a batch of pick and place jobs.")
+    parser.add_argument('--parts', type=int, default=1000, help="Number of parts")
+    parser.add_argument('--slots', type=int, default=None, help="Number of slots, as many as parts if not given")
+    parser.add_argument('--fixed-slots', action='store_true', help="Part i has to be placed into slot i")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the positions and the mocks")
+    parser.add_argument('--simulate', action='store_true', help="Run the job with perfect mocks and measure the travel")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    # parts and slots spread over a table, e.g. when sorting parts into trays
+    num_slots = args.slots if args.slots is not None else args.parts
+    picks = [(rng.uniform(0, 10), rng.uniform(0, 10), 1.0) for _ in range(args.parts)]
+    places = [(rng.uniform(0, 10), rng.uniform(0, 10), 1.0) for _ in range(num_slots)]
+
+    simulation = PickupSimulation(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                                  slip_probability=0.0, force_detect_success=1.0, rng=rng)
+    meter = TravelMeter(simulation.manipulator)
+    job = BatchJob(meter, simulation.force_sensor, picks, places, fixed_slots=args.fixed_slots)
+    print(job.report())
+
+    if args.simulate:
+        def feed_part(position):
+            simulation.world_state.object_position = position
+
+        simulation.manipulator_state.endeffector_position = job.home_position
+        tree = compile_tree(job.create_tree(feed_part=feed_part))
+        tree.setup(15)
+        ticks = 0
+        with quiet():
+            while tree.status[0] not in (SUCCESS, FAILURE):
+                tree.tick()
+                ticks += 1
+        print(f"Simulated: {tree.root_status.name} after {ticks} ticks, travel {meter.travel:.1f}")
+
+
+if __name__ == '__main__':
+    main()
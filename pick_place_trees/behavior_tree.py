@@ -7,6 +7,8 @@ from .world_state import WorldState
 from .task_detect_object import DetectObject
 from .task_manipulator import ManipulatorMoveToPosition, ManipulatorCalculatePosition
 from .task_gripper import GripperClose, GripperOpen, GripperIsClosed
+from .adaptive_selector import AdaptiveSelector
+from .deadline_retry import DeadlineRetry
 
 import py_trees
 from py_trees.decorators import Retry, SuccessIsFailure
@@ -15,7 +17,13 @@ import time
 
 def create_pickup_tree(manipulator, object_detector, force_sensor,
                        object_target_position=(5, 5, 5),
-                       manipulator_end_position=(15, 15, 15)):
+                       manipulator_end_position=(15, 15, 15),
+                       adaptive_recovery=False,
+                       rng=None,
+                       namespace=None,
+                       timeouts=None,
+                       retry_deadline=None,
+                       clock=time.perf_counter):
     """
     Creates a behavior tree for a single-arm pickup task, where the manipulator
     detects an object, confirms reachability, moves there, grasps, moves to the target, releases,
@@ -28,6 +36,18 @@ def create_pickup_tree(manipulator, object_detector, force_sensor,
         object_target_position (tuple[float, float, float]): target position for object to be placed at
         manipulator_end_position (tuple[float, float, float]): cartesian target position for the end effector to
             move to after placing the object ("home pose").
+        adaptive_recovery (bool): if True, a failed grasp is recovered by an AdaptiveSelector that chooses
+            between grasping again in place, re-approaching the object and detecting it again, based on the
+            observed success rates and costs of these alternatives.
+        rng (random.Random): source of randomness for the exploration of the adaptive recovery
+        namespace (str): blackboard namespace of the keys of the tree, e.g. "/cell_1", so that several
+            trees can run side by side without overwriting each other's object and target positions
+        timeouts (dict[str, float]): per-call deadlines in seconds of the device calls, by device_latency.DEVICE_CALLS
+            name ("detect_object", "detect_force", "move_to_position"). A call that takes longer fails the
+            behaviour that made it. No deadline for calls that are missing.
+        retry_deadline (float): if given, the retries of the device behaviours are DeadlineRetry decorators
+            that give up this many seconds after their first attempt
+        clock (callable): the clock of the devices for the retry deadlines, e.g. a device_latency.SimulatedClock
 
     Returns:
         The root of the behavior tree sequence for the pickup task.
@@ -35,34 +55,74 @@ def create_pickup_tree(manipulator, object_detector, force_sensor,
 
     # py_trees.logging.level = py_trees.logging.Level.DEBUG
     py_trees.blackboard.Blackboard.enable_activity_stream(maximum_size=100)
+    timeouts = timeouts if timeouts is not None else {}
+    detect_timeout = timeouts.get("detect_object")
+    force_timeout = timeouts.get("detect_force")
+    move_timeout = timeouts.get("move_to_position")
+
+    def retry(name, child, num_failures):
+        if retry_deadline is None:
+            return Retry(name=name, child=child, num_failures=num_failures)
+        return DeadlineRetry(name=name, child=child, num_failures=num_failures, deadline=retry_deadline, clock=clock)
     
-    detect_object = DetectObject(name="Detect object", object_detector=object_detector)
-    retry_detect_object = Retry(name="Retry Detect Object", child=detect_object, num_failures=10)
+    detect_object = DetectObject(name="Detect object", object_detector=object_detector, namespace=namespace,
+                                 timeout=detect_timeout)
+    retry_detect_object = retry(name="Retry Detect Object", child=detect_object, num_failures=10)
 
-    calculate_pick_position = ManipulatorCalculatePosition(name="Calculate Pick Position", manipulator=manipulator, key_object_position=detect_object.key_object_pose)
-    move_to_grasp = Retry(
+    calculate_pick_position = ManipulatorCalculatePosition(name="Calculate Pick Position", manipulator=manipulator, key_object_position=detect_object.key_object_pose, namespace=namespace)
+    move_to_grasp = retry(
             name="Retry Move To Grasp",
             child=ManipulatorMoveToPosition(
                 name="Move To Grasp",
                 manipulator=manipulator,
-                key_target_pose=calculate_pick_position.key_manipulator_target_position),
+                key_target_pose=calculate_pick_position.key_manipulator_target_position,
+                namespace=namespace,
+                timeout=move_timeout),
             num_failures=10)
 
-    grasp_object = GripperClose(name="Grasp Object", manipulator=manipulator, force_sensor=force_sensor)
+    grasp_object = GripperClose(name="Grasp Object", manipulator=manipulator, force_sensor=force_sensor,
+                                timeout=force_timeout)
     recovery_failed_grasp = SuccessIsFailure(
             name="Recovery is error for sequence",
-            child=Retry(name="Retry Recovery Grasp",
-                        child=GripperOpen(name="Recovery Grasp", manipulator=manipulator, force_sensor=force_sensor),
+            child=retry(name="Retry Recovery Grasp",
+                        child=GripperOpen(name="Recovery Grasp", manipulator=manipulator, force_sensor=force_sensor,
+                                          timeout=force_timeout),
                         num_failures=10))
-    grasp_and_recovery = py_trees.composites.Selector(name="Grasp and Recovery", memory=False, children=[
-        grasp_object,
-        recovery_failed_grasp
-    ])
+    if adaptive_recovery:
+        regrasp_in_place = py_trees.composites.Sequence(name="Regrasp in place", memory=True, children=[
+            GripperOpen(name="Regrasp Open", manipulator=manipulator, force_sensor=force_sensor, timeout=force_timeout),
+            GripperClose(name="Regrasp Close", manipulator=manipulator, force_sensor=force_sensor, timeout=force_timeout)
+        ])
+        reapproach = py_trees.composites.Sequence(name="Re-approach", memory=True, children=[
+            GripperOpen(name="Re-approach Open", manipulator=manipulator, force_sensor=force_sensor,
+                        timeout=force_timeout),
+            retry(name="Retry Re-approach Move",
+                  child=ManipulatorMoveToPosition(
+                      name="Re-approach Move",
+                      manipulator=manipulator,
+                      key_target_pose=calculate_pick_position.key_manipulator_target_position,
+                      namespace=namespace,
+                      timeout=move_timeout),
+                  num_failures=10),
+            GripperClose(name="Re-approach Close", manipulator=manipulator, force_sensor=force_sensor,
+                         timeout=force_timeout)
+        ])
+        grasp_and_recovery = AdaptiveSelector(name="Grasp and Recovery", rng=rng, children=[
+            grasp_object,
+            regrasp_in_place,
+            reapproach,
+            recovery_failed_grasp
+        ])
+    else:
+        grasp_and_recovery = py_trees.composites.Selector(name="Grasp and Recovery", memory=False, children=[
+            grasp_object,
+            recovery_failed_grasp
+        ])
    
-    calculate_place_position = ManipulatorCalculatePosition(name="Calculate Place Position", manipulator=manipulator, object_position=object_target_position)
+    calculate_place_position = ManipulatorCalculatePosition(name="Calculate Place Position", manipulator=manipulator, object_position=object_target_position, namespace=namespace)
     
-    move_to_place = ManipulatorMoveToPosition(name="Move To Place", manipulator=manipulator, key_target_pose=calculate_place_position.key_manipulator_target_position)
-    monitor_object = GripperIsClosed(name="Monitor Gripper Closed", force_sensor=force_sensor)
+    move_to_place = ManipulatorMoveToPosition(name="Move To Place", manipulator=manipulator, key_target_pose=calculate_place_position.key_manipulator_target_position, namespace=namespace, timeout=move_timeout)
+    monitor_object = GripperIsClosed(name="Monitor Gripper Closed", force_sensor=force_sensor, timeout=force_timeout)
     move_to_place_with_monitor = py_trees.composites.Parallel(
             name="Move to place with monitor",
             policy=py_trees.common.ParallelPolicy.SuccessOnAll(synchronise=True),
@@ -72,20 +132,22 @@ def create_pickup_tree(manipulator, object_detector, force_sensor,
                 ]
             )
 
-    release_object = Retry(
+    release_object = retry(
             name="Retry release object",
             child=GripperOpen(
                 name="Release Object",
                 manipulator=manipulator,
-                force_sensor=force_sensor),
+                force_sensor=force_sensor,
+                timeout=force_timeout),
             num_failures=10)
 
-    move_home = Retry(
+    move_home = retry(
             name="Retry move home",
             child=ManipulatorMoveToPosition(
                 name="Move Home",
                 manipulator=manipulator,
-                target_position=manipulator_end_position),
+                target_position=manipulator_end_position,
+                timeout=move_timeout),
             num_failures=10)
 
 
@@ -108,7 +170,25 @@ def create_pickup_tree(manipulator, object_detector, force_sensor,
     root.add_children([pick_sequence, place_sequence])
     return root
 
-def run_tree(root, world_state, max_num_runs=1) -> bool:
+def release_tree(root) -> None:
+    """
+    Unregisters the blackboard clients of all behaviours of a tree that is no longer used.
+
+    py_trees keeps every client in a global registry, so trees that are created over and over again,
+    e.g. one per part, would otherwise never be freed. Keys that are no longer used by any other client
+    are removed from the blackboard.
+
+    Args:
+        root (py_trees.behaviour.Behaviour): root of the tree, as created by e.g. create_pickup_tree
+    """
+    for behaviour in root.iterate():
+        for client in behaviour.blackboards:
+            client.unregister(clear=True)
+        behaviour.blackboards = []
+
+
+def run_tree(root, world_state, max_num_runs=1, sensor_snapshot=None, abort=None, trace_recorder=None,
+             tick_period=0.5, tick_monitor=None) -> bool:
     """
     Runs a behavior tree, trying max_num_runs times to re-run the same tree (without resetting
     the world state in-between).
@@ -116,6 +196,14 @@ def run_tree(root, world_state, max_num_runs=1) -> bool:
     Args:
         root(your implementation of the tree): root of the BT as created by e.g. create_pickup_tree
         world_state(WorldState): the world state **to be used for debugging only**.
+        sensor_snapshot(SensorSnapshot): if the tree's devices are wrapped by a sensor snapshot,
+            the snapshot that is to be advanced on every tick.
+        abort(AbortController): if given, the tree is preempted as soon as an abort is requested,
+            and the manipulator is driven to the safe state.
+        trace_recorder(TraceRecorder): if given, records the run as a timeline, every run being an episode.
+        tick_period(float): seconds to wait between two ticks
+        tick_monitor: if given, attached to the tree with tick_monitor.attach(behaviour_tree) after the
+            other tick handlers, e.g. a soak.TickLatencyMonitor
     Returns:
         True if the tree was successfully run, False on error.
     """
@@ -125,21 +213,42 @@ def run_tree(root, world_state, max_num_runs=1) -> bool:
 
     behavior_tree = py_trees.trees.BehaviourTree(root)
     behavior_tree.add_post_tick_handler(print_tree)
+    if sensor_snapshot is not None:
+        behavior_tree.add_pre_tick_handler(sensor_snapshot.new_tick)
+    if trace_recorder is not None:
+        trace_recorder.instrument(root)
+        trace_recorder.attach(behavior_tree)
+    if tick_monitor is not None:
+        tick_monitor.attach(behavior_tree)
     behavior_tree.setup(15)
     while max_num_runs > 0:
         try:
-            behavior_tree.tick()
+            if abort is None:
+                behavior_tree.tick()
+            elif not abort.tick(behavior_tree):
+                latency = abort.abort(behavior_tree)
+                print(f"Task aborted ({abort.reason}), safe state reached after {latency * 1000:.3f} ms")
+                if trace_recorder is not None:
+                    trace_recorder.end_episode()
+                return False
             if root.status == py_trees.common.Status.SUCCESS:
                 print("Task completed successfully!")
+                if trace_recorder is not None:
+                    trace_recorder.end_episode()
                 return True
             if root.status == py_trees.common.Status.FAILURE:
                 print("Task failed!")
                 max_num_runs -= 1
+                if trace_recorder is not None:
+                    trace_recorder.end_episode()
 
             print(f"\n--------Attempt {max_num_runs}; Tick {behavior_tree.count}------------ \n")
-            time.sleep(0.5)
+            if abort is None:
+                time.sleep(tick_period)
+            else:
+                abort.wait(tick_period)
         except KeyboardInterrupt:
-            root.interrupt()
+            root.stop(py_trees.common.Status.INVALID)
             break
 
     return False
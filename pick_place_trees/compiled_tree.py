@@ -0,0 +1,458 @@
+from array import array
+
+import py_trees
+from py_trees.common import ParallelPolicy, Status
+from py_trees.composites import Composite, Parallel, Selector, Sequence
+from py_trees.decorators import Decorator, FailureIsSuccess, Inverter, Retry, SuccessIsFailure
+
+# Status codes as stored in the status array
+INVALID = 0
+RUNNING = 1
+SUCCESS = 2
+FAILURE = 3
+
+STATUSES = (Status.INVALID, Status.RUNNING, Status.SUCCESS, Status.FAILURE)
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# Node kinds as stored in the kind array
+LEAF = 0
+SEQUENCE = 1
+SELECTOR = 2
+PARALLEL = 3
+RETRY = 4
+SUCCESS_IS_FAILURE = 5
+FAILURE_IS_SUCCESS = 6
+INVERTER = 7
+OPAQUE = 8
+
+_COMPOSITE_KINDS = {Sequence: SEQUENCE, Selector: SELECTOR, Parallel: PARALLEL}
+_DECORATOR_KINDS = {
+    Retry: RETRY,
+    SuccessIsFailure: SUCCESS_IS_FAILURE,
+    FailureIsSuccess: FAILURE_IS_SUCCESS,
+    Inverter: INVERTER,
+}
+
+# Parallel policies as stored in the policy array
+_SUCCESS_ON_ALL = 0
+_SUCCESS_ON_ONE = 1
+_SUCCESS_ON_SELECTED = 2
+
+
+class CompiledTree:
+    """
+    A py_trees tree lowered into a flat, array-based interpreter.
+
+    The tree is laid out in pre-order: node ``0`` is the root, and every composite or decorator
+    refers to its children through a slice of a shared child index array. Node statuses,
+    retry counters, current children and parallel policies live in contiguous arrays and
+    ticking is a plain recursive dispatch on node indices, without the generators, per-node
+    logging and status enum comparisons of ``py_trees``' ``tick()``.
+
+    The leaves are not compiled: their ``initialise()``, ``update()`` and ``terminate()`` methods
+    are called exactly like ``py_trees`` would call them, so the interpreter has tick-by-tick
+    status parity with :class:`py_trees.trees.BehaviourTree` on the same tree.
+    Sequence, Selector and Parallel composites and the Retry, SuccessIsFailure,
+    FailureIsSuccess and Inverter decorators are compiled; any other composite or decorator
+    (including subclasses of the above) is kept as an opaque node that is ticked through
+    ``py_trees`` as a whole.
+
+    The compiled tree owns the runtime state. The ``py_trees`` nodes only see up-to-date
+    statuses for leaves; call write_back() to copy the state of all nodes back, e.g. for display.
+    """
+    def __init__(self, root: py_trees.behaviour.Behaviour):
+        """
+        Compiles a tree.
+
+        Args:
+            root (py_trees.behaviour.Behaviour): root of the tree, as created by e.g. create_pickup_tree
+        """
+        self.root = root
+        self.nodes = []
+        self.count = 0
+        self.pre_tick_handlers = []
+        self.post_tick_handlers = []
+
+        kinds = []
+        children = []
+        policies = {}
+        self._selected = {}
+        self._lower(root, kinds, children, policies)
+
+        size = len(self.nodes)
+        self.kind = array('b', kinds)
+        self.first_child = array('l', [0] * size)
+        self.num_children = array('l', [0] * size)
+        self.child_index = array('l')
+        for i, node_children in enumerate(children):
+            self.first_child[i] = len(self.child_index)
+            self.num_children[i] = len(node_children)
+            self.child_index.extend(node_children)
+
+        self.status = array('b', [_STATUS_CODES[node.status] for node in self.nodes])
+        self.current = array('l', [-1] * size)  # slot of the current child in the child slice
+        self.failures = array('l', [0] * size)
+        self.num_failures = array('l', [0] * size)
+        self.memory = array('b', [0] * size)
+        self.policy = array('b', [policies.get(i, 0) for i in range(size)])
+        self.synchronise = array('b', [0] * size)
+        for i, node in enumerate(self.nodes):
+            kind = self.kind[i]
+            if kind == RETRY:
+                self.failures[i] = node.failures
+                self.num_failures[i] = node.num_failures
+            elif kind in (SEQUENCE, SELECTOR):
+                self.memory[i] = node.memory
+            elif kind == PARALLEL:
+                self.synchronise[i] = node.policy.synchronise
+            if kind in (SEQUENCE, SELECTOR, PARALLEL) and node.current_child is not None:
+                self.current[i] = node.children.index(node.current_child)
+
+    def _lower(self, node, kinds, children, policies) -> int:
+        """Appends node and its subtree in pre-order, returns the index of node."""
+        index = len(self.nodes)
+        self.nodes.append(node)
+        kinds.append(None)
+        children.append([])
+
+        node_type = type(node)
+        if node_type in _COMPOSITE_KINDS:
+            kinds[index] = _COMPOSITE_KINDS[node_type]
+            children[index] = [self._lower(child, kinds, children, policies) for child in node.children]
+            if node_type is Parallel:
+                policies[index] = self._lower_policy(index, node, children[index])
+        elif node_type in _DECORATOR_KINDS:
+            kinds[index] = _DECORATOR_KINDS[node_type]
+            children[index] = [self._lower(node.decorated, kinds, children, policies)]
+        elif isinstance(node, (Composite, Decorator)):
+            kinds[index] = OPAQUE
+        else:
+            kinds[index] = LEAF
+        return index
+
+    def _lower_policy(self, index, node, child_indices) -> int:
+        """Returns the policy code of a parallel node, remembering the selected children if needed."""
+        policy_type = type(node.policy)
+        if policy_type is ParallelPolicy.SuccessOnAll:
+            return _SUCCESS_ON_ALL
+        if policy_type is ParallelPolicy.SuccessOnOne:
+            return _SUCCESS_ON_ONE
+        if policy_type is ParallelPolicy.SuccessOnSelected:
+            node.validate_policy_configuration()
+            self._selected[index] = [child_indices[node.children.index(child)] for child in node.policy.children]
+            return _SUCCESS_ON_SELECTED
+        raise RuntimeError(f"this parallel has been configured with an unrecognised policy [{policy_type}]")
+
+    def setup(self, timeout=py_trees.common.Duration.INFINITE, **kwargs) -> None:
+        """
+        Calls setup() on all behaviours of the tree, see py_trees.trees.BehaviourTree.setup().
+        """
+        py_trees.trees.setup(root=self.root, timeout=timeout, **kwargs)
+
+    def add_pre_tick_handler(self, handler) -> None:
+        """Adds a function that is called with this tree before every tick."""
+        self.pre_tick_handlers.append(handler)
+
+    def add_post_tick_handler(self, handler) -> None:
+        """Adds a function that is called with this tree after every tick."""
+        self.post_tick_handlers.append(handler)
+
+    @property
+    def root_status(self) -> Status:
+        """The py_trees status of the root node."""
+        return STATUSES[self.status[0]]
+
+    def statuses(self) -> list:
+        """Returns the py_trees statuses of all nodes, in pre-order (the order of self.nodes)."""
+        return [STATUSES[code] for code in self.status]
+
+    def tick(self) -> None:
+        """
+        Ticks the tree once, running the pre and post tick handlers.
+        """
+        for handler in self.pre_tick_handlers:
+            handler(self)
+        self._tick(0)
+        for handler in self.post_tick_handlers:
+            handler(self)
+        self.count += 1
+
+    def interrupt(self) -> None:
+        """Stops the whole tree, equivalent to stopping the root with INVALID status."""
+        self._stop(0, INVALID)
+
+    def get_state(self) -> tuple:
+        """
+        Captures the runtime state (statuses, retry counters, current children) as a hashable tuple.
+        Opaque nodes are not captured.
+        """
+        return (self.status.tobytes(), self.failures.tobytes(), self.current.tobytes())
+
+    def set_state(self, state: tuple) -> None:
+        """
+        Restores a runtime state captured by get_state(), in place.
+
+        The internal state of opaque nodes is not part of the runtime state: they are only stopped
+        if they are restored to INVALID, so that they start afresh on their next tick.
+        """
+        status, failures, current = state
+        self.status[:] = array('b', status)
+        self.failures[:] = array('l', failures)
+        self.current[:] = array('l', current)
+        for i, node in enumerate(self.nodes):
+            if self.kind[i] == LEAF:
+                node.status = STATUSES[self.status[i]]
+            elif self.kind[i] == OPAQUE and self.status[i] == INVALID and node.status != Status.INVALID:
+                node.stop(Status.INVALID)
+
+    def write_back(self) -> None:
+        """
+        Copies the runtime state (statuses, retry counters, current children) back into the
+        py_trees nodes, e.g. to render them with py_trees.display.
+        """
+        for i, node in enumerate(self.nodes):
+            kind = self.kind[i]
+            if kind == OPAQUE:
+                continue
+            node.status = STATUSES[self.status[i]]
+            if kind == RETRY:
+                node.failures = self.failures[i]
+            elif kind in (SEQUENCE, SELECTOR, PARALLEL):
+                slot = self.current[i]
+                node.current_child = node.children[slot] if slot >= 0 else None
+
+    def _tick(self, i) -> None:
+        kind = self.kind[i]
+        if kind == LEAF:
+            self._tick_leaf(i)
+        elif kind == SEQUENCE:
+            self._tick_sequence(i)
+        elif kind == SELECTOR:
+            self._tick_selector(i)
+        elif kind == PARALLEL:
+            self._tick_parallel(i)
+        elif kind == OPAQUE:
+            node = self.nodes[i]
+            for _ in node.tick():
+                pass
+            self.status[i] = _STATUS_CODES[node.status]
+        else:
+            self._tick_decorator(i, kind)
+
+    def _tick_leaf(self, i) -> None:
+        node = self.nodes[i]
+        if self.status[i] != RUNNING:
+            node.initialise()
+        new_status = node.update()
+        code = _STATUS_CODES.get(new_status)
+        if code is None:
+            node.logger.error(f"A behaviour returned an invalid status, setting to INVALID [{new_status}][{node.name}]")
+            code = INVALID
+            new_status = Status.INVALID
+        if code != RUNNING:
+            node.terminate(new_status)
+        node.status = new_status
+        self.status[i] = code
+
+    def _tick_decorator(self, i, kind) -> None:
+        status = self.status
+        child = self.child_index[self.first_child[i]]
+        if status[i] != RUNNING and kind == RETRY:
+            self.failures[i] = 0
+        self._tick(child)
+
+        child_status = status[child]
+        if kind == RETRY:
+            if child_status == FAILURE:
+                self.failures[i] += 1
+                new_status = RUNNING if self.failures[i] < self.num_failures[i] else FAILURE
+            elif child_status == RUNNING:
+                new_status = RUNNING
+            else:
+                new_status = SUCCESS
+        elif kind == SUCCESS_IS_FAILURE:
+            new_status = FAILURE if child_status == SUCCESS else child_status
+        elif kind == FAILURE_IS_SUCCESS:
+            new_status = SUCCESS if child_status == FAILURE else child_status
+        else:  # INVERTER
+            if child_status == SUCCESS:
+                new_status = FAILURE
+            elif child_status == FAILURE:
+                new_status = SUCCESS
+            else:
+                new_status = child_status
+
+        if new_status != RUNNING:
+            self._stop(i, new_status)
+        status[i] = new_status
+
+    def _tick_sequence(self, i) -> None:
+        status = self.status
+        first = self.first_child[i]
+        count = self.num_children[i]
+        child_index = self.child_index
+        memory = self.memory[i]
+
+        slot = 0
+        if status[i] != RUNNING:
+            self.current[i] = 0 if count else -1
+            for k in range(first, first + count):
+                if status[child_index[k]] != INVALID:
+                    self._stop(child_index[k], INVALID)
+        elif memory:
+            slot = self.current[i]
+        else:
+            self.current[i] = 0 if count else -1
+
+        if not count:
+            self.current[i] = -1
+            self._stop(i, SUCCESS)
+            return
+
+        while slot < count:
+            child = child_index[first + slot]
+            self._tick(child)
+            if status[child] != SUCCESS:
+                status[i] = status[child]
+                if not memory:
+                    for k in range(first + slot + 1, first + count):
+                        if status[child_index[k]] != INVALID:
+                            self._stop(child_index[k], INVALID)
+                return
+            if slot + 1 < count:
+                self.current[i] = slot + 1
+            slot += 1
+        self._stop(i, SUCCESS)
+
+    def _tick_selector(self, i) -> None:
+        status = self.status
+        first = self.first_child[i]
+        count = self.num_children[i]
+        child_index = self.child_index
+
+        if status[i] != RUNNING:
+            self.current[i] = 0 if count else -1
+
+        if not count:
+            self.current[i] = -1
+            self._stop(i, FAILURE)
+            return
+
+        slot = 0
+        if self.memory[i]:
+            slot = self.current[i]
+            for k in range(first, first + slot):
+                self._stop(child_index[k], INVALID)
+
+        previous = self.current[i]
+        while slot < count:
+            child = child_index[first + slot]
+            self._tick(child)
+            child_status = status[child]
+            if child_status == RUNNING or child_status == SUCCESS:
+                self.current[i] = slot
+                status[i] = child_status
+                if previous != slot:
+                    for k in range(first + slot + 1, first + count):
+                        if status[child_index[k]] != INVALID:
+                            self._stop(child_index[k], INVALID)
+                return
+            slot += 1
+        status[i] = FAILURE
+        self.current[i] = count - 1
+
+    def _tick_parallel(self, i) -> None:
+        status = self.status
+        first = self.first_child[i]
+        count = self.num_children[i]
+        child_index = self.child_index
+
+        if status[i] != RUNNING:
+            for k in range(first, first + count):
+                if status[child_index[k]] != INVALID:
+                    self._stop(child_index[k], INVALID)
+            self.current[i] = -1
+
+        if not count:
+            self.current[i] = -1
+            self._stop(i, SUCCESS)
+            return
+
+        synchronise = self.synchronise[i]
+        for k in range(first, first + count):
+            child = child_index[k]
+            if synchronise and status[child] == SUCCESS:
+                continue
+            self._tick(child)
+
+        new_status = RUNNING
+        self.current[i] = count - 1
+        for slot in range(count):
+            if status[child_index[first + slot]] == FAILURE:
+                self.current[i] = slot
+                new_status = FAILURE
+                break
+        else:
+            policy = self.policy[i]
+            if policy == _SUCCESS_ON_ALL:
+                if all(status[child_index[k]] == SUCCESS for k in range(first, first + count)):
+                    new_status = SUCCESS
+            elif policy == _SUCCESS_ON_ONE:
+                for slot in range(count - 1, -1, -1):
+                    if status[child_index[first + slot]] == SUCCESS:
+                        new_status = SUCCESS
+                        self.current[i] = slot
+                        break
+            else:
+                selected = self._selected[i]
+                if all(status[child] == SUCCESS for child in selected):
+                    new_status = SUCCESS
+                    self.current[i] = child_index.index(selected[-1], first, first + count) - first
+        if new_status != RUNNING:
+            self._stop(i, new_status)
+        status[i] = new_status
+
+    def _stop(self, i, new_status) -> None:
+        status = self.status
+        kind = self.kind[i]
+        if kind == LEAF:
+            node = self.nodes[i]
+            node.terminate(STATUSES[new_status])
+            node.status = STATUSES[new_status]
+        elif kind == OPAQUE:
+            node = self.nodes[i]
+            node.stop(STATUSES[new_status])
+            new_status = _STATUS_CODES[node.status]
+        elif kind in (SEQUENCE, SELECTOR, PARALLEL):
+            first = self.first_child[i]
+            count = self.num_children[i]
+            child_index = self.child_index
+            if kind == PARALLEL:
+                for k in range(first, first + count):
+                    if status[child_index[k]] == RUNNING:
+                        self._stop(child_index[k], INVALID)
+            if new_status == INVALID:
+                self.current[i] = -1
+                for k in range(first, first + count):
+                    if status[child_index[k]] != INVALID:
+                        self._stop(child_index[k], INVALID)
+        else:
+            child = self.child_index[self.first_child[i]]
+            if new_status == INVALID:
+                self._stop(child, INVALID)
+            if status[child] == RUNNING:
+                self._stop(child, INVALID)
+        status[i] = new_status
+
+
+def compile_tree(root: py_trees.behaviour.Behaviour) -> CompiledTree:
+    """
+    Lowers a py_trees tree into a flat CompiledTree.
+
+    Args:
+        root (py_trees.behaviour.Behaviour): root of the tree, as created by e.g. create_pickup_tree
+
+    Returns:
+        CompiledTree: the compiled tree, ready to be set up and ticked.
+    """
+    return CompiledTree(root)
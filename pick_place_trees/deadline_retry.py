@@ -0,0 +1,92 @@
+import time
+
+import py_trees
+from py_trees.common import Status
+from py_trees.decorators import Retry
+
+# Deadlines reached up to this many seconds early count as reached, against the rounding of the clock
+_EPSILON = 1e-9
+
+
+class DeadlineRetry(Retry):
+    """
+    A Retry that also gives up when its time is up.
+
+    Like Retry, the child is ticked again after a failure, up to num_failures failures. In addition,
+    every run of the retry has a deadline, `deadline` seconds after it started: a failure after the
+    deadline is final, and a child that is still running at the deadline is stopped and the retry
+    fails. Before every tick, the per-call deadlines of the behaviours in the child subtree that make
+    device calls (those with a `timeout` attribute, e.g. DetectObject) are capped at the time left,
+    so a slow device call times out at the deadline at the latest instead of overrunning it. With
+    nested deadline retries, the innermost one sets the timeouts.
+
+    DeadlineRetry is not compiled by compile_tree(), it is ticked through py_trees as an opaque node.
+
+        retry = DeadlineRetry(name="Retry Detect Object", child=DetectObject(object_detector=detector, timeout=0.1),
+                              num_failures=10, deadline=0.5)
+    """
+    def __init__(self, name: str, child: py_trees.behaviour.Behaviour, num_failures: int, deadline: float,
+                 clock=time.perf_counter):
+        """
+        Args:
+            name (str): the decorator name
+            child (py_trees.behaviour.Behaviour): the child behaviour or subtree
+            num_failures (int): maximum number of permitted failures
+            deadline (float): seconds from the start of a run until the retry gives up
+            clock (callable): returns the current time in seconds, the clock of the devices, e.g. a SimulatedClock
+        """
+        super(DeadlineRetry, self).__init__(name=name, child=child, num_failures=num_failures)
+        self.deadline = deadline
+        self.expires_at = None
+        self.expired = 0  # runs that failed because of the deadline
+        self._clock = clock
+        # the per-call deadlines of the device behaviours of the child subtree, as configured
+        self._timeouts = {node: node.timeout for node in child.iterate() if hasattr(node, "timeout")}
+
+    def initialise(self) -> None:
+        super(DeadlineRetry, self).initialise()
+        self.expires_at = self._clock() + self.deadline
+
+    def tick(self):
+        """
+        Ticks the child like Retry.tick(), unless the deadline has passed, with the device call
+        deadlines capped at the time left.
+        """
+        if self.status != Status.RUNNING:
+            self.initialise()
+        remaining = self.expires_at - self._clock()
+        if remaining <= _EPSILON:
+            self._expire()
+            self.stop(Status.FAILURE)
+            yield self
+            return
+        for node, timeout in self._timeouts.items():
+            node.timeout = remaining if timeout is None else min(timeout, remaining)
+
+        for node in self.decorated.tick():
+            yield node
+        new_status = self.update()
+        if new_status != Status.RUNNING:
+            self.stop(new_status)
+        self.status = new_status
+        yield self
+
+    def update(self) -> Status:
+        """
+        Retries like Retry.update(), but a failure after the deadline is final.
+        """
+        status = super(DeadlineRetry, self).update()
+        if (status == Status.RUNNING and self.decorated.status == Status.FAILURE
+                and self.expires_at - self._clock() <= _EPSILON):
+            self._expire()
+            return Status.FAILURE
+        return status
+
+    def terminate(self, new_status: Status) -> None:
+        for node, timeout in self._timeouts.items():
+            node.timeout = timeout
+
+    def _expire(self) -> None:
+        self.expired += 1
+        self.feedback_message = (f"deadline of {self.deadline:.3f} s expired "
+                                 f"[status: {self.failures} failure from {self.num_failures}]")
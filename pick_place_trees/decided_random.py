@@ -0,0 +1,28 @@
+class Draw:
+    """A random number whose comparison `draw < probability` is decided by a DecidedRandom."""
+    __slots__ = ("_source",)
+
+    def __init__(self, source):
+        self._source = source
+
+    def __lt__(self, probability):
+        return self._source.decide(probability)
+
+
+class DecidedRandom:
+    """
+    Base of the replacements for the random module that decide the outcome of every random event.
+
+    The mocks draw events as `rng.random() < probability`. Here random() returns a Draw, and its
+    comparison calls decide(probability), which subclasses implement to return the outcome of the event,
+    e.g. from a script (markov_analysis.BranchingRandom, scenario_fuzzer.ScriptedRandom) or with a
+    biased probability (rare_event.TiltedRandom).
+    """
+    __slots__ = ()
+
+    def random(self) -> Draw:
+        return Draw(self)
+
+    def decide(self, probability) -> bool:
+        """Returns whether the event with the given probability occurs."""
+        raise NotImplementedError
@@ -0,0 +1,191 @@
+import heapq
+import math
+import random
+import time
+
+# The device calls that can be given a latency and a deadline, by method name
+DEVICE_CALLS = ("detect_object", "detect_force", "move_to_position")
+
+
+class DeviceTimeout(TimeoutError):
+    """A device call did not respond within its deadline."""
+
+
+class WallClock:
+    """
+    Real time, for devices that block the calling thread: reading it returns time.perf_counter(),
+    sleep() blocks, and can be woken up early by an event.
+    """
+    def __call__(self) -> float:
+        return time.perf_counter()
+
+    def sleep(self, seconds: float, event=None) -> bool:
+        """
+        Sleeps for seconds, or until event is set.
+
+        Args:
+            seconds (float): time to sleep
+            event (threading.Event): wakes the sleep up early when set, e.g. MockManipulator's stop event
+
+        Returns:
+            bool: whether the sleep was woken up by the event
+        """
+        if event is None:
+            time.sleep(seconds)
+            return False
+        return event.wait(seconds)
+
+
+class SimulatedClock:
+    """
+    Virtual time, for running many episodes with slow devices in no time: reading it returns the
+    current virtual time, and sleep() advances it instantly. Callbacks scheduled with call_at() run
+    when a sleep passes their time, e.g. to request an abort in the middle of a device call, which
+    wakes up sleeps on the event it sets at that virtual time.
+
+    Unlike trace_export.VirtualClock, reading the clock does not advance it. Only for a single thread.
+    """
+    def __init__(self, start=0.0):
+        self.now = start
+        self._timers = []  # heap of (time, sequence number, callback)
+        self._scheduled = 0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def call_at(self, when: float, callback) -> None:
+        """Runs callback() when the virtual time reaches when, during a sleep."""
+        heapq.heappush(self._timers, (when, self._scheduled, callback))
+        self._scheduled += 1
+
+    def cancel_timers(self) -> None:
+        """Drops the callbacks that have not run yet."""
+        self._timers.clear()
+
+    def sleep(self, seconds: float, event=None) -> bool:
+        """
+        Advances the time by seconds, running the callbacks that are due on the way.
+
+        Args:
+            seconds (float): time to sleep
+            event (threading.Event): stops the sleep at the time it is set by a callback
+
+        Returns:
+            bool: whether the sleep was woken up by the event
+        """
+        if event is not None and event.is_set():
+            return True
+        end = self.now + seconds
+        while self._timers and self._timers[0][0] <= end:
+            when, _, callback = heapq.heappop(self._timers)
+            self.now = max(self.now, when)
+            callback()
+            if event is not None and event.is_set():
+                return True
+        self.now = end
+        return False
+
+
+class LatencyModel:
+    """
+    Response time of a device call: a fixed base latency, a random jitter and rare stalls.
+
+    The jitter is drawn from a distribution with mean `jitter`: "uniform" (between 0 and twice the
+    mean), "exponential" or "lognormal" (with a long tail, sigma 1). With stall_probability, a call
+    additionally stalls for `stall` seconds, e.g. a detector dropping a frame. The mean latency is
+    base + jitter + stall_probability * stall.
+
+        detector = MockObjectDetector(world_state, latency=LatencyModel(0.03, 0.01, "lognormal"))
+    """
+    DISTRIBUTIONS = ("uniform", "exponential", "lognormal")
+
+    def __init__(self, base=0.0, jitter=0.0, distribution="uniform", stall_probability=0.0, stall=0.0, rng=None):
+        """
+        Args:
+            base (float): minimum latency in seconds
+            jitter (float): mean of the random part of the latency in seconds
+            distribution (str): distribution of the jitter, one of DISTRIBUTIONS
+            stall_probability (float): probability [0..1] that a call stalls
+            stall (float): additional latency of a stalled call in seconds
+            rng (random.Random): source of randomness, the random module is used if None. Give the
+                latencies their own generator to keep the outcomes of the device calls unchanged.
+        """
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}'")
+        self.base = base
+        self.jitter = jitter
+        self.distribution = distribution
+        self.stall_probability = stall_probability
+        self.stall = stall
+        self._rng = rng if rng is not None else random
+
+    @property
+    def mean(self) -> float:
+        return self.base + self.jitter + self.stall_probability * self.stall
+
+    def sample(self) -> float:
+        """Draws the latency of a call in seconds."""
+        latency = self.base
+        if self.jitter > 0:
+            if self.distribution == "uniform":
+                latency += self._rng.uniform(0.0, 2 * self.jitter)
+            elif self.distribution == "exponential":
+                latency += self._rng.expovariate(1 / self.jitter)
+            else:  # lognormal with mean jitter
+                latency += self._rng.lognormvariate(math.log(self.jitter) - 0.5, 1.0)
+        if self.stall_probability > 0 and self._rng.random() < self.stall_probability:
+            latency += self.stall
+        return latency
+
+    def scaled(self, factor: float, rng=None) -> "LatencyModel":
+        """Returns the same distribution with all durations multiplied by factor."""
+        return LatencyModel(self.base * factor, self.jitter * factor, self.distribution, self.stall_probability,
+                            self.stall * factor, rng=rng if rng is not None else self._rng)
+
+    def __repr__(self):
+        return (f"LatencyModel({self.base}, {self.jitter}, '{self.distribution}', "
+                f"{self.stall_probability}, {self.stall})")
+
+
+# Latencies of the device calls: detections with a long tail and the odd dropped frame, fast force
+# readings, and moves of a few hundred milliseconds
+DEFAULT_LATENCIES = {
+    "detect_object": LatencyModel(0.03, 0.02, "lognormal", stall_probability=0.02, stall=0.5),
+    "detect_force": LatencyModel(0.002, 0.001, "exponential"),
+    "move_to_position": LatencyModel(0.2, 0.1, "uniform"),
+}
+
+
+def wait_for_response(duration: float, clock, timeout=None, cancel=None) -> bool:
+    """
+    Blocks a device call until its response arrives, duration seconds after the call, or until its
+    deadline. A call that is not answered within timeout seconds is given up: it raises DeviceTimeout
+    after waiting for timeout seconds.
+
+    Args:
+        duration (float): latency of the call in seconds
+        clock (WallClock or SimulatedClock): the clock to wait on
+        timeout (float): deadline of the call in seconds after the call, None to wait for the response
+        cancel (threading.Event): cancels the call when set, e.g. MockManipulator's stop event
+
+    Returns:
+        bool: whether the call was cancelled
+    """
+    if timeout is not None and duration > timeout:
+        if clock.sleep(timeout, cancel):
+            return True
+        raise DeviceTimeout(f"no response within {timeout * 1000:.1f} ms")
+    return duration > 0 and clock.sleep(duration, cancel)
+
+
+def call_device(method, *args, timeout=None):
+    """
+    Calls a device method with a deadline. The timeout is only passed if there is one, so that devices
+    without deadlines can still be used without one.
+
+    Raises:
+        DeviceTimeout: the device did not respond within timeout seconds
+    """
+    if timeout is None:
+        return method(*args)
+    return method(*args, timeout=timeout)
@@ -0,0 +1,522 @@
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+
+from .device_latency import DEVICE_CALLS, DeviceTimeout, call_device
+from .mock_manipulator import MockManipulator, MockManipulatorState
+from .mock_object_detector import MockObjectDetector
+from .mock_force_feedback_sensor import MockForceFeedbackSensor
+from .world_state import WorldState
+
+# Protocol: every message is a header followed by a payload of payload_size bytes.
+#   request header:  request id, device, method, payload size, deadline in seconds (or NO_DEADLINE)
+#   response header: request id, status (OK, ERROR or TIMEOUT), payload size
+# Requests on a connection may be pipelined, they are answered in order. The deadline applies to the
+# DEVICE_CALLS, which the server calls with it as timeout.
+REQUEST_HEADER = struct.Struct("<IBBHd")
+RESPONSE_HEADER = struct.Struct("<IBH")
+OK = 0
+ERROR = 1
+TIMEOUT = 2
+NO_DEADLINE = -1.0
+
+# Devices
+MANIPULATOR = 0
+OBJECT_DETECTOR = 1
+FORCE_SENSOR = 2
+
+
+class _NoneCodec:
+    size = 0
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return b""
+
+    @staticmethod
+    def decode(data):
+        return None
+
+
+class _BoolCodec:
+    size = 1
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return b"\x01" if value else b"\x00"
+
+    @staticmethod
+    def decode(data) -> bool:
+        return data[0] != 0
+
+
+class _PositionCodec:
+    """An optional position: x, y, z, valid"""
+    _struct = struct.Struct("<3d?")
+    size = _struct.size
+
+    @classmethod
+    def encode(cls, position) -> bytes:
+        if position is None:
+            return cls._struct.pack(0.0, 0.0, 0.0, False)
+        return cls._struct.pack(*position, True)
+
+    @classmethod
+    def decode(cls, data):
+        x, y, z, valid = cls._struct.unpack(data)
+        return (x, y, z) if valid else None
+
+
+class _StateCodec:
+    """The manipulator state: end effector position (x, y, z, valid), gripper closed"""
+    _struct = struct.Struct("<3d??")
+    size = _struct.size
+
+    @classmethod
+    def encode(cls, state) -> bytes:
+        position, gripper_closed = state
+        if position is None:
+            return cls._struct.pack(0.0, 0.0, 0.0, False, gripper_closed)
+        return cls._struct.pack(*position, True, gripper_closed)
+
+    @classmethod
+    def decode(cls, data):
+        x, y, z, valid, gripper_closed = cls._struct.unpack(data)
+        return ((x, y, z) if valid else None), gripper_closed
+
+
+# (device, method name) -> (method code, argument codec, result codec)
+METHODS = {
+    (MANIPULATOR, "move_to_position"): (0, _PositionCodec, _BoolCodec),
+    (MANIPULATOR, "grasp"): (1, _NoneCodec, _BoolCodec),
+    (MANIPULATOR, "release"): (2, _NoneCodec, _BoolCodec),
+    (MANIPULATOR, "stop"): (3, _NoneCodec, _BoolCodec),
+    (MANIPULATOR, "resume"): (4, _NoneCodec, _NoneCodec),
+    (MANIPULATOR, "state"): (5, _NoneCodec, _StateCodec),
+    (OBJECT_DETECTOR, "detect_object"): (0, _NoneCodec, _PositionCodec),
+    (FORCE_SENSOR, "detect_force"): (0, _NoneCodec, _BoolCodec),
+}
+_METHOD_NAMES = {(device, code): name for (device, name), (code, _, _) in METHODS.items()}
+# Not serialized with the other calls, so that stopping cancels a move in progress
+_THREAD_SAFE_METHODS = {(MANIPULATOR, "stop")}
+
+
+class DeviceError(RuntimeError):
+    """A request failed on the device server."""
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        data += chunk
+    return bytes(data)
+
+
+class _ManipulatorService:
+    """The manipulator as served: the mock's commands plus a query of its state"""
+    def __init__(self, manipulator: MockManipulator):
+        self._manipulator = manipulator
+
+    def __getattr__(self, name):
+        return getattr(self._manipulator, name)
+
+    def state(self):
+        return self._manipulator.endeffector_position, self._manipulator.gripper_closed
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        if self.request.family in (socket.AF_INET, socket.AF_INET6):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        connection = self.request
+        server = self.server
+        while True:
+            try:
+                request_id, device, method, payload_size, deadline = REQUEST_HEADER.unpack(
+                    _receive_exactly(connection, REQUEST_HEADER.size))
+                payload = _receive_exactly(connection, payload_size)
+            except ConnectionError:
+                return
+            status, result = OK, b""
+            try:
+                name = _METHOD_NAMES[(device, method)]
+                _, argument_codec, result_codec = METHODS[(device, name)]
+                arguments = () if argument_codec is _NoneCodec else (argument_codec.decode(payload),)
+                function = getattr(server.devices[device], name)
+                timeout = deadline if deadline >= 0 and name in DEVICE_CALLS else None
+                if (device, name) in _THREAD_SAFE_METHODS:
+                    value = function(*arguments)
+                else:
+                    with server.device_lock:
+                        value = call_device(function, *arguments, timeout=timeout)
+                result = result_codec.encode(value)
+            except DeviceTimeout as e:
+                status, result = TIMEOUT, str(e).encode()[:0xffff]
+            except Exception as e:
+                status, result = ERROR, repr(e).encode()[:0xffff]
+            connection.sendall(RESPONSE_HEADER.pack(request_id, status, len(result)) + result)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class DeviceServer:
+    """
+    Serves a manipulator, an object detector and a force feedback sensor over a local socket, as a
+    stand-in for the network connection to real controllers. Every connection is handled by its own
+    thread, device calls are serialized as the mocks share the world state (except for stopping
+    the manipulator, which cancels a move in progress).
+
+        server = DeviceServer(manipulator, object_detector, force_sensor)
+        server.start()
+        client = DeviceClient(server.address)
+    """
+    def __init__(self, manipulator, object_detector, force_sensor, address=("127.0.0.1", 0)):
+        """
+        Args:
+            manipulator (MockManipulator): the manipulator to serve
+            object_detector (MockObjectDetector): the object detector to serve
+            force_sensor (MockForceFeedbackSensor): the force feedback sensor to serve
+            address: (host, port) to listen on with TCP (port 0 picks a free port), or the path of a unix socket
+        """
+        server_type = _UnixServer if isinstance(address, str) else _TCPServer
+        self._server = server_type(address, _RequestHandler)
+        self._server.devices = {
+            MANIPULATOR: _ManipulatorService(manipulator),
+            OBJECT_DETECTOR: object_detector,
+            FORCE_SENSOR: force_sensor,
+        }
+        self._server.device_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        """The address the server listens on, to connect clients to"""
+        return self._server.server_address
+
+    def start(self) -> None:
+        """Serves requests in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        """Serves requests in the calling thread until shutdown()."""
+        self._server.serve_forever()
+
+    def shutdown(self) -> None:
+        """Stops serving and closes the listening socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        if isinstance(self.address, str):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+class DeviceClient:
+    """
+    Client of a DeviceServer with a pool of connections, pipelined requests and timeouts.
+
+    call() borrows a connection from the pool for a single request, so that callers in different
+    threads do not wait for each other. pipeline() sends several requests before waiting for the
+    first response, paying the round trip only once.
+    """
+    def __init__(self, address, pool_size=2, timeout=1.0):
+        """
+        Args:
+            address: (host, port) of a TCP server, or the path of a unix socket
+            pool_size (int): maximum number of idle connections that are kept open
+            timeout (float): seconds to wait for a response (beyond the deadline of the call, if any)
+                before raising DeviceTimeout
+        """
+        self._address = address
+        self._timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _connect(self) -> socket.socket:
+        if isinstance(self._address, str):
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection.settimeout(self._timeout)
+        connection.connect(self._address)
+        self.connections_opened += 1
+        return connection
+
+    def _acquire(self) -> socket.socket:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, connection: socket.socket) -> None:
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _request_ids(self, count: int) -> range:
+        with self._id_lock:
+            first = self._next_id
+            self._next_id = (self._next_id + count) % 2 ** 32
+        return range(first, first + count)
+
+    def call(self, device: int, method: str, *arguments, timeout=None):
+        """
+        Calls a method of a device on the server.
+
+        Args:
+            device (int): MANIPULATOR, OBJECT_DETECTOR or FORCE_SENSOR
+            method (str): the method name, see METHODS
+            arguments: the method's arguments
+            timeout (float): deadline of the call in seconds, applied by the server to the DEVICE_CALLS
+                (a timed-out move halts the arm), and waited for in addition to the client's timeout
+
+        Returns:
+            the result of the method
+        """
+        return self.pipeline([(device, method, *arguments)], timeout=timeout)[0]
+
+    def pipeline(self, calls, timeout=None) -> list:
+        """
+        Sends all calls on one connection before reading the responses.
+
+        Args:
+            calls (list[tuple]): (device, method, *arguments) of every call
+            timeout (float): deadline of every call in seconds, see call()
+
+        Returns:
+            list: the result of every call, in order
+        """
+        request_ids = self._request_ids(len(calls))
+        deadline = timeout if timeout is not None else NO_DEADLINE
+        codecs = []
+        message = bytearray()
+        for request_id, (device, method, *arguments) in zip(request_ids, calls):
+            code, argument_codec, result_codec = METHODS[(device, method)]
+            payload = argument_codec.encode(*arguments) if arguments else b""
+            message += REQUEST_HEADER.pack(request_id & 0xffffffff, device, code, len(payload), deadline) + payload
+            codecs.append(result_codec)
+
+        connection = self._acquire()
+        try:
+            if timeout is not None:
+                connection.settimeout(timeout + self._timeout)
+            connection.sendall(message)
+            results = []
+            for request_id, result_codec in zip(request_ids, codecs):
+                response_id, status, payload_size = RESPONSE_HEADER.unpack(
+                    _receive_exactly(connection, RESPONSE_HEADER.size))
+                payload = _receive_exactly(connection, payload_size)
+                if response_id != request_id & 0xffffffff:
+                    raise ConnectionError(f"Response {response_id} does not match request {request_id}")
+                if status == OK:
+                    results.append(result_codec.decode(payload))
+                elif status == TIMEOUT:
+                    results.append(DeviceTimeout(payload.decode(errors="replace")))
+                else:
+                    results.append(DeviceError(payload.decode(errors="replace")))
+        except socket.timeout as e:
+            # responses may still arrive on this connection, so it cannot be reused
+            connection.close()
+            raise DeviceTimeout(f"No response from the device server within {connection.gettimeout()} s") from e
+        except BaseException:
+            connection.close()
+            raise
+        if timeout is not None:
+            connection.settimeout(self._timeout)
+        self._release(connection)
+        for result in results:
+            if isinstance(result, (DeviceError, DeviceTimeout)):
+                raise result
+        return results
+
+    def close(self) -> None:
+        """Closes all idle connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def manipulator(self, grasp_offset_z=0.1) -> "NetworkManipulator":
+        """Returns an adapter of the served manipulator."""
+        return NetworkManipulator(self, grasp_offset_z)
+
+    def object_detector(self) -> "NetworkObjectDetector":
+        """Returns an adapter of the served object detector."""
+        return NetworkObjectDetector(self)
+
+    def force_sensor(self) -> "NetworkForceFeedbackSensor":
+        """Returns an adapter of the served force feedback sensor."""
+        return NetworkForceFeedbackSensor(self)
+
+
+class NetworkManipulator:
+    """The MockManipulator interface, served by a DeviceServer."""
+    def __init__(self, client: DeviceClient, grasp_offset_z=0.1):
+        """
+        Args:
+            client (DeviceClient): client of the server
+            grasp_offset_z (float): the grasp offset of the manipulator, see MockManipulatorState
+        """
+        self._client = client
+        self._geometry = MockManipulatorState(name="MyManipulator", grasp_offset_z=grasp_offset_z)
+
+    @property
+    def name(self):
+        return "MyMockManipulator"
+
+    def state(self) -> tuple:
+        """Returns the end effector position and whether the gripper is closed, in a single request"""
+        return self._client.call(MANIPULATOR, "state")
+
+    @property
+    def gripper_closed(self):
+        """Returns whether the gripper is closed"""
+        return self.state()[1]
+
+    @property
+    def endeffector_position(self):
+        """See MockManipulator.endeffector_position"""
+        return self.state()[0]
+
+    def get_grasp_position_for(self, object_position: tuple[float, float, float]) -> tuple[float, float, float]:
+        """See MockManipulator.get_grasp_position_for()"""
+        return self._geometry.get_grasp_position_for(object_position)
+
+    def is_object_within_grasp_offset(self, object_position: tuple[float, float, float]) -> bool:
+        """See MockManipulator.is_object_within_grasp_offset()"""
+        self._geometry.endeffector_position = self.endeffector_position
+        return self._geometry.is_object_within_grasp_offset(object_position)
+
+    def move_to_position(self, target_position: tuple[float, float, float], timeout=None) -> bool:
+        """See MockManipulator.move_to_position(), the deadline is applied on the server"""
+        return self._client.call(MANIPULATOR, "move_to_position", target_position, timeout=timeout)
+
+    def grasp(self) -> bool:
+        """See MockManipulator.grasp()"""
+        return self._client.call(MANIPULATOR, "grasp")
+
+    def release(self) -> bool:
+        """See MockManipulator.release()"""
+        return self._client.call(MANIPULATOR, "release")
+
+    def stop(self) -> bool:
+        """See MockManipulator.stop(), does not wait for a command in progress on another connection"""
+        return self._client.call(MANIPULATOR, "stop")
+
+    def resume(self) -> None:
+        """See MockManipulator.resume()"""
+        self._client.call(MANIPULATOR, "resume")
+
+
+class NetworkObjectDetector:
+    """The MockObjectDetector interface, served by a DeviceServer."""
+    def __init__(self, client: DeviceClient):
+        self._client = client
+
+    def detect_object(self, timeout=None):
+        """See MockObjectDetector.detect_object(), the deadline is applied on the server"""
+        return self._client.call(OBJECT_DETECTOR, "detect_object", timeout=timeout)
+
+
+class NetworkForceFeedbackSensor:
+    """The MockForceFeedbackSensor interface, served by a DeviceServer."""
+    def __init__(self, client: DeviceClient):
+        self._client = client
+
+    def detect_force(self, timeout=None) -> bool:
+        """See MockForceFeedbackSensor.detect_force(), the deadline is applied on the server"""
+        return self._client.call(FORCE_SENSOR, "detect_force", timeout=timeout)
+
+
+def create_mock_server(object_detect_success=0.8, move_success=0.9, grasp_success=0.9, slip_probability=0.3,
+                       force_detect_success=0.9, address=("127.0.0.1", 0), rng=None) -> DeviceServer:
+    """
+    Creates the mocks and the world like run_behavior_tree.main(), and a server for them.
+
+    Args:
+        object_detect_success(float): probability [0..1] that object detection succeeds
+        move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+        grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+        slip_probability(float): probability [0..1] that object slips from the gripper
+        force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+        address: see DeviceServer
+        rng (random.Random): source of randomness shared by all mocks, the random module is used if None.
+    """
+    manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+    world_state = WorldState(manipulator_state=manipulator_state, object_slip_probability=slip_probability,
+                             object_position=(1, 2, 3), rng=rng)
+    manipulator = MockManipulator(state=manipulator_state, world_state=world_state,
+                                  grasp_success_rate=grasp_success, move_success_rate=move_success, rng=rng)
+    object_detector = MockObjectDetector(world_state=world_state, detection_success=object_detect_success, rng=rng)
+    force_sensor = MockForceFeedbackSensor(manipulator_state=manipulator_state, world_state=world_state,
+                                           detection_success=force_detect_success, rng=rng)
+    return DeviceServer(manipulator, object_detector, force_sensor, address=address)
+
+
+def parse_address(address: str):
+    """Parses "host:port" into a TCP address, anything else is taken as the path of a unix socket."""
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the mock devices over a local socket.")
+    parser.add_argument('--address', default="127.0.0.1:5555", help="host:port or path of a unix socket")
+    parser.add_argument('--object-detect', type=float, default=0.8,
+                        help="Object detection success probability, [0.0..1.0]")
+    parser.add_argument('--move', type=float, default=0.9,
+                        help="Manipulator moving success probability, [0.0..1.0]")
+    parser.add_argument('--grasp', type=float, default=0.9,
+                        help="Manipulator grasp success probability, [0.0..1.0]")
+    parser.add_argument('--slip', type=float, default=0.3,
+                        help="Probability for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--force-detect', type=float, default=0.9,
+                        help="Force-feedback detection success probability, [0.0..1.0]")
+    args = parser.parse_args(argv)
+
+    server = create_mock_server(
+        object_detect_success=args.object_detect, move_success=args.move, grasp_success=args.grasp,
+        slip_probability=args.slip, force_detect_success=args.force_detect, address=parse_address(args.address))
+    print(f"Serving mock devices on {server.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
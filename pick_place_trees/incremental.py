@@ -0,0 +1,217 @@
+import argparse
+import functools
+import random
+import time
+
+from py_trees.blackboard import Blackboard
+
+from .behavior_tree import create_pickup_tree
+from .compiled_tree import LEAF, OPAQUE, PARALLEL, SELECTOR, SEQUENCE, STATUSES, CompiledTree, compile_tree
+from .simulation import PickupSimulation, quiet
+
+_MISSING = object()  # value of keys that are not on the blackboard
+
+
+class KeyVersions:
+    """
+    Version numbers of blackboard keys, bumped whenever the value of a key is observed to have
+    changed since its previous observation.
+
+    Writes are not intercepted, the values are compared (with ==) when a version is asked for. This
+    also catches values restored directly in Blackboard.storage, e.g. by PickupSimulation.set_state(),
+    and a key that is rewritten with an equal value keeps its version. Values that are mutated in
+    place are not detected, they have to be replaced.
+    """
+    def __init__(self):
+        self._values = {}  # key -> value at the last observation
+        self._versions = {}
+
+    def version(self, key: str) -> int:
+        """Returns the version of a key, 0 until it is first seen on the blackboard."""
+        value = Blackboard.storage.get(key, _MISSING)
+        previous = self._values.get(key, _MISSING)
+        if value is not previous and value != previous:
+            self._values[key] = value
+            self._versions[key] = self._versions.get(key, 0) + 1
+        return self._versions.get(key, 0)
+
+
+class _Memo:
+    """Cached evaluations of a pure subtree, occupying the nodes start..end-1 of the compiled tree."""
+    def __init__(self, start, end, leaves, inputs, outputs):
+        self.start = start
+        self.end = end
+        self.leaves = leaves
+        self.inputs = inputs
+        self.outputs = outputs
+        self.input_versions = None  # the versions of the inputs of the cached evaluations
+        # state of the subtree before a tick -> (versions of the outputs, state of the subtree) after it
+        self.evaluations = {}
+
+
+class IncrementalTree(CompiledTree):
+    """
+    A compiled tree that skips pure subtrees while their blackboard inputs are unchanged.
+
+    A leaf is pure if its class sets ``pure = True``: its status and its blackboard writes only depend
+    on the keys it registered for reading (and its constructor arguments), and it has no other side
+    effects, e.g. ManipulatorCalculatePosition. Compiled composites and decorators whose children are
+    all pure are pure as well. A tick of a pure subtree is then determined by the values of its input
+    keys and the runtime state of the subtree before the tick (statuses, current children and retry
+    counters, which e.g. decide whether a retry is RUNNING, or which stale statuses a selector keeps).
+    The largest pure subtrees are memoized: after a tick, the state of the subtree is cached under its
+    state before the tick, together with the versions of the input keys and of the output keys. A
+    later tick with the same input versions and state restores the cached state instead of ticking the
+    subtree, if the output keys still have their versions, i.e. the blackboard already holds what the
+    subtree would write. The cache of a subtree is dropped when one of its inputs changes.
+
+    Skipping is invisible to the rest of the tree: the statuses, the blackboard and the calls of the
+    impure leaves are the same as with CompiledTree, tick by tick. Pure leaves are not initialised,
+    updated or terminated while they are skipped, and do not log.
+
+        tree = compile_incremental(root)
+        tree.setup(15)
+        ...
+        print(f"{tree.skips} pure subtree evaluations skipped ({tree.nodes_skipped} nodes)")
+    """
+    def __init__(self, root):
+        """
+        Compiles a tree and finds its pure subtrees.
+
+        Args:
+            root (py_trees.behaviour.Behaviour): root of the tree, as created by e.g. create_pickup_tree
+        """
+        super().__init__(root)
+        self.versions = KeyVersions()
+        self.evaluations = 0  # ticks of pure subtrees that were evaluated
+        self.skips = 0  # ticks of pure subtrees that were served from the cache
+        self.nodes_skipped = 0  # nodes in the skipped subtrees
+        self._memos = [None] * len(self.nodes)  # memo of the pure subtree starting at a node
+        pure = [False] * len(self.nodes)
+        ends = [0] * len(self.nodes)
+        self._find_pure(0, pure, ends)
+        self._add_memos(0, pure, ends)
+
+    def _children(self, i) -> list:
+        first = self.first_child[i]
+        return list(self.child_index[first:first + self.num_children[i]])
+
+    def _find_pure(self, i, pure, ends) -> None:
+        """Fills in whether the subtree of every node is pure and where it ends, in pre-order."""
+        kind = self.kind[i]
+        ends[i] = i + 1
+        if kind == LEAF:
+            pure[i] = bool(getattr(self.nodes[i], "pure", False))
+        elif kind != OPAQUE:
+            children = self._children(i)
+            for child in children:
+                self._find_pure(child, pure, ends)
+            pure[i] = all(pure[child] for child in children)
+            if children:
+                ends[i] = ends[children[-1]]
+
+    def _add_memos(self, i, pure, ends) -> None:
+        if not pure[i]:
+            for child in self._children(i):
+                self._add_memos(child, pure, ends)
+            return
+        leaves = [j for j in range(i, ends[i]) if self.kind[j] == LEAF]
+        inputs = set()
+        outputs = set()
+        for j in leaves:
+            for client in getattr(self.nodes[j], "blackboards", []):
+                inputs.update(client.remappings[key] for key in client.read)
+                outputs.update(client.remappings[key] for key in client.write | client.exclusive)
+        self._memos[i] = _Memo(i, ends[i], leaves, tuple(sorted(inputs)), tuple(sorted(outputs)))
+
+    @property
+    def pure_subtrees(self) -> list:
+        """The roots of the memoized subtrees."""
+        return [self.nodes[memo.start] for memo in self._memos if memo is not None]
+
+    def _tick(self, i) -> None:
+        # the dispatch of CompiledTree._tick(), inlined as it runs for every node
+        memo = self._memos[i]
+        if memo is not None:
+            self._tick_pure(memo)
+            return
+        kind = self.kind[i]
+        if kind == LEAF:
+            self._tick_leaf(i)
+        elif kind == SEQUENCE:
+            self._tick_sequence(i)
+        elif kind == SELECTOR:
+            self._tick_selector(i)
+        elif kind == PARALLEL:
+            self._tick_parallel(i)
+        else:
+            CompiledTree._tick(self, i)
+
+    def _tick_pure(self, memo) -> None:
+        i = memo.start
+        end = memo.end
+        version = self.versions.version
+        input_versions = tuple(version(key) for key in memo.inputs)
+        if input_versions != memo.input_versions:
+            memo.input_versions = input_versions
+            memo.evaluations.clear()
+        if end == i + 1:
+            state = self.status[i]  # the whole state of a leaf
+        else:
+            state = (self.status[i:end].tobytes(), self.current[i:end].tobytes(), self.failures[i:end].tobytes())
+        evaluation = memo.evaluations.get(state)
+        if evaluation is not None and evaluation[0] == tuple(version(key) for key in memo.outputs):
+            _, status, current, failures = evaluation
+            self.status[i:end] = status
+            self.current[i:end] = current
+            self.failures[i:end] = failures
+            for j in memo.leaves:
+                self.nodes[j].status = STATUSES[status[j - i]]
+            self.skips += 1
+            self.nodes_skipped += end - i
+            return
+
+        CompiledTree._tick(self, i)
+        self.evaluations += 1
+        memo.evaluations[state] = (tuple(version(key) for key in memo.outputs),
+                                   self.status[i:end], self.current[i:end], self.failures[i:end])
+
+
+def compile_incremental(root) -> IncrementalTree:
+    """
+    Lowers a py_trees tree into an IncrementalTree, see compile_tree().
+
+    Args:
+        root (py_trees.behaviour.Behaviour): root of the tree, as created by e.g. create_pickup_tree
+
+    Returns:
+        IncrementalTree: the compiled tree, ready to be set up and ticked.
+    """
+    return IncrementalTree(root)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare full and incremental evaluation of the pickup tree over many episodes.")
+    parser.add_argument('--episodes', type=int, default=10000, help="Number of episodes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the mocks")
+    args = parser.parse_args(argv)
+
+    for name, compiler in (("full", compile_tree), ("incremental", compile_incremental)):
+        simulation = PickupSimulation(rng=random.Random(args.seed), compiler=compiler,
+                                      tree_factory=functools.partial(create_pickup_tree, namespace=f"/{name}"))
+        began = time.perf_counter()
+        with quiet():
+            outcomes = [simulation.run_episode() for _ in range(args.episodes)]
+        elapsed = time.perf_counter() - began
+        ticks = sum(ticks for _, ticks in outcomes)
+        successes = sum(success for success, _ in outcomes)
+        print(f"{name}: {successes}/{args.episodes} succeeded, {ticks} ticks in {elapsed:.2f} s "
+              f"({ticks / elapsed:.0f} ticks/s)")
+    tree = simulation.tree
+    print(f"pure subtrees: {', '.join(node.name for node in tree.pure_subtrees)}")
+    print(f"{tree.evaluations} evaluations, {tree.skips} skipped ({tree.nodes_skipped} nodes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import random
+import threading
+
+import py_trees
+from py_trees.common import Status
+
+from .abort import AbortController, LatencyHistogram
+from .behavior_tree import create_pickup_tree
+from .deadline_retry import DeadlineRetry
+from .device_latency import DEFAULT_LATENCIES, DEVICE_CALLS, SimulatedClock
+from .mock_force_feedback_sensor import MockForceFeedbackSensor
+from .mock_manipulator import MockManipulator, MockManipulatorState
+from .mock_object_detector import MockObjectDetector
+from .parameter_sweep import parse_range
+from .simulation import quiet
+from .world_state import WorldState
+
+class LatencyPoint:
+    """Statistics of the episodes and aborts at one latency scale, in constant memory."""
+    def __init__(self, scale: float, latencies: dict):
+        self.scale = scale
+        self.latencies = latencies  # the latency models at this scale, by device call
+        self.episodes = 0
+        self.successes = 0
+        self.ticks = 0
+        self.overruns = 0  # ticks that took longer than the tick period
+        self.elapsed = 0.0  # time of all episodes
+        self.timeouts = 0  # device calls that timed out
+        self.expired = 0  # deadline retries that ran out of time
+        self.cycle_time = LatencyHistogram()  # duration of an episode
+        self.abort_latency = LatencyHistogram()  # from an abort request until the safe state
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.episodes if self.episodes else float("nan")
+
+    @property
+    def tick_rate(self) -> float:
+        """Ticks per second."""
+        return self.ticks / self.elapsed if self.elapsed else float("nan")
+
+    @property
+    def overrun_rate(self) -> float:
+        return self.overruns / self.ticks if self.ticks else float("nan")
+
+    def row(self) -> str:
+        means = "/".join(f"{self.latencies[call].mean * 1000:.0f}" for call in DEVICE_CALLS)
+        return (f"{self.scale:5.2f}  {means:>20}  {self.success_rate:7.1%}  {self.cycle_time.mean:8.2f} s  "
+                f"{self.cycle_time.quantile(0.99):7.2f} s  {self.tick_rate:7.1f}  {self.overrun_rate:8.1%}  "
+                f"{self.timeouts / max(self.episodes, 1):11.2f}  {self.abort_latency.quantile(0.5) * 1000:12.1f}  "
+                f"{self.abort_latency.quantile(0.99) * 1000:6.1f}  {self.abort_latency.max * 1000:6.1f}")
+
+    HEADER = ("scale  detect/force/move ms  success  cycle mean  cycle p99  ticks/s  overruns  timeouts/ep  "
+              "abort p50 ms  p99 ms  max ms")
+
+    def __str__(self):
+        return (f"scale {self.scale}: {self.successes}/{self.episodes} succeeded, cycle time {self.cycle_time.mean:.2f} s "
+                f"(p99 {self.cycle_time.quantile(0.99):.2f} s), {self.tick_rate:.1f} ticks/s, "
+                f"{self.overrun_rate:.1%} overruns, {self.timeouts} timeouts, {self.expired} expired retries, "
+                f"abort latency {self.abort_latency}")
+
+
+class _Cell:
+    """The mocks and the tree of one latency scale, on a simulated clock."""
+    def __init__(self, sweep, latencies):
+        self.clock = SimulatedClock()
+        rng = random.Random(sweep.seed)
+        self.manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+        self.world_state = WorldState(manipulator_state=self.manipulator_state,
+                                      object_slip_probability=sweep.slip_probability,
+                                      object_position=sweep.pickup_position, rng=rng)
+        self.manipulator = MockManipulator(state=self.manipulator_state, world_state=self.world_state,
+                                           grasp_success_rate=sweep.grasp_success, move_success_rate=sweep.move_success,
+                                           rng=rng, latency=latencies["move_to_position"], clock=self.clock)
+        object_detector = MockObjectDetector(world_state=self.world_state, detection_success=sweep.object_detect_success,
+                                             rng=rng, latency=latencies["detect_object"], clock=self.clock)
+        force_sensor = MockForceFeedbackSensor(manipulator_state=self.manipulator_state, world_state=self.world_state,
+                                               detection_success=sweep.force_detect_success, rng=rng,
+                                               latency=latencies["detect_force"], clock=self.clock)
+        self.root = create_pickup_tree(self.manipulator, object_detector, force_sensor, timeouts=sweep.timeouts,
+                                       retry_deadline=sweep.retry_deadline, clock=self.clock)
+        self.tree = py_trees.trees.BehaviourTree(self.root)
+        self.tree.setup(15)
+        self.abort = AbortController(self.manipulator, clock=self.clock)
+        self.wake = threading.Event()  # wakes up the wait between ticks on an abort
+
+    def counters(self) -> tuple[int, int]:
+        """The timeouts of the device behaviours and the expired deadline retries so far."""
+        nodes = list(self.root.iterate())
+        return (sum(getattr(node, "timeouts", 0) for node in nodes),
+                sum(node.expired for node in nodes if isinstance(node, DeadlineRetry)))
+
+    def request_abort(self) -> None:
+        self.abort.request("latency sweep")
+        self.wake.set()
+
+    def reset(self, pickup_position) -> None:
+        """Ends an episode: clears the abort, opens the gripper and puts the object back."""
+        self.clock.cancel_timers()
+        if self.root.status == Status.RUNNING:
+            self.root.stop(Status.INVALID)
+        self.abort.reset()
+        self.wake.clear()
+        self.manipulator_state.gripper_closed = False
+        self.manipulator_state.endeffector_position = None
+        self.world_state.update_holding_object()
+        self.world_state.object_position = pickup_position
+
+
+class LatencySweep:
+    """
+    Shows how the pickup task degrades as the latency of the devices grows.
+
+    For every latency scale, the latencies of all device calls are multiplied by the scale, and the
+    pickup tree is run on a simulated clock (device_latency.SimulatedClock), so that hours of slow
+    devices take seconds. The tree is ticked through py_trees and an AbortController in a fixed-rate
+    loop: a tick starts every tick_period seconds, or right after the previous one if that took longer
+    (an overrun). Every episode starts with the object at the pickup position and ends when the root
+    succeeds or fails. The episodes give the tick rate, the overruns, the cycle time and the device
+    calls that timed out. Then, aborts are requested at random times in further episodes, uniformly
+    within the mean cycle time: a move in progress is cancelled right away, but a pending detection or
+    force reading has to be waited for, until its per-call deadline at the latest.
+
+        sweep = LatencySweep(timeouts={"detect_object": 0.1, "detect_force": 0.01, "move_to_position": 0.5})
+        for point in sweep.run([0.5, 1, 2, 4], episodes=500, aborts=200):
+            print(point.row())
+
+    The mocks of every scale draw the same outcomes from the same seed. The latencies have their own
+    random number generators, one per device.
+    """
+    def __init__(self, latencies=None, timeouts=None, retry_deadline=None, tick_period=0.1,
+                 object_detect_success=0.8, move_success=0.9, grasp_success=0.9, slip_probability=0.3,
+                 force_detect_success=0.9, seed=0, pickup_position=(1, 2, 3), max_ticks=10000):
+        """
+        Args:
+            latencies (dict[str, LatencyModel]): latencies at scale 1 by device call, DEFAULT_LATENCIES if None
+            timeouts (dict[str, float]): per-call deadlines by device call, see create_pickup_tree()
+            retry_deadline (float): deadline of the retries of the device behaviours, see create_pickup_tree()
+            tick_period (float): seconds between the starts of two ticks
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            seed (int): seed of the device outcomes, the latencies and the abort times
+            pickup_position (tuple[float, float, float]): where the object is put for every episode
+            max_ticks (int): limit of the ticks per episode (counted as failure)
+        """
+        self.latencies = latencies if latencies is not None else DEFAULT_LATENCIES
+        self.timeouts = timeouts
+        self.retry_deadline = retry_deadline
+        self.tick_period = tick_period
+        self.object_detect_success = object_detect_success
+        self.move_success = move_success
+        self.grasp_success = grasp_success
+        self.slip_probability = slip_probability
+        self.force_detect_success = force_detect_success
+        self.seed = seed
+        self.pickup_position = pickup_position
+        self.max_ticks = max_ticks
+
+    def _run_episode(self, cell, point, abort_at=None) -> tuple[bool, float]:
+        """
+        Ticks the tree until it succeeds or fails, or is aborted.
+
+        Returns:
+            tuple[bool, float]: whether the task succeeded, and how long the episode took.
+        """
+        clock = cell.clock
+        started = clock()
+        if abort_at is not None:
+            clock.call_at(started + abort_at, cell.request_abort)
+        success = False
+        for _ in range(self.max_ticks):
+            tick_started = clock()
+            if not cell.abort.tick(cell.tree):
+                cell.abort.abort(cell.tree)
+                break
+            point.ticks += 1
+            duration = clock() - tick_started
+            if duration > self.tick_period:
+                point.overruns += 1
+            finished = cell.root.status != Status.RUNNING
+            # the next tick, also the first one of the next episode, starts a tick period after this one
+            if clock.sleep(max(self.tick_period - duration, 0.0), None if finished else cell.wake):
+                cell.abort.abort(cell.tree)
+                break
+            if finished:
+                success = cell.root.status == Status.SUCCESS
+                break
+        elapsed = clock() - started
+        cell.reset(self.pickup_position)
+        return success, elapsed
+
+    def run_point(self, scale: float, episodes: int, aborts=0) -> LatencyPoint:
+        """
+        Runs the episodes and the aborts of one latency scale.
+
+        Args:
+            scale (float): factor of the latencies
+            episodes (int): number of episodes
+            aborts (int): number of aborted episodes
+
+        Returns:
+            LatencyPoint: the statistics of the scale.
+        """
+        seeds = random.Random(self.seed)
+        latencies = {call: self.latencies[call].scaled(scale, rng=random.Random(seeds.getrandbits(64)))
+                     for call in DEVICE_CALLS}
+        abort_times = random.Random(seeds.getrandbits(64))
+        point = LatencyPoint(scale, latencies)
+        with quiet():
+            cell = _Cell(self, latencies)
+            for _ in range(episodes):
+                success, elapsed = self._run_episode(cell, point)
+                point.episodes += 1
+                point.successes += success
+                point.elapsed += elapsed
+                point.cycle_time.record(elapsed)
+            point.timeouts, point.expired = cell.counters()
+            window = point.cycle_time.mean if episodes else 1.0
+            for _ in range(aborts):
+                self._run_episode(cell, LatencyPoint(scale, latencies), abort_at=abort_times.uniform(0.0, window))
+        point.abort_latency = cell.abort.latencies
+        return point
+
+    def run(self, scales, episodes: int, aborts=0, progress=None) -> list:
+        """
+        Runs the episodes and aborts of every latency scale.
+
+        Args:
+            scales (list[float]): factors of the latencies
+            episodes (int): number of episodes per scale
+            aborts (int): number of aborted episodes per scale
+            progress (callable): called with every LatencyPoint
+
+        Returns:
+            list[LatencyPoint]: the statistics of every scale.
+        """
+        points = []
+        for scale in scales:
+            points.append(self.run_point(scale, episodes, aborts))
+            if progress is not None:
+                progress(points[-1])
+        return points
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Show how tick rate, cycle time and abort latency degrade as the device latency grows.")
+    parser.add_argument('--scales', type=parse_range, default=[0.0, 0.5, 1.0, 2.0, 4.0],
+                        help="Factors of the device latencies, e.g. '0,1,2' or '0:4:5'")
+    parser.add_argument('--episodes', type=int, default=500, help="Episodes per scale")
+    parser.add_argument('--aborts', type=int, default=200, help="Aborted episodes per scale")
+    parser.add_argument('--tick-period', type=float, default=0.1, help="Seconds between the starts of two ticks")
+    parser.add_argument('--detect-timeout', type=float, help="Deadline of an object detection in seconds")
+    parser.add_argument('--force-timeout', type=float, help="Deadline of a force reading in seconds")
+    parser.add_argument('--move-timeout', type=float, help="Deadline of a move in seconds")
+    parser.add_argument('--retry-deadline', type=float,
+                        help="Deadline of the retries of the device behaviours in seconds")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the device outcomes, latencies and aborts")
+    args = parser.parse_args(argv)
+
+    timeouts = {call: timeout for call, timeout in zip(
+        DEVICE_CALLS, (args.detect_timeout, args.force_timeout, args.move_timeout)) if timeout is not None}
+    sweep = LatencySweep(timeouts=timeouts, retry_deadline=args.retry_deadline, tick_period=args.tick_period,
+                         seed=args.seed)
+    print(LatencyPoint.HEADER)
+    sweep.run(args.scales, args.episodes, args.aborts, progress=lambda point: print(point.row()))
+
+
+if __name__ == '__main__':
+    main()
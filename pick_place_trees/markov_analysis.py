@@ -0,0 +1,373 @@
+import argparse
+
+import numpy as np
+import py_trees
+
+from .behavior_tree import create_pickup_tree
+from .compiled_tree import (FAILURE, INVALID, LEAF, OPAQUE, PARALLEL, RETRY, RUNNING, SELECTOR, SEQUENCE,
+                            STATUSES, SUCCESS)
+from .decided_random import DecidedRandom
+from .simulation import PickupSimulation, quiet
+
+SUCCESS_OUTCOME = "SUCCESS"
+
+
+def outcome_name(tree) -> str:
+    """
+    The outcome of a finished episode of a compiled tree: SUCCESS, or the failure of a child of the
+    root, e.g. "FAILURE (Place sequence)".
+    """
+    status = tree.status[0]
+    if status == SUCCESS:
+        return SUCCESS_OUTCOME
+    slot = tree.current[0]
+    if tree.kind[0] in (SEQUENCE, SELECTOR, PARALLEL) and slot >= 0:
+        child = tree.nodes[tree.child_index[tree.first_child[0] + slot]]
+        return f"{STATUSES[status].value} ({child.name})"
+    return STATUSES[status].value
+
+
+class BranchingRandom(DecidedRandom):
+    """
+    A replacement for the random module that lets the caller choose the outcome of every random event.
+
+    The mocks draw events as `rng.random() < probability`. Here the outcome of every draw is taken from
+    a script (and True once the script is exhausted), and recorded together with the probability of the
+    event. Replaying a tick with all scripts enumerates all outcomes of the tick, see MarkovChain.
+    """
+    def __init__(self):
+        self.script = []
+        self.path = []
+
+    def begin(self, script) -> None:
+        """Starts a new sequence of draws, with the outcomes given by script."""
+        self.script = script
+        self.path = []
+
+    def decide(self, probability) -> bool:
+        index = len(self.path)
+        outcome = self.script[index] if index < len(self.script) else True
+        self.path.append((outcome, probability))
+        return outcome
+
+    def probability(self) -> float:
+        """The probability of the outcomes drawn since begin()."""
+        probability = 1.0
+        for outcome, event_probability in self.path:
+            probability *= event_probability if outcome else 1.0 - event_probability
+        return probability
+
+    def next_script(self):
+        """The script enumerating the next outcomes after the current path, None if all were enumerated."""
+        path = list(self.path)
+        while path and not path[-1][0]:
+            path.pop()
+        if not path:
+            return None
+        return [outcome for outcome, _ in path[:-1]] + [False]
+
+
+def _has_side_effect_free_leaves(tree) -> bool:
+    """Whether no leaf overrides initialise() or terminate(), which allows to lump idle node statuses."""
+    behaviour = py_trees.behaviour.Behaviour
+    return all(
+        type(node).initialise is behaviour.initialise and type(node).terminate is behaviour.terminate
+        for i, node in enumerate(tree.nodes) if tree.kind[i] == LEAF)
+
+
+def _lump_idle_state(tree) -> None:
+    """
+    Canonicalises the runtime state of nodes that cannot influence the next ticks.
+
+    A status other than RUNNING only decides whether a node gets stopped (which calls terminate()) and,
+    for children of a running synchronised parallel, whether the child is skipped. Retry counters and
+    current children are re-initialised when their node is not RUNNING, and only the current child of
+    running memory composites and memoryless selectors (for stopping lower priorities) is ever read.
+    Lumping these makes states that only differ in stale bookkeeping the same Markov state.
+    """
+    status = tree.status
+    kind = tree.kind
+    keep = bytearray(len(status))
+    for i in range(len(status)):
+        if kind[i] == PARALLEL and status[i] == RUNNING and tree.synchronise[i]:
+            first = tree.first_child[i]
+            for k in range(first, first + tree.num_children[i]):
+                keep[tree.child_index[k]] = 1
+    for i in range(len(status)):
+        running = status[i] == RUNNING
+        if not running and not keep[i] and i != 0:
+            status[i] = INVALID
+        if kind[i] == RETRY and not running:
+            tree.failures[i] = 0
+        elif kind[i] in (SEQUENCE, SELECTOR, PARALLEL):
+            keep_current = running and (tree.memory[i] or kind[i] == SELECTOR)
+            if not keep_current:
+                tree.current[i] = -1
+
+
+class MarkovChain:
+    """
+    The absorbing Markov chain of a simulated episode: the tick-to-tick transitions of the tree,
+    world, manipulator and blackboard state, until the root of the tree succeeds or fails.
+
+    Transient states are numbered, 0 being the initial state. Absorbing states are the outcomes of an
+    episode: SUCCESS, or the failure of a child of the root (e.g. "FAILURE (Place sequence)").
+    """
+    def __init__(self, simulation: PickupSimulation, rng: BranchingRandom, max_states=1000000):
+        """
+        Builds the chain by enumerating all outcomes of all ticks from all reachable states.
+
+        Args:
+            simulation (PickupSimulation): simulation whose mocks use rng as the source of randomness
+            rng (BranchingRandom): the random source of the simulation
+            max_states (int): maximum number of transient states before giving up
+
+        Raises:
+            ValueError: if the tree contains opaque nodes, whose state cannot be captured
+            RuntimeError: if the chain has more than max_states transient states
+        """
+        tree = simulation.tree
+        if OPAQUE in tree.kind:
+            raise ValueError("the tree contains nodes that can not be compiled, their state can not be analysed")
+        lump = _has_side_effect_free_leaves(tree)
+
+        simulation.reset()
+        if lump:
+            _lump_idle_state(tree)
+        self.states = [simulation.get_state()]
+        index = {self.states[0]: 0}
+        self.outcomes = []
+        outcome_index = {}
+        sources, targets, probabilities = [], [], []
+        absorbed_sources, absorbed_outcomes, absorbed_probabilities = [], [], []
+
+        with quiet():
+            state_number = 0
+            while state_number < len(self.states):
+                state = self.states[state_number]
+                script = []
+                while script is not None:
+                    simulation.set_state(state)
+                    rng.begin(script)
+                    tree.tick()
+                    probability = rng.probability()
+                    if probability > 0.0:
+                        root_status = tree.status[0]
+                        if root_status == SUCCESS or root_status == FAILURE:
+                            outcome = outcome_name(tree)
+                            if outcome not in outcome_index:
+                                outcome_index[outcome] = len(self.outcomes)
+                                self.outcomes.append(outcome)
+                            absorbed_sources.append(state_number)
+                            absorbed_outcomes.append(outcome_index[outcome])
+                            absorbed_probabilities.append(probability)
+                        else:
+                            if lump:
+                                _lump_idle_state(tree)
+                            next_state = simulation.get_state()
+                            next_number = index.get(next_state)
+                            if next_number is None:
+                                if len(self.states) >= max_states:
+                                    raise RuntimeError(f"the chain has more than {max_states} transient states")
+                                next_number = index[next_state] = len(self.states)
+                                self.states.append(next_state)
+                            sources.append(state_number)
+                            targets.append(next_number)
+                            probabilities.append(probability)
+                    script = rng.next_script()
+                state_number += 1
+        simulation.reset()
+
+        self.num_states = len(self.states)
+        self.sources = np.array(sources, dtype=np.int64)
+        self.targets = np.array(targets, dtype=np.int64)
+        self.probabilities = np.array(probabilities)
+        self.absorbed_sources = np.array(absorbed_sources, dtype=np.int64)
+        self.absorbed_outcomes = np.array(absorbed_outcomes, dtype=np.int64)
+        self.absorbed_probabilities = np.array(absorbed_probabilities)
+        self._absorption = None
+
+    def _strongly_connected_components(self) -> list:
+        """Returns the strongly connected components of the transient states, sinks first (Tarjan)."""
+        order = np.argsort(self.sources, kind="stable")
+        targets = self.targets[order]
+        starts = np.searchsorted(self.sources[order], np.arange(self.num_states + 1))
+
+        index = [-1] * self.num_states
+        low = [0] * self.num_states
+        on_stack = [False] * self.num_states
+        stack = []
+        components = []
+        counter = 0
+        for root in range(self.num_states):
+            if index[root] >= 0:
+                continue
+            work = [(root, starts[root])]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            while work:
+                node, edge = work[-1]
+                if edge < starts[node + 1]:
+                    work[-1] = (node, edge + 1)
+                    successor = targets[edge]
+                    if index[successor] < 0:
+                        index[successor] = low[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack[successor] = True
+                        work.append((successor, starts[successor]))
+                    elif on_stack[successor]:
+                        low[node] = min(low[node], index[successor])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+        return components
+
+    def _solve(self) -> np.ndarray:
+        """
+        Solves (I - Q) X = [1, R] for the expected number of ticks (column 0) and the absorption
+        probabilities of all outcomes (column 1 + outcome index), one strongly connected component
+        at a time, in reverse topological order.
+        """
+        if self._absorption is not None:
+            return self._absorption
+        num_columns = 1 + len(self.outcomes)
+        rhs = np.zeros((self.num_states, num_columns))
+        rhs[:, 0] = 1.0
+        np.add.at(rhs, (self.absorbed_sources, 1 + self.absorbed_outcomes), self.absorbed_probabilities)
+
+        order = np.argsort(self.sources, kind="stable")
+        sources = self.sources[order]
+        targets = self.targets[order]
+        probabilities = self.probabilities[order]
+        starts = np.searchsorted(sources, np.arange(self.num_states + 1))
+
+        solution = np.zeros((self.num_states, num_columns))
+        position = np.full(self.num_states, -1)
+        for component in self._strongly_connected_components():
+            members = np.array(component)
+            position[members] = np.arange(len(members))
+            edges = np.concatenate([np.arange(starts[m], starts[m + 1]) for m in members])
+            edge_sources = position[sources[edges]]
+            edge_targets = targets[edges]
+            inside = position[edge_targets] >= 0
+            # transitions leaving the component go to states that are already solved
+            b = rhs[members].copy()
+            np.add.at(b, edge_sources[~inside],
+                      probabilities[edges][~inside, None] * solution[edge_targets[~inside]])
+            a = np.eye(len(members))
+            np.add.at(a, (edge_sources[inside], position[edge_targets[inside]]), -probabilities[edges][inside])
+            solution[members] = np.linalg.solve(a, b)
+            position[members] = -1
+        self._absorption = solution
+        return solution
+
+    def outcome_probabilities(self) -> dict:
+        """The probability of every outcome of an episode started in the initial state."""
+        solution = self._solve()
+        return {outcome: solution[0, 1 + i] for i, outcome in enumerate(self.outcomes)}
+
+    def success_probability(self) -> float:
+        """The probability that an episode succeeds."""
+        return self.outcome_probabilities().get(SUCCESS_OUTCOME, 0.0)
+
+    def expected_ticks(self) -> float:
+        """The expected number of ticks of an episode."""
+        return self._solve()[0, 0]
+
+    def tick_distribution(self, tolerance=1e-12, max_ticks=100000) -> dict:
+        """
+        The distribution of the number of ticks of an episode, per outcome.
+
+        Args:
+            tolerance (float): stop once the probability of a longer episode is below this
+            max_ticks (int): maximum number of ticks to compute the distribution for
+
+        Returns:
+            dict[str, np.ndarray]: for every outcome, the probability that the episode ends with this
+                outcome after t + 1 ticks, at index t.
+        """
+        distribution = []
+        state = np.zeros(self.num_states)
+        state[0] = 1.0
+        for _ in range(max_ticks):
+            absorbed = np.bincount(self.absorbed_outcomes,
+                                   weights=state[self.absorbed_sources] * self.absorbed_probabilities,
+                                   minlength=len(self.outcomes))
+            distribution.append(absorbed)
+            state = np.bincount(self.targets, weights=state[self.sources] * self.probabilities,
+                                minlength=self.num_states)
+            if state.sum() < tolerance:
+                break
+        distribution = np.array(distribution).reshape(-1, len(self.outcomes))
+        return {outcome: distribution[:, i] for i, outcome in enumerate(self.outcomes)}
+
+
+def analyse_pickup(object_detect_success=0.8, move_success=0.9, grasp_success=0.9, slip_probability=0.3,
+                   force_detect_success=0.9, tree_factory=create_pickup_tree, max_states=1000000) -> MarkovChain:
+    """
+    Builds the Markov chain of the pickup task with the probabilities of run_behavior_tree.main().
+
+    Args:
+        object_detect_success(float): probability [0..1] that object detection succeeds
+        move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+        grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+        slip_probability(float): probability [0..1] that object slips from the gripper
+        force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+        tree_factory (callable): creates the tree from (manipulator, object_detector, force_sensor)
+        max_states (int): maximum number of transient states before giving up
+
+    Returns:
+        MarkovChain: the chain, see MarkovChain.success_probability(), expected_ticks() and tick_distribution().
+    """
+    rng = BranchingRandom()
+    simulation = PickupSimulation(
+        object_detect_success=object_detect_success,
+        move_success=move_success,
+        grasp_success=grasp_success,
+        slip_probability=slip_probability,
+        force_detect_success=force_detect_success,
+        rng=rng,
+        tree_factory=tree_factory)
+    return MarkovChain(simulation, rng, max_states=max_states)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compute success probability and ticks of the pickup task exactly.")
+    parser.add_argument('--object-detect', type=float, default=0.8,
+                        help="Object detection success probability, [0.0..1.0]")
+    parser.add_argument('--move', type=float, default=0.9,
+                        help="Manipulator moving success probability, [0.0..1.0]")
+    parser.add_argument('--grasp', type=float, default=0.9,
+                        help="Manipulator grasp success probability, [0.0..1.0]")
+    parser.add_argument('--slip', type=float, default=0.3,
+                        help="Probability for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--force-detect', type=float, default=0.9,
+                        help="Force-feedback detection success probability, [0.0..1.0]")
+    args = parser.parse_args()
+
+    chain = analyse_pickup(object_detect_success=args.object_detect,
+                           move_success=args.move,
+                           grasp_success=args.grasp,
+                           slip_probability=args.slip,
+                           force_detect_success=args.force_detect)
+    print(f"Transient states:    {chain.num_states}")
+    for outcome, probability in chain.outcome_probabilities().items():
+        print(f"P({outcome}): {probability:.6g}")
+    print(f"Expected ticks:      {chain.expected_ticks():.3f}")
+    ticks = sum(chain.tick_distribution().values())
+    print(f"Tick quantiles:      p50 {np.searchsorted(np.cumsum(ticks), 0.5) + 1}, "
+          f"p99 {np.searchsorted(np.cumsum(ticks), 0.99) + 1}")
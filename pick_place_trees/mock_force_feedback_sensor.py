@@ -1,7 +1,9 @@
 import random
 
+from .device_latency import WallClock, wait_for_response
+
 class MockForceFeedbackSensor:
-    def __init__(self, manipulator_state, world_state, detection_success=0.95):
+    def __init__(self, manipulator_state, world_state, detection_success=0.95, rng=None, latency=None, clock=None):
         """
         Initializes the mock force feedback sensor.
 
@@ -11,21 +13,35 @@ class MockForceFeedbackSensor:
             detection_success (float): The probability that the sensor accurately detects force.
                 NOTE: There are no false positives. When there is no force applied, detect_force will
                 never return True.
+            rng (random.Random): source of randomness, the random module is used if None.
+            latency (LatencyModel): time in seconds that a reading takes, instantaneous if None
+            clock (WallClock or SimulatedClock): the clock that readings wait on, real time if None
         """
         self._manipulator_state = manipulator_state
         self._world_state = world_state
         self._detection_success = detection_success
+        self._rng = rng if rng is not None else random
+        self._latency = latency
+        self._clock = clock if clock is not None else WallClock()
 
-    def detect_force(self):
+    def detect_force(self, timeout: float = None):
         """
         Simulates force detection based on the manipulator_state's gripper state and detection success rate.
                 
         NOTE in relation to the detection success rate: There are no false positives.
         When there is no force applied, this will never return True.
 
+        Args:
+            timeout (float): deadline of the reading in seconds, None to wait for the result.
+
         Returns:
             bool: True if force is detected (object is held), False otherwise.
+
+        Raises:
+            DeviceTimeout: the reading took longer than timeout.
         """
+        if self._latency is not None:
+            wait_for_response(self._latency.sample(), self._clock, timeout)
         if self._world_state.holding_object:
-            return random.random() < self._detection_success
+            return self._rng.random() < self._detection_success
         return False
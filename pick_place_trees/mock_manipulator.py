@@ -1,5 +1,8 @@
 import math
 import random
+import threading
+
+from .device_latency import DeviceTimeout, WallClock, wait_for_response
             
 class MockManipulatorState:
     """
@@ -59,7 +62,8 @@ class MockManipulatorState:
 
 
 class MockManipulator:
-    def __init__(self, state, world_state, grasp_success_rate=0.9, move_success_rate=0.95):
+    def __init__(self, state, world_state, grasp_success_rate=0.9, move_success_rate=0.95, rng=None,
+                 motion_duration=0.0, latency=None, clock=None):
         """
         Initialize the mock manipulator with success probabilities, name, and state.
 
@@ -69,6 +73,10 @@ class MockManipulator:
                 Will be ignored if None.
             grasp_success_rate (float): Probability that a grasp will succeed if the object is within range.
             move_success_rate (float): Probability that a move will succeed.
+            rng (random.Random): source of randomness, the random module is used if None.
+            motion_duration (float): time in seconds that a move blocks before it completes, can be cancelled by stop().
+            latency (LatencyModel): random time in seconds that a move blocks in addition to motion_duration
+            clock (WallClock or SimulatedClock): the clock that moves wait on, real time if None
             
             grasp_offset_z (float): The offset in the z-direction needed for a successful grasp.
         """
@@ -76,6 +84,13 @@ class MockManipulator:
         self._grasp_success_rate = grasp_success_rate
         self._move_success_rate = move_success_rate
         self._world_state = world_state
+        self._rng = rng if rng is not None else random
+        self._motion_duration = motion_duration
+        self._latency = latency
+        self._clock = clock if clock is not None else WallClock()
+        self._stopped = threading.Event()
+        # serialises the commands that change the manipulator and world state, so they can be sent from any thread
+        self._lock = threading.Lock()
 
     @property
     def name(self):
@@ -121,24 +136,46 @@ class MockManipulator:
         """
         return self._state.is_object_within_grasp_offset(object_position)
 
-    def move_to_position(self, target_position: tuple[float, float, float]) -> bool:
+    def move_to_position(self, target_position: tuple[float, float, float], timeout: float = None) -> bool:
         """
         Attempt to move to a specified 3D position.
 
         Args:
             target_position (tuple[float, float, float]): The target 3D position to move to.
+            timeout (float): deadline of the move in seconds, None to wait until it completes.
 
         Returns:
             bool: True if the move succeeded, False otherwise.
+
+        Raises:
+            DeviceTimeout: the move did not complete within timeout, it was halted.
         """
         if target_position is None:
             return False
+        if self._stopped.is_set():
+            return False
+        duration = self._motion_duration
+        if self._latency is not None:
+            duration += self._latency.sample()
+        try:
+            cancelled = wait_for_response(duration, self._clock, timeout, self._stopped)
+        except DeviceTimeout:
+            # Given up at the deadline, the end effector halted somewhere along the way
+            with self._lock:
+                self._state.endeffector_position = None
+            raise
+        if cancelled:
+            # Cancelled by stop() while moving, the end effector halted somewhere along the way
+            with self._lock:
+                self._state.endeffector_position = None
+            return False
 
-        success = random.random() < self._move_success_rate
-        if success:
-            self._state.endeffector_position = target_position
-        else:
-            self._state.endeffector_position = None  # Unknown position if move fails
+        with self._lock:
+            success = self._rng.random() < self._move_success_rate
+            if success:
+                self._state.endeffector_position = target_position
+            else:
+                self._state.endeffector_position = None  # Unknown position if move fails
         return success
 
     def grasp(self) -> bool:
@@ -155,15 +192,16 @@ class MockManipulator:
         Returns:
             bool: True if the grasp succeeded, False otherwise.
         """
-        if self._state.gripper_closed:
-            return True 
+        with self._lock:
+            if self._state.gripper_closed:
+                return True
 
-        success = random.random() < self._grasp_success_rate
-        if success:
-            self._state.gripper_closed = True
-            if self._world_state:
-                self._world_state.update_holding_object()
-        return success
+            success = self._rng.random() < self._grasp_success_rate
+            if success:
+                self._state.gripper_closed = True
+                if self._world_state:
+                    self._world_state.update_holding_object()
+            return success
 
     def release(self) -> bool:
         """
@@ -173,10 +211,32 @@ class MockManipulator:
             bool: True if the release succeeded, False otherwise.
         """
         # TODO: introduce release failure
-        if not self._state.gripper_closed:
+        with self._lock:
+            if not self._state.gripper_closed:
+                return True
+
+            self._state.gripper_closed = False
+            if self._world_state:
+                self._world_state.update_holding_object()
             return True
 
-        self._state.gripper_closed = False
-        if self._world_state:
-            self._world_state.update_holding_object()
+    @property
+    def stopped(self) -> bool:
+        """Returns whether the manipulator has been stopped, see stop()"""
+        return self._stopped.is_set()
+
+    def stop(self) -> bool:
+        """
+        Stops any motion: a move in progress is cancelled (and fails), and further moves fail until
+        resume() is called. The gripper can still be opened and closed.
+        Can be called from any thread.
+
+        Returns:
+            bool: True, the motion has stopped.
+        """
+        self._stopped.set()
         return True
+
+    def resume(self) -> None:
+        """Accepts moves again after stop()."""
+        self._stopped.clear()
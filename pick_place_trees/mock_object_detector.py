@@ -1,26 +1,41 @@
 import random
 
+from .device_latency import WallClock, wait_for_response
+
 class MockObjectDetector:
-    def __init__(self, world_state, detection_success=0.95):
+    def __init__(self, world_state, detection_success=0.95, rng=None, latency=None, clock=None):
         """
         Initializes the mock object detector.
 
         Args:
             world_state (WorldState): The world state containing object and manipulator information.
             detection_success (float): Probability that the detector successfully detects an object within FOV.
+            rng (random.Random): source of randomness, the random module is used if None.
+            latency (LatencyModel): time in seconds that a detection takes, instantaneous if None
+            clock (WallClock or SimulatedClock): the clock that detections wait on, real time if None
         """
         self._world_state = world_state
         self._detection_success = detection_success
+        self._rng = rng if rng is not None else random
+        self._latency = latency
+        self._clock = clock if clock is not None else WallClock()
 
-    def detect_object(self):
+    def detect_object(self, timeout: float = None):
         """
         Simulates object detection based on FOV and detection success rate.
 
+        Args:
+            timeout (float): deadline of the detection in seconds, None to wait for the result.
 
         Returns:
             tuple[float, float, float] or None: The 3D position of the detected object if successful, None otherwise.
+
+        Raises:
+            DeviceTimeout: the detection took longer than timeout.
         """
+        if self._latency is not None:
+            wait_for_response(self._latency.sample(), self._clock, timeout)
         # Check if the object is within FOV and simulate detection based on success rate 
-        if self._world_state.is_object_within_fov() and random.random() < self._detection_success:
+        if self._world_state.is_object_within_fov() and self._rng.random() < self._detection_success:
             return self._world_state.object_position
         return None
@@ -0,0 +1,161 @@
+import argparse
+import functools
+import random
+import sys
+import threading
+import time
+
+from py_trees.blackboard import Blackboard
+
+from .behavior_tree import create_pickup_tree
+from .simulation import PickupSimulation, quiet
+
+
+def gil_enabled() -> bool:
+    """Whether the interpreter runs with the GIL, always True before CPython 3.13."""
+    return getattr(sys, "_is_gil_enabled", lambda: True)()
+
+
+class MultiTreeReport:
+    """Outcomes of the episodes of all cells of a MultiTreeRunner.run()."""
+    def __init__(self, outcomes: list, wall_time: float, threads: int):
+        """
+        Args:
+            outcomes (list[list[tuple[bool, int]]]): per cell, the (success, ticks) of every episode
+            wall_time (float): seconds from the start of the first until the end of the last cell
+            threads (int): number of threads the cells ran in
+        """
+        self.outcomes = outcomes
+        self.wall_time = wall_time
+        self.threads = threads
+
+    @property
+    def episodes(self) -> int:
+        return sum(len(cell) for cell in self.outcomes)
+
+    @property
+    def successes(self) -> int:
+        return sum(success for cell in self.outcomes for success, _ in cell)
+
+    @property
+    def ticks(self) -> int:
+        return sum(ticks for cell in self.outcomes for _, ticks in cell)
+
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks / self.wall_time if self.wall_time else 0.0
+
+    def __str__(self):
+        return (f"{len(self.outcomes)} cells in {self.threads} threads: {self.successes}/{self.episodes} episodes "
+                f"succeeded, {self.ticks} ticks in {self.wall_time:.3f} s ({self.ticks_per_second:.0f} ticks/s)")
+
+
+class MultiTreeRunner:
+    """
+    Runs several independent pickup cells side by side, each one ticked by its own thread.
+
+    Every cell has its own mocks, world, random number generator and compiled tree, and the blackboard
+    keys of its tree live in the namespace "/cell_<n>", so the cells only share the py_trees blackboard
+    storage (a dict, which tolerates concurrent writes of different keys). The mocks and the world state
+    lock their own state, which makes them safe to share as well, but here nothing is shared.
+
+    The trees are created in the calling thread, because py_trees keeps global registries of the
+    blackboard clients. The blackboard activity stream, which create_pickup_tree() enables and which
+    is not thread-safe, is disabled. With fixed seeds, the outcomes of a cell do not depend on the number
+    of threads or on the other cells.
+
+    The threads only run in parallel on an interpreter without the GIL (free-threaded CPython 3.13+,
+    see gil_enabled()); with the GIL, the runner still works but the throughput does not scale.
+
+        runner = MultiTreeRunner(cells=4, seed=1)
+        print(runner.run(episodes=1000))
+    """
+    def __init__(self, cells: int, object_detect_success=0.8, move_success=0.9, grasp_success=0.9,
+                 slip_probability=0.3, force_detect_success=0.9, seed=0, tree_factory=create_pickup_tree):
+        """
+        Args:
+            cells (int): number of cells
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            seed (int): cell n draws from random.Random(seed + n)
+            tree_factory (callable): creates the tree from (manipulator, object_detector, force_sensor,
+                namespace=...), e.g. create_pickup_tree
+        """
+        self.simulations = [
+            PickupSimulation(
+                object_detect_success=object_detect_success,
+                move_success=move_success,
+                grasp_success=grasp_success,
+                slip_probability=slip_probability,
+                force_detect_success=force_detect_success,
+                rng=random.Random(seed + cell),
+                tree_factory=functools.partial(tree_factory, namespace=f"/cell_{cell}"))
+            for cell in range(cells)]
+        Blackboard.disable_activity_stream()
+
+    def run(self, episodes: int, threaded=True, max_ticks=None) -> MultiTreeReport:
+        """
+        Runs episodes in every cell, continuing with the random numbers where the previous run() stopped.
+
+        Args:
+            episodes (int): episodes per cell
+            threaded (bool): one thread per cell if True, otherwise the cells run one after the other
+                in the calling thread
+            max_ticks (int): limit of the ticks per episode, see PickupSimulation.run_episode()
+
+        Returns:
+            MultiTreeReport: the outcomes of the episodes.
+        """
+        outcomes = [[] for _ in self.simulations]
+        errors = []
+        start = threading.Barrier(len(self.simulations) + 1) if threaded else None
+
+        def run_cell(cell):
+            simulation = self.simulations[cell]
+            if start is not None:
+                start.wait()
+            try:
+                outcomes[cell] = [simulation.run_episode(max_ticks) for _ in range(episodes)]
+            except BaseException as error:  # re-raised in the calling thread
+                errors.append(error)
+
+        # quiet() replaces sys.stdout and the py_trees logging level for the whole process, it is only
+        # entered once here instead of in every thread
+        with quiet():
+            if threaded:
+                threads = [threading.Thread(target=run_cell, args=(cell,), name=f"cell_{cell}")
+                           for cell in range(len(self.simulations))]
+                for thread in threads:
+                    thread.start()
+                start.wait()
+                began = time.perf_counter()
+                for thread in threads:
+                    thread.join()
+            else:
+                began = time.perf_counter()
+                for cell in range(len(self.simulations)):
+                    run_cell(cell)
+            wall_time = time.perf_counter() - began
+        if errors:
+            raise errors[0]
+        return MultiTreeReport(outcomes, wall_time, len(self.simulations) if threaded else 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several pickup cells side by side, one thread each.")
+    parser.add_argument('--cells', type=int, default=4, help="Number of cells (and threads)")
+    parser.add_argument('--episodes', type=int, default=1000, help="Episodes per cell")
+    parser.add_argument('--sequential', action='store_true', help="Run the cells one after the other")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first cell")
+    args = parser.parse_args(argv)
+
+    runner = MultiTreeRunner(args.cells, seed=args.seed)
+    print(f"GIL enabled: {gil_enabled()}")
+    print(runner.run(args.episodes, threaded=not args.sequential))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import math
+import random
+import sqlite3
+
+from .behavior_tree import create_pickup_tree
+from .simulation import PickupSimulation, quiet
+
+# Swept parameters, in the order of PickupSimulation's arguments
+PARAMETERS = ("object_detect_success", "move_success", "grasp_success", "slip_probability", "force_detect_success")
+
+
+def parse_range(text: str) -> list:
+    """
+    Parses a parameter range given on the command line.
+
+    Args:
+        text (str): a single value ("0.9"), a comma separated list ("0.1,0.5,0.9") or an
+            inclusive range with the number of values ("0.5:0.9:5")
+
+    Returns:
+        list[float]: the values of the range, sorted.
+    """
+    if ":" in text:
+        start, stop, num = text.split(":")
+        start, stop, num = float(start), float(stop), int(num)
+        if num < 2:
+            return [start]
+        return [round(start + (stop - start) * i / (num - 1), 10) for i in range(num)]
+    return sorted(float(value) for value in text.split(","))
+
+
+def wilson_interval(successes: int, episodes: int, z=1.96) -> tuple[float, float]:
+    """
+    Wilson score confidence interval of a success probability.
+
+    Returns:
+        tuple[float, float]: lower and upper bound of the interval.
+    """
+    if episodes == 0:
+        return 0.0, 1.0
+    p = successes / episodes
+    denominator = 1 + z * z / episodes
+    center = (p + z * z / (2 * episodes)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / episodes + z * z / (4 * episodes * episodes)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def tree_hash(tree) -> str:
+    """
+    A hash of the structure of a compiled tree: the types, names and configuration of all nodes.
+    """
+    description = []
+    for i, node in enumerate(tree.nodes):
+        description.append([type(node).__module__, type(node).__qualname__, node.name, tree.kind[i],
+                            tree.num_children[i], tree.num_failures[i], tree.memory[i], tree.policy[i],
+                            tree.synchronise[i]])
+    return hashlib.sha256(json.dumps(description).encode()).hexdigest()[:16]
+
+
+class PointResult:
+    """Accumulated episode statistics of one grid point."""
+    def __init__(self, params: dict, episodes=0, successes=0, ticks_sum=0.0, ticks_sq_sum=0.0, batches=0):
+        self.params = params
+        self.episodes = episodes
+        self.successes = successes
+        self.ticks_sum = ticks_sum
+        self.ticks_sq_sum = ticks_sq_sum
+        self.batches = batches
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.episodes if self.episodes else float("nan")
+
+    @property
+    def mean_ticks(self) -> float:
+        return self.ticks_sum / self.episodes if self.episodes else float("nan")
+
+    def interval(self) -> tuple[float, float]:
+        return wilson_interval(self.successes, self.episodes)
+
+    def as_row(self) -> dict:
+        lower, upper = self.interval()
+        row = dict(self.params)
+        row.update(episodes=self.episodes, success_rate=self.success_rate, ci_lower=lower, ci_upper=upper,
+                   mean_ticks=self.mean_ticks)
+        return row
+
+
+class SweepCache:
+    """
+    On-disk cache of grid point results, keyed by (parameters, tree hash, seed).
+
+    Results are stored per completed batch, so that a rerun with a tighter precision or a larger
+    sweep continues from the cached batches instead of recomputing them.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path (str): sqlite database file, ":memory:" for a cache that is not persisted
+        """
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS points (key TEXT PRIMARY KEY, params TEXT, tree_hash TEXT, seed INTEGER, "
+            "batches INTEGER, episodes INTEGER, successes INTEGER, ticks_sum REAL, ticks_sq_sum REAL)")
+
+    @staticmethod
+    def key(params: dict, tree_hash: str, seed: int) -> str:
+        return json.dumps([params, tree_hash, seed], sort_keys=True)
+
+    def load(self, params: dict, tree_hash: str, seed: int) -> PointResult:
+        row = self._connection.execute(
+            "SELECT batches, episodes, successes, ticks_sum, ticks_sq_sum FROM points WHERE key = ?",
+            (self.key(params, tree_hash, seed),)).fetchone()
+        if row is None:
+            return PointResult(params)
+        batches, episodes, successes, ticks_sum, ticks_sq_sum = row
+        return PointResult(params, episodes, successes, ticks_sum, ticks_sq_sum, batches)
+
+    def store(self, result: PointResult, tree_hash: str, seed: int) -> None:
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.key(result.params, tree_hash, seed), json.dumps(result.params, sort_keys=True), tree_hash,
+                 seed, result.batches, result.episodes, result.successes, result.ticks_sum, result.ticks_sq_sum))
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class ParameterSweep:
+    """
+    Adaptive sweep of the mock probabilities over a grid.
+
+    Every grid point gets batches of episodes until the confidence interval of its success rate is
+    tight enough (or max_episodes is reached). Afterwards, neighbouring points whose success rates
+    differ by more than refine_threshold get a point in-between, for refine_rounds rounds.
+    """
+    def __init__(self, cache: SweepCache, tree_factory=create_pickup_tree, seed=0, precision=0.02,
+                 batch_size=100, min_episodes=200, max_episodes=5000, refine_threshold=0.1, refine_rounds=2,
+                 min_spacing=0.01):
+        """
+        Args:
+            cache (SweepCache): cache for the results of the grid points
+            tree_factory (callable): creates the tree from (manipulator, object_detector, force_sensor)
+            seed (int): seed of the episodes, results are reproducible per (parameters, tree, seed)
+            precision (float): target half width of the 95% confidence interval of the success rate
+            batch_size (int): number of episodes run at once for a grid point
+            min_episodes (int): minimum number of episodes per grid point
+            max_episodes (int): maximum number of episodes per grid point
+            refine_threshold (float): success rate difference of neighbours that triggers refinement
+            refine_rounds (int): maximum number of refinement rounds
+            min_spacing (float): neighbours closer than this are not refined further
+        """
+        self.cache = cache
+        self.tree_factory = tree_factory
+        self.seed = seed
+        self.precision = precision
+        self.batch_size = batch_size
+        self.min_episodes = min_episodes
+        self.max_episodes = max_episodes
+        self.refine_threshold = refine_threshold
+        self.refine_rounds = refine_rounds
+        self.min_spacing = min_spacing
+        self.episodes_run = 0  # episodes computed (not taken from the cache)
+
+    def _is_done(self, result: PointResult) -> bool:
+        if result.episodes < self.min_episodes:
+            return False
+        if result.episodes >= self.max_episodes:
+            return True
+        lower, upper = result.interval()
+        return (upper - lower) / 2 <= self.precision
+
+    def run_point(self, params: dict) -> PointResult:
+        """
+        Runs (or loads from the cache) the episodes of one grid point until its result is precise enough.
+        """
+        rng = random.Random()
+        simulation = PickupSimulation(rng=rng, tree_factory=self.tree_factory, **params)
+        current_hash = tree_hash(simulation.tree)
+        result = self.cache.load(params, current_hash, self.seed)
+        key = SweepCache.key(params, current_hash, self.seed)
+        while not self._is_done(result):
+            with quiet():
+                for _ in range(self.batch_size):
+                    # every episode has its own seed, so that cached results can be extended deterministically
+                    # and do not depend on the batch size
+                    rng.seed(f"{self.seed}:{key}:{result.episodes}")
+                    success, ticks = simulation.run_episode()
+                    result.episodes += 1
+                    result.successes += success
+                    result.ticks_sum += ticks
+                    result.ticks_sq_sum += ticks * ticks
+            result.batches += 1
+            self.episodes_run += self.batch_size
+            self.cache.store(result, current_hash, self.seed)
+        return result
+
+    def _refinements(self, results: dict) -> list:
+        """Returns the midpoints of neighbouring points (along one axis) with a sharp success change."""
+        new_points = []
+        for axis in range(len(PARAMETERS)):
+            lines = {}
+            for point in results:
+                lines.setdefault(point[:axis] + point[axis + 1:], []).append(point)
+            for line in lines.values():
+                line.sort(key=lambda point: point[axis])
+                for low, high in zip(line, line[1:]):
+                    if high[axis] - low[axis] < 2 * self.min_spacing:
+                        continue
+                    if abs(results[high].success_rate - results[low].success_rate) > self.refine_threshold:
+                        midpoint = low[:axis] + (round((low[axis] + high[axis]) / 2, 10),) + low[axis + 1:]
+                        if midpoint not in results:
+                            new_points.append(midpoint)
+        return new_points
+
+    def run(self, ranges: dict) -> list:
+        """
+        Sweeps the cartesian product of the parameter ranges, with refinement.
+
+        Args:
+            ranges (dict[str, list[float]]): values for each parameter in PARAMETERS
+
+        Returns:
+            list[PointResult]: the results of all (initial and refined) grid points, sorted by parameters.
+        """
+        results = {}
+        points = list(itertools.product(*(ranges[name] for name in PARAMETERS)))
+        for refine_round in range(self.refine_rounds + 1):
+            for point in points:
+                results[point] = self.run_point(dict(zip(PARAMETERS, point)))
+            if refine_round == self.refine_rounds:
+                break
+            points = sorted(set(self._refinements(results)))
+            if not points:
+                break
+        return [results[point] for point in sorted(results)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sweep the success probabilities of the pickup task with adaptive episode allocation. "
+                    "Ranges are a value, a list \"0.1,0.5\" or an inclusive range \"start:stop:num\".")
+    parser.add_argument('--object-detect', type=parse_range, default=[0.8],
+                        help="Object detection success probability range, [0.0..1.0]")
+    parser.add_argument('--move', type=parse_range, default=[0.9],
+                        help="Manipulator moving success probability range, [0.0..1.0]")
+    parser.add_argument('--grasp', type=parse_range, default=[0.9],
+                        help="Manipulator grasp success probability range, [0.0..1.0]")
+    parser.add_argument('--slip', type=parse_range, default=[0.9],
+                        help="Probability range for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--force-detect', type=parse_range, default=[0.8],
+                        help="Force-feedback detection success probability range, [0.0..1.0]")
+    parser.add_argument('--precision', type=float, default=0.02,
+                        help="Target half width of the 95%% confidence interval of the success rate")
+    parser.add_argument('--batch', type=int, default=100, help="Episodes per batch")
+    parser.add_argument('--min-episodes', type=int, default=200, help="Minimum episodes per grid point")
+    parser.add_argument('--max-episodes', type=int, default=5000, help="Maximum episodes per grid point")
+    parser.add_argument('--refine-threshold', type=float, default=0.1,
+                        help="Refine between neighbours whose success rates differ by more than this")
+    parser.add_argument('--refine-rounds', type=int, default=2, help="Maximum number of refinement rounds")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the episodes")
+    parser.add_argument('--cache', default=".sweep_cache.sqlite", help="Cache file, ':memory:' to disable caching")
+    parser.add_argument('--output', help="Write the results to this CSV file")
+    args = parser.parse_args(argv)
+
+    ranges = dict(zip(PARAMETERS, (args.object_detect, args.move, args.grasp, args.slip, args.force_detect)))
+    cache = SweepCache(args.cache)
+    sweep = ParameterSweep(cache, seed=args.seed, precision=args.precision, batch_size=args.batch,
+                           min_episodes=args.min_episodes, max_episodes=args.max_episodes,
+                           refine_threshold=args.refine_threshold, refine_rounds=args.refine_rounds)
+    rows = [result.as_row() for result in sweep.run(ranges)]
+    cache.close()
+
+    print(" ".join(f"{name[:12]:>12}" for name in PARAMETERS) + "   episodes  success  [95% CI]         ticks")
+    for row in rows:
+        print(" ".join(f"{row[name]:12.3f}" for name in PARAMETERS)
+              + f" {row['episodes']:10d}  {row['success_rate']:7.3f}  [{row['ci_lower']:.3f}, {row['ci_upper']:.3f}]"
+              + f"  {row['mean_ticks']:7.2f}")
+    print(f"{len(rows)} grid points, {sweep.episodes_run} new episodes")
+
+    if args.output:
+        with open(args.output, "w", newline="") as output:
+            writer = csv.DictWriter(output, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
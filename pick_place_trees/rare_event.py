@@ -0,0 +1,285 @@
+import argparse
+import math
+import random
+
+from .behavior_tree import create_pickup_tree
+from .decided_random import DecidedRandom
+from .markov_analysis import analyse_pickup, outcome_name
+from .simulation import DEVICES, PickupSimulation, quiet
+
+# The failure of the task after the pick sequence has been retried up to its limit
+PICK_EXHAUSTED = "FAILURE (Repty Pick sequence)"
+
+# Biased probabilities are kept away from 0 and 1, where likelihood ratios become unbounded
+MIN_PROBABILITY = 1e-3
+
+
+class _Channel(DecidedRandom):
+    """The random source of one mock, drawing from a TiltedRandom on its behalf."""
+    __slots__ = ("_source", "name")
+
+    def __init__(self, source, name):
+        self._source = source
+        self.name = name
+
+    def decide(self, probability) -> bool:
+        return self._source.decide(probability, self.name)
+
+
+class TiltedRandom(DecidedRandom):
+    """
+    A replacement for the random module that draws the mocks' random events with biased probabilities
+    and keeps track of the likelihood ratio of the drawn outcomes.
+
+    The mocks draw events as `rng.random() < probability`. An event is identified by the channel it is
+    drawn from (see channel(), one per mock) and its nominal probability, and biasing maps it to the
+    probability to draw the event with instead. Events of a mock with the same nominal probability
+    (e.g. moving and grasping) are therefore biased together, which does not bias the estimate.
+    """
+    def __init__(self, biasing=None, rng=None):
+        """
+        Args:
+            biasing (dict[tuple[str, float], float]): the probability to draw the events of every
+                (channel, nominal probability) with, other events are drawn with their nominal probability
+            rng (random.Random): source of the draws, the random module is used if None
+        """
+        self.biasing = dict(biasing or {})
+        self._rng = rng if rng is not None else random
+        self.log_weight = 0.0
+        self.trials = {}
+        self.occurrences = {}
+
+    def begin(self) -> None:
+        """Starts a new episode."""
+        self.log_weight = 0.0
+        self.trials = {}
+        self.occurrences = {}
+
+    def channel(self, name: str) -> _Channel:
+        """A random source whose events are biased separately from those of other channels."""
+        return _Channel(self, name)
+
+    def decide(self, probability, channel=None) -> bool:
+        event = (channel, probability)
+        biased = self.biasing.get(event, probability)
+        outcome = self._rng.random() < biased
+        if biased != probability:
+            if outcome:
+                self.log_weight += math.log(probability / biased)
+            else:
+                self.log_weight += math.log((1.0 - probability) / (1.0 - biased))
+        self.trials[event] = self.trials.get(event, 0) + 1
+        if outcome:
+            self.occurrences[event] = self.occurrences.get(event, 0) + 1
+        return outcome
+
+    @property
+    def weight(self) -> float:
+        """The likelihood ratio of the episode: its nominal probability divided by its biased probability."""
+        return math.exp(self.log_weight)
+
+
+class RareEventEstimate:
+    """
+    The estimated probability of an event, from weighted episodes.
+
+    The normal confidence interval assumes that the weights are not heavy-tailed: if the effective
+    number of hits is much lower than the number of hits, a few episodes dominate the estimate, and
+    its error may be larger than the interval suggests.
+    """
+    def __init__(self, event: str, episodes: int, hits: int, weight_sum: float, weight_sq_sum: float,
+                 biasing: dict, z=1.96):
+        self.event = event
+        self.episodes = episodes
+        self.hits = hits
+        self.biasing = biasing
+        self.probability = weight_sum / episodes
+        variance = max(weight_sq_sum / episodes - self.probability ** 2, 0.0)
+        self.standard_error = math.sqrt(variance / episodes)
+        self.interval = (max(0.0, self.probability - z * self.standard_error), self.probability + z * self.standard_error)
+        # Kish's effective number of hits
+        self.effective_hits = weight_sum ** 2 / weight_sq_sum if weight_sq_sum > 0.0 else 0.0
+
+    @property
+    def relative_error(self) -> float:
+        """Standard error relative to the estimate, infinite if the event was never hit."""
+        return self.standard_error / self.probability if self.probability > 0.0 else math.inf
+
+    def __str__(self) -> str:
+        low, high = self.interval
+        return (f"P({self.event}) = {self.probability:.4g} [{low:.4g}, {high:.4g}], "
+                f"relative error {self.relative_error:.3f}, {self.hits} hits in {self.episodes} episodes "
+                f"({self.effective_hits:.0f} effective)")
+
+
+class RareEventEstimator:
+    """
+    Estimates the probability of a rare episode outcome with importance sampling: the episodes are
+    simulated with biased event probabilities (see TiltedRandom) and weighted with their likelihood
+    ratio, which keeps the estimate unbiased. cross_entropy() finds a biasing that makes the event
+    frequent, and estimate() estimates its probability with it:
+
+        estimator = RareEventEstimator(seed=0)
+        biasing = estimator.cross_entropy()
+        print(estimator.estimate(10000, biasing))
+    """
+    def __init__(self, object_detect_success=0.8, move_success=0.9, grasp_success=0.9, slip_probability=0.3,
+                 force_detect_success=0.9, event=PICK_EXHAUSTED, tree_factory=create_pickup_tree, seed=0):
+        """
+        Args:
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            event (str): the episode outcome to estimate the probability of, see markov_analysis.outcome_name()
+            tree_factory (callable): creates the tree from (manipulator, object_detector, force_sensor)
+            seed (int): seed of the draws
+        """
+        self.event = event
+        self.rng = TiltedRandom(rng=random.Random(seed))
+        self.simulation = PickupSimulation(
+            object_detect_success=object_detect_success,
+            move_success=move_success,
+            grasp_success=grasp_success,
+            slip_probability=slip_probability,
+            force_detect_success=force_detect_success,
+            tree_factory=tree_factory,
+            # every mock draws from its own channel, so that e.g. slipping is biased separately from grasping
+            device_rngs={device: self.rng.channel(device) for device in DEVICES})
+
+    def run_episode(self) -> tuple[bool, int, float, dict, dict]:
+        """
+        Runs an episode with the current biasing.
+
+        Returns:
+            tuple[bool, int, float, dict, dict]: whether the event occurred, the number of ticks, the
+                likelihood ratio, and the number of trials and of occurrences of every event, see TiltedRandom.
+        """
+        self.rng.begin()
+        with quiet():
+            _, ticks = self.simulation.run_episode()
+        hit = outcome_name(self.simulation.tree) == self.event
+        return hit, ticks, self.rng.weight, self.rng.trials, self.rng.occurrences
+
+    def estimate(self, episodes: int, biasing=None, z=1.96) -> RareEventEstimate:
+        """
+        Estimates the probability of the event.
+
+        Args:
+            episodes (int): number of episodes to simulate
+            biasing (dict[tuple[str, float], float]): see TiltedRandom, e.g. from cross_entropy(); plain Monte Carlo if None
+            z (float): the quantile of the confidence interval, 1.96 for 95%
+
+        Returns:
+            RareEventEstimate: the estimate with its confidence interval.
+        """
+        self.rng.biasing = dict(biasing or {})
+        hits, weight_sum, weight_sq_sum = 0, 0.0, 0.0
+        for _ in range(episodes):
+            hit, _, weight, _, _ = self.run_episode()
+            if hit:
+                hits += 1
+                weight_sum += weight
+                weight_sq_sum += weight * weight
+        return RareEventEstimate(self.event, episodes, hits, weight_sum, weight_sq_sum, self.rng.biasing, z=z)
+
+    def cross_entropy(self, episodes=1000, rarity=0.1, smoothing=0.7, max_iterations=30, refinements=3,
+                      score=None, progress=None) -> dict:
+        """
+        Finds a biasing that makes the event frequent with the multilevel cross-entropy method.
+
+        Every iteration runs episodes with the current biasing and selects the elite episodes: those
+        with the event if at least a `rarity` fraction hit it, and otherwise the `rarity` fraction with
+        the highest score. The new biased probability of every event is its likelihood-weighted
+        frequency in the elite episodes, smoothed with the previous one.
+
+        Args:
+            episodes (int): number of episodes per iteration
+            rarity (float): fraction of elite episodes
+            smoothing (float): weight of the new probabilities against the previous ones, (0..1]
+            max_iterations (int): maximum number of iterations
+            refinements (int): number of iterations once the event is frequent
+            score (callable): (hit, ticks) -> how close an episode came to the event; by default hits
+                first and then the number of ticks, as the retries that lead to the rare failures take ticks
+            progress (callable): called with the iteration, the fraction of hits and the biasing after
+                every iteration
+
+        Returns:
+            dict[tuple[str, float], float]: the biasing, see TiltedRandom.
+        """
+        if score is None:
+            score = lambda hit, ticks: (hit, ticks)  # noqa: E731
+        biasing = {}
+        remaining = refinements
+        for iteration in range(max_iterations):
+            self.rng.biasing = dict(biasing)
+            samples = [self.run_episode() for _ in range(episodes)]
+            hits = [sample for sample in samples if sample[0]]
+            done = len(hits) >= rarity * episodes
+            if done:
+                elite = hits
+            else:
+                samples.sort(key=lambda sample: score(sample[0], sample[1]), reverse=True)
+                elite = samples[:max(1, int(rarity * episodes))]
+
+            trials, occurrences = {}, {}
+            for _, _, weight, sample_trials, sample_occurrences in elite:
+                for event, count in sample_trials.items():
+                    trials[event] = trials.get(event, 0.0) + weight * count
+                for event, count in sample_occurrences.items():
+                    occurrences[event] = occurrences.get(event, 0.0) + weight * count
+            for event, weighted_trials in trials.items():
+                probability = event[1]
+                if probability <= 0.0 or probability >= 1.0 or weighted_trials <= 0.0:
+                    continue
+                frequency = occurrences.get(event, 0.0) / weighted_trials
+                previous = biasing.get(event, probability)
+                biased = smoothing * frequency + (1.0 - smoothing) * previous
+                biasing[event] = min(max(biased, MIN_PROBABILITY), 1.0 - MIN_PROBABILITY)
+
+            if progress is not None:
+                progress(iteration, len(hits) / episodes, biasing)
+            if done:
+                remaining -= 1
+                if remaining < 0:
+                    break
+        return biasing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the probability of a rare outcome of the pickup task.")
+    parser.add_argument('--object-detect', type=float, default=0.8,
+                        help="Object detection success probability, [0.0..1.0]")
+    parser.add_argument('--move', type=float, default=0.9,
+                        help="Manipulator moving success probability, [0.0..1.0]")
+    parser.add_argument('--grasp', type=float, default=0.9,
+                        help="Manipulator grasp success probability, [0.0..1.0]")
+    parser.add_argument('--slip', type=float, default=0.3,
+                        help="Probability for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--force-detect', type=float, default=0.9,
+                        help="Force-feedback detection success probability, [0.0..1.0]")
+    parser.add_argument('--event', default=PICK_EXHAUSTED, help="The outcome to estimate the probability of")
+    parser.add_argument('--episodes', type=int, default=10000, help="Episodes of the estimate")
+    parser.add_argument('--ce-episodes', type=int, default=1000, help="Episodes per cross-entropy iteration")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the draws")
+    parser.add_argument('--exact', action='store_true', help="Compare with the exact probability of the Markov chain")
+    args = parser.parse_args(argv)
+    params = dict(object_detect_success=args.object_detect, move_success=args.move, grasp_success=args.grasp,
+                  slip_probability=args.slip, force_detect_success=args.force_detect)
+
+    estimator = RareEventEstimator(event=args.event, seed=args.seed, **params)
+
+    def progress(iteration, hit_fraction, biasing):
+        tilts = ", ".join(f"{channel} {p:g}->{q:.3f}" for (channel, p), q in sorted(biasing.items()))
+        print(f"Cross-entropy iteration {iteration}: {hit_fraction:.1%} hits, biasing {tilts}")
+
+    biasing = estimator.cross_entropy(episodes=args.ce_episodes, progress=progress)
+    print(estimator.estimate(args.episodes, biasing))
+    if args.exact:
+        exact = analyse_pickup(**params).outcome_probabilities().get(args.event, 0.0)
+        print(f"Exact: {exact:.4g}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,18 @@ from pick_place_trees.mock_object_detector import MockObjectDetector
 from pick_place_trees.mock_force_feedback_sensor import MockForceFeedbackSensor
 from pick_place_trees.world_state import WorldState
 
+from pick_place_trees.abort import AbortController, GRIPPER_HOLD, GRIPPER_OPEN
 from pick_place_trees.behavior_tree import create_pickup_tree, run_tree
+from pick_place_trees.device_latency import DEFAULT_LATENCIES, DEVICE_CALLS
+from pick_place_trees.device_server import DeviceClient, parse_address
+from pick_place_trees.sensor_snapshot import SensorSnapshot
+from pick_place_trees.shared_world_state import OutOfProcessDevices
+from pick_place_trees.trace_export import TraceRecorder
 
 def main(object_detect_success=0.8, move_success=0.9,
-         grasp_success=0.9, slip_probability=0.3, force_detect_success=0.9, render_dot_tree=True):
+         grasp_success=0.9, slip_probability=0.3, force_detect_success=0.9, render_dot_tree=True,
+         snapshot_sensors=False, gripper_on_abort=GRIPPER_HOLD, out_of_process=False,
+         device_server=None, trace=None, latency_scale=0.0, timeouts=None):
     """
     Sets up and runs the single-arm pickup behavior tree with the mock manipulator and object detector.
 
@@ -19,6 +27,13 @@ def main(object_detect_success=0.8, move_success=0.9,
         move_success(float): probability [0..1] that moving the manipulator end effector succeeds
         slip_probability(float): probability [0..1] that object slips from the gripper
         force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+        snapshot_sensors(bool): read every sensor at most once per tick, see SensorSnapshot
+        gripper_on_abort(str): what to do with the gripper when aborted by SIGINT/SIGTERM, "hold" or "open"
+        out_of_process(bool): run the mocks as driver processes sharing the world state, see OutOfProcessDevices
+        device_server(str): "host:port" or unix socket path of a device server to use instead of local mocks
+        trace(str): file to write a Chrome/Perfetto timeline of the run to, see TraceRecorder
+        latency_scale(float): factor of device_latency.DEFAULT_LATENCIES for the local mocks, instantaneous if 0
+        timeouts(dict[str, float]): per-call deadlines of the device calls in seconds, see create_pickup_tree
     """
     # Set up the mock objects and world state
     manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
@@ -28,27 +43,77 @@ def main(object_detect_success=0.8, move_success=0.9,
         object_slip_probability=slip_probability,
         object_position=(1, 2, 3))
 
+    latencies = {call: DEFAULT_LATENCIES[call].scaled(latency_scale) if latency_scale > 0 else None
+                 for call in DEVICE_CALLS}
 
     manipulator = MockManipulator(
         state=manipulator_state,
         world_state=world_state,
         grasp_success_rate=grasp_success,
-        move_success_rate=move_success)
+        move_success_rate=move_success,
+        latency=latencies["move_to_position"])
 
-    object_detector = MockObjectDetector(world_state=world_state, detection_success=object_detect_success)
+    object_detector = MockObjectDetector(world_state=world_state, detection_success=object_detect_success,
+                                         latency=latencies["detect_object"])
 
     force_sensor = MockForceFeedbackSensor(
         manipulator_state=manipulator_state,
         world_state=world_state,
-        detection_success=force_detect_success)
+        detection_success=force_detect_success,
+        latency=latencies["detect_force"])
+
+    devices = None
+    if out_of_process:
+        devices = OutOfProcessDevices(
+            object_detect_success=object_detect_success,
+            move_success=move_success,
+            grasp_success=grasp_success,
+            slip_probability=slip_probability,
+            force_detect_success=force_detect_success,
+            quiet=False)
+        manipulator = devices.manipulator
+        object_detector = devices.object_detector
+        force_sensor = devices.force_sensor
+        world_state = devices.world_state
+
+    client = None
+    if device_server is not None:
+        client = DeviceClient(parse_address(device_server))
+        manipulator = client.manipulator()
+        object_detector = client.object_detector()
+        force_sensor = client.force_sensor()
+        world_state = None  # the world is simulated by the server
+
+    sensor_snapshot = None
+    if snapshot_sensors:
+        sensor_snapshot = SensorSnapshot()
+        manipulator = sensor_snapshot.manipulator(manipulator)
+        object_detector = sensor_snapshot.object_detector(object_detector)
+        force_sensor = sensor_snapshot.force_sensor(force_sensor)
 
     # Create and run the behavior tree
-    root = create_pickup_tree(manipulator, object_detector, force_sensor)
+    root = create_pickup_tree(manipulator, object_detector, force_sensor, timeouts=timeouts)
     
     if render_dot_tree:
         py_trees.display.render_dot_tree(root, with_blackboard_variables=True)
-    
-    run_tree(root, world_state)
+
+    abort = AbortController(manipulator, gripper_policy=gripper_on_abort)
+    previous_handlers = abort.install_signal_handler()
+    trace_recorder = TraceRecorder(trace) if trace is not None else None
+    try:
+        run_tree(root, world_state, sensor_snapshot=sensor_snapshot, abort=abort, trace_recorder=trace_recorder)
+    finally:
+        abort.restore_signal_handlers(previous_handlers)
+        if trace_recorder is not None:
+            trace_recorder.close()
+        if devices is not None:
+            devices.close()
+        if client is not None:
+            client.close()
+
+    if sensor_snapshot is not None:
+        print(f"Sensor reads: {sensor_snapshot.reads}, saved: {sensor_snapshot.reads_saved}, "
+              f"invalidations: {sensor_snapshot.invalidations}")
 
 if __name__ == '__main__':
     # Set up argument parsing for the object position
@@ -64,6 +129,20 @@ if __name__ == '__main__':
     parser.add_argument('--force-detect', type=float, default=0.8,
                         help="Force-feedback detection success probability, [0.0..1.0]")
     parser.add_argument('--render_dot_tree', action='store_true', help="Render the tree as a dot file")
+    parser.add_argument('--snapshot-sensors', action='store_true', help="Read every sensor at most once per tick")
+    parser.add_argument('--out-of-process', action='store_true',
+                        help="Run the mocks as separate driver processes sharing the world state")
+    parser.add_argument('--device-server', default=None,
+                        help="host:port or unix socket of a device server (python3 -m pick_place_trees.device_server)")
+    parser.add_argument('--gripper-on-abort', choices=[GRIPPER_HOLD, GRIPPER_OPEN], default=GRIPPER_HOLD,
+                        help="What to do with the gripper when aborted with Ctrl-C")
+    parser.add_argument('--trace', default=None,
+                        help="Write a timeline of the run to this file, to be opened in ui.perfetto.dev")
+    parser.add_argument('--latency-scale', type=float, default=0.0,
+                        help="Give the local mocks the default device latencies, multiplied by this factor")
+    parser.add_argument('--detect-timeout', type=float, help="Deadline of an object detection in seconds")
+    parser.add_argument('--force-timeout', type=float, help="Deadline of a force reading in seconds")
+    parser.add_argument('--move-timeout', type=float, help="Deadline of a move in seconds")
     args = parser.parse_args()
 
     # Run the behavior tree with the specified parameters
@@ -72,4 +151,12 @@ if __name__ == '__main__':
          grasp_success=args.grasp,
          slip_probability=args.slip,
          force_detect_success=args.force_detect,
-         render_dot_tree=args.render_dot_tree)
+         render_dot_tree=args.render_dot_tree,
+         snapshot_sensors=args.snapshot_sensors,
+         gripper_on_abort=args.gripper_on_abort,
+         out_of_process=args.out_of_process,
+         device_server=args.device_server,
+         trace=args.trace,
+         latency_scale=args.latency_scale,
+         timeouts={call: timeout for call, timeout in zip(
+             DEVICE_CALLS, (args.detect_timeout, args.force_timeout, args.move_timeout)) if timeout is not None})
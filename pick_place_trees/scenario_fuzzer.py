@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+from .compiled_tree import FAILURE, STATUSES, SUCCESS
+from .decided_random import DecidedRandom
+from .simulation import PickupSimulation, quiet
+
+
+class ScriptedRandom(DecidedRandom):
+    """
+    A replacement for the random module that takes the outcome of every uncertain event from a script.
+
+    The mocks draw events as `rng.random() < probability`. Here every draw takes the next outcome from the
+    script, or the most likely outcome (probability > 0.5) once the script is exhausted. Certain events
+    (probability 0 or 1) do not use the script. The outcomes that were used are recorded in `path`, so a
+    script of any length can be completed to the script that reproduces a run exactly.
+    """
+    def __init__(self):
+        self.script = []
+        self.path = []
+
+    def begin(self, script) -> None:
+        """Starts a new run, with the outcomes given by script (a sequence of bools)."""
+        self.script = script
+        self.path = []
+
+    def decide(self, probability) -> bool:
+        if probability <= 0.0:
+            return False
+        if probability >= 1.0:
+            return True
+        index = len(self.path)
+        outcome = bool(self.script[index]) if index < len(self.script) else probability > 0.5
+        self.path.append(outcome)
+        return outcome
+
+
+def transition_name(simulation: PickupSimulation, transition: tuple) -> str:
+    """Returns "node: STATUS -> STATUS" for a (node index, status code, status code) transition."""
+    node, before, after = transition
+    return f"{simulation.tree.nodes[node].name}: {STATUSES[before].name} -> {STATUSES[after].name}"
+
+
+def run_with_coverage(simulation: PickupSimulation, max_ticks: int) -> tuple:
+    """
+    Runs an episode and records the status transitions of the nodes of the tree.
+
+    Returns:
+        tuple: whether the task succeeded (None if it did not finish within max_ticks), the number of
+            ticks, and the set of (node index, status code before, status code after) transitions.
+    """
+    simulation.reset()
+    tree = simulation.tree
+    status = tree.status
+    covered = set()
+    for ticks in range(1, max_ticks + 1):
+        before = status.tobytes()
+        tree.tick()
+        after = status.tobytes()
+        if before != after:
+            covered.update((node, a, b) for node, (a, b) in enumerate(zip(before, after)) if a != b)
+        if status[0] == SUCCESS or status[0] == FAILURE:
+            return status[0] == SUCCESS, ticks, covered
+    return None, max_ticks, covered
+
+
+def check_terminates(simulation, success):
+    if success is None:
+        return "the task did not finish"
+
+
+def check_object_at_target(simulation, success):
+    if success and (simulation.world_state.object_position != simulation.target_position
+                    or simulation.world_state.holding_object):
+        return "the task succeeded without placing the object at the target"
+
+
+def check_object_position_known(simulation, success):
+    if simulation.world_state.object_position is None:
+        return "the object position is lost"
+
+
+# Invariants checked after every run: functions (simulation, success) returning a violation message or None
+INVARIANTS = (check_terminates, check_object_at_target, check_object_position_known)
+
+
+class ScenarioResult:
+    """The outcome of running a script."""
+    def __init__(self, script, success, ticks, coverage, violations, tick_starts=()):
+        self.script = script  # the complete script, reproducing the run exactly
+        self.tick_starts = tick_starts  # index of the first outcome of every tick in the script
+        self.success = success
+        self.ticks = ticks
+        self.coverage = coverage
+        self.violations = violations
+
+
+class ScenarioFuzzer:
+    """
+    Coverage-guided fuzzer of the outcomes of the mocks' random events.
+
+    A scenario is a script of outcomes (see ScriptedRandom). Scripts that cover new status transitions
+    of the tree's nodes are kept in a corpus, and new scripts are derived from the corpus by mutations
+    (flipping outcomes, bursts of equal outcomes, splicing two scripts, truncating, inserting,
+    repeating the outcomes of ticks and deleting outcomes). Runs violating an invariant are minimized and kept in `failures`.
+    """
+    def __init__(self, simulation: PickupSimulation = None, seed=0, max_ticks=5000, invariants=INVARIANTS,
+                 target_position=(5, 5, 5)):
+        """
+        Args:
+            simulation (PickupSimulation): the simulation to fuzz, it must use a ScriptedRandom as rng.
+                A PickupSimulation with default probabilities is created if None.
+            seed (int): seed of the mutations
+            max_ticks (int): runs that take longer do not terminate
+            invariants (tuple[callable]): see INVARIANTS
+            target_position (tuple[float, float, float]): where the tree places the object
+        """
+        if simulation is None:
+            simulation = PickupSimulation(rng=ScriptedRandom())
+        if not isinstance(simulation.rng, ScriptedRandom):
+            raise ValueError("the simulation to fuzz must use a ScriptedRandom as rng")
+        self.simulation = simulation
+        self.simulation.target_position = target_position
+        self._scripted = simulation.rng
+        self._rng = random.Random(seed)
+        self.max_ticks = max_ticks
+        self.invariants = invariants
+        self.coverage = set()
+        self.corpus = []
+        self.failures = {}  # violation -> minimized ScenarioResult
+        self.runs = 0
+        self._tick_starts = []
+        simulation.tree.add_pre_tick_handler(lambda tree: self._tick_starts.append(len(self._scripted.path)))
+
+    def run(self, script) -> ScenarioResult:
+        """Runs the scenario given by script."""
+        self._scripted.begin(script)
+        self._tick_starts = []
+        with quiet():
+            try:
+                success, ticks, coverage = run_with_coverage(self.simulation, self.max_ticks)
+                violations = tuple(message for message in
+                                   (check(self.simulation, success) for check in self.invariants) if message)
+            except Exception as e:
+                success, ticks, coverage = None, 0, set()
+                violations = (f"exception {type(e).__name__}: {e}",)
+        self.runs += 1
+        return ScenarioResult(list(self._scripted.path), success, ticks, coverage, violations, self._tick_starts)
+
+    def describe(self, transitions) -> list:
+        """Returns the sorted names of transitions."""
+        return sorted(transition_name(self.simulation, transition) for transition in transitions)
+
+    def mutate(self, result: ScenarioResult) -> list:
+        """Returns a mutation of the script of result."""
+        rng = self._rng
+        script = list(result.script)
+        position = rng.randrange(len(script) + 1)
+        mutation = rng.randrange(7)
+        if mutation == 0 and script:
+            position = min(position, len(script) - 1)
+            script[position] = not script[position]
+        elif mutation == 1:
+            length = rng.randint(2, 12)
+            script[position:position + length] = [rng.random() < 0.5] * length
+        elif mutation == 2 and self.corpus:
+            other = rng.choice(self.corpus).script
+            script = script[:position] + other[rng.randrange(len(other) + 1):]
+        elif mutation == 3:
+            script = script[:position]
+        elif mutation == 4:
+            script.insert(position, rng.random() < 0.5)
+        elif mutation == 5 and result.tick_starts:
+            # repeating the outcomes of a tick, e.g. of a failed attempt, exhausts retries
+            tick = rng.randrange(len(result.tick_starts))
+            start = result.tick_starts[tick]
+            end = result.tick_starts[tick + 1] if tick + 1 < len(result.tick_starts) else len(script)
+            script[start:start] = script[start:end] * rng.randint(2, 128)
+        elif script:
+            del script[min(position, len(script) - 1)]
+        return script
+
+    def _add(self, result: ScenarioResult) -> set:
+        """Keeps result if it covers new transitions, returns them."""
+        new = result.coverage - self.coverage
+        if new:
+            self.coverage |= new
+            self.corpus.append(result)
+        for violation in result.violations:
+            if violation not in self.failures:
+                self.failures[violation] = self.minimize(
+                    result.script, lambda candidate: violation in candidate.violations)
+        return new
+
+    def fuzz(self, max_runs=10000, max_seconds=None, targets=None, progress=None) -> set:
+        """
+        Fuzzes until max_runs runs or max_seconds have passed, or all targets are covered.
+
+        Args:
+            max_runs (int): maximum number of runs
+            max_seconds (float): maximum time, unlimited if None
+            targets (set): transition names to cover, see describe()
+            progress (callable): called with (runs, new transition names) whenever new coverage is found
+
+        Returns:
+            set: the covered transitions
+        """
+        start = time.perf_counter()
+        if not self.corpus:
+            self._add(self.run([]))
+        while self.runs < max_runs and (max_seconds is None or time.perf_counter() - start < max_seconds):
+            if targets is not None and targets <= set(self.describe(self.coverage)):
+                break
+            result = self.run(self.mutate(self._rng.choice(self.corpus)))
+            new = self._add(result)
+            if new and progress is not None:
+                progress(self.runs, self.describe(new))
+        return self.coverage
+
+    def scenario_for(self, transition: str) -> ScenarioResult:
+        """
+        Returns the minimized scenario of the corpus that covers a transition, see describe(), or None.
+        """
+        for result in self.corpus:
+            if transition in self.describe(result.coverage):
+                return self.minimize(result.script, lambda candidate: transition in self.describe(candidate.coverage))
+        return None
+
+    def minimize(self, script, keep) -> ScenarioResult:
+        """
+        Shortens script while keep(result) holds: removes chunks of outcomes (delta debugging), and
+        finally cuts the script after the last outcome that differs from the most likely one.
+
+        Args:
+            script (list[bool]): a script for which keep() holds
+            keep (callable): predicate on a ScenarioResult
+
+        Returns:
+            ScenarioResult: the run of the minimized script
+        """
+        best = self.run(script)
+        chunk = max(len(best.script) // 2, 1)
+        while chunk >= 1:
+            position = 0
+            while position < len(script):
+                candidate = script[:position] + script[position + chunk:]
+                result = self.run(candidate)
+                if keep(result):
+                    script, best = candidate, result
+                else:
+                    position += chunk
+            chunk //= 2
+        # outcomes after the last unlikely one are those the script falls back to anyway
+        shortest = list(script)
+        while shortest:
+            result = self.run(shortest[:-1])
+            if not keep(result):
+                break
+            shortest = shortest[:-1]
+            best = result
+        best.script = shortest
+        return best
+
+
+def save_case(path: str, fuzzer: ScenarioFuzzer, result: ScenarioResult, description: str) -> None:
+    """
+    Saves a scenario as replayable regression case (JSON): its script, and its expected outcome. The
+    `known_bug` description of a case that is overwritten is kept, see tests/test_scenario_fuzzer.py.
+    """
+    case = {"description": description}
+    if os.path.exists(path):
+        known_bug = load_case(path).get("known_bug")
+        if known_bug is not None:
+            case["known_bug"] = known_bug
+    case.update({
+        "script": "".join("1" if outcome else "0" for outcome in result.script),
+        "success": result.success,
+        "ticks": result.ticks,
+        "violations": list(result.violations),
+        "transitions": fuzzer.describe(result.coverage),
+    })
+    with open(path, "w") as f:
+        json.dump(case, f, indent=2)
+        f.write("\n")
+
+
+def load_case(path: str) -> dict:
+    """Loads a case saved by save_case(), with the script as list of bools."""
+    with open(path) as f:
+        case = json.load(f)
+    case["script"] = [outcome == "1" for outcome in case["script"]]
+    return case
+
+
+def random_coverage(num_runs, seed=0, max_ticks=5000) -> set:
+    """Returns the transitions covered by num_runs episodes with random outcomes, for comparison."""
+    simulation = PickupSimulation(rng=random.Random(seed))
+    coverage = set()
+    with quiet():
+        for _ in range(num_runs):
+            coverage |= run_with_coverage(simulation, max_ticks)[2]
+    return coverage
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Fuzz the outcomes of the pickup task for rare tree paths.")
+    parser.add_argument('--runs', type=int, default=20000, help="Maximum number of runs")
+    parser.add_argument('--seconds', type=float, default=30.0, help="Maximum fuzzing time")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the mutations")
+    parser.add_argument('--baseline', type=int, default=0,
+                        help="Also run this many random episodes and compare their coverage")
+    parser.add_argument('--save', default=None,
+                        help="Directory to save minimized scenarios to: violations, and with --baseline the rare paths")
+    args = parser.parse_args(argv)
+
+    fuzzer = ScenarioFuzzer(seed=args.seed)
+    start = time.perf_counter()
+
+    def progress(runs, transitions):
+        for transition in transitions:
+            print(f"{time.perf_counter() - start:7.2f} s {runs:7d} runs  {transition}")
+
+    fuzzer.fuzz(max_runs=args.runs, max_seconds=args.seconds, progress=progress)
+    print(f"{len(fuzzer.coverage)} transitions covered in {fuzzer.runs} runs")
+
+    cases = []
+    for violation, result in sorted(fuzzer.failures.items()):
+        script = "".join("1" if outcome else "0" for outcome in result.script)
+        print(f"violation: {violation}\n    minimal script: {script} ({result.ticks} ticks)")
+        cases.append((violation, result))
+
+    if args.baseline:
+        baseline = random_coverage(args.baseline, seed=args.seed)
+        print(f"{len(baseline)} transitions covered by {args.baseline} random episodes, missing:")
+        for transition in fuzzer.describe(fuzzer.coverage - baseline):
+            print(f"    {transition}")
+            if args.save:
+                cases.append((f"reaches {transition}", fuzzer.scenario_for(transition)))
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for description, result in cases:
+            name = re.sub(r"[^a-z0-9]+", "_", description.lower()).strip("_")
+            save_case(os.path.join(args.save, f"{name}.json"), fuzzer, result, description)
+
+if __name__ == '__main__':
+    main()
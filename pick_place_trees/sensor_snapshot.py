@@ -0,0 +1,139 @@
+import time
+
+from .device_latency import call_device
+from .mock_force_feedback_sensor import MockForceFeedbackSensor
+from .mock_manipulator import MockManipulator
+from .mock_object_detector import MockObjectDetector
+
+
+class SensorSnapshot:
+    """
+    Opt-in cache of sensor readings, so that every sensor is read at most once per tick (or per
+    freshness window) and all behaviours of that tick are served the same reading.
+
+    Sensors and the manipulator are wrapped before the tree is created, and new_tick() is registered
+    as pre-tick handler of the tree:
+
+        snapshot = SensorSnapshot()
+        root = create_pickup_tree(snapshot.manipulator(manipulator),
+                                  snapshot.object_detector(object_detector),
+                                  snapshot.force_sensor(force_sensor))
+        tree = py_trees.trees.BehaviourTree(root)
+        tree.add_pre_tick_handler(snapshot.new_tick)
+
+    Actuation commands of the wrapped manipulator invalidate all readings, as they change what the
+    sensors would measure (e.g. the force after closing the gripper).
+    """
+    def __init__(self, max_age=None, clock=time.monotonic):
+        """
+        Args:
+            max_age (float): freshness window in seconds. If None, readings are valid until the next tick.
+            clock (callable): returns the current time in seconds, used with max_age
+        """
+        self._max_age = max_age
+        self._clock = clock
+        self._readings = {}  # sensor key -> (time of the reading, reading)
+        self.reads = 0  # device reads that were performed
+        self.reads_saved = 0  # device reads that were served from the snapshot
+        self.invalidations = 0
+
+    def new_tick(self, tree=None) -> None:
+        """
+        Starts a new tick: without a freshness window, all readings are dropped.
+        Can be registered as pre-tick handler of a tree.
+        """
+        if self._max_age is None:
+            self._readings.clear()
+
+    def invalidate(self) -> None:
+        """Drops all readings, e.g. after an actuation command."""
+        self._readings.clear()
+        self.invalidations += 1
+
+    def read(self, key, read_sensor):
+        """
+        Returns the snapshot of a sensor reading, reading the sensor if there is no fresh one.
+
+        Args:
+            key: identifies the sensor and reading
+            read_sensor (callable): performs the actual device read
+        """
+        now = self._clock() if self._max_age is not None else None
+        reading = self._readings.get(key)
+        if reading is not None and (now is None or now - reading[0] <= self._max_age):
+            self.reads_saved += 1
+            return reading[1]
+        value = read_sensor()
+        self.reads += 1
+        self._readings[key] = (now, value)
+        return value
+
+    def force_sensor(self, sensor: MockForceFeedbackSensor) -> "SnapshotForceFeedbackSensor":
+        """Wraps a force feedback sensor to read through this snapshot."""
+        return SnapshotForceFeedbackSensor(sensor, self)
+
+    def object_detector(self, detector: MockObjectDetector) -> "SnapshotObjectDetector":
+        """Wraps an object detector to read through this snapshot."""
+        return SnapshotObjectDetector(detector, self)
+
+    def manipulator(self, manipulator: MockManipulator) -> "SnapshotManipulator":
+        """Wraps a manipulator to invalidate this snapshot after actuation commands."""
+        return SnapshotManipulator(manipulator, self)
+
+
+class SnapshotForceFeedbackSensor:
+    """A force feedback sensor whose readings are taken from a SensorSnapshot."""
+    def __init__(self, sensor: MockForceFeedbackSensor, snapshot: SensorSnapshot):
+        self._sensor = sensor
+        self._snapshot = snapshot
+
+    def detect_force(self, timeout=None) -> bool:
+        """See MockForceFeedbackSensor.detect_force(), the timeout only applies if the sensor is read."""
+        return self._snapshot.read((id(self._sensor), "detect_force"),
+                                   lambda: call_device(self._sensor.detect_force, timeout=timeout))
+
+
+class SnapshotObjectDetector:
+    """An object detector whose readings are taken from a SensorSnapshot."""
+    def __init__(self, detector: MockObjectDetector, snapshot: SensorSnapshot):
+        self._detector = detector
+        self._snapshot = snapshot
+
+    def detect_object(self, timeout=None):
+        """See MockObjectDetector.detect_object(), the timeout only applies if the detector is read."""
+        return self._snapshot.read((id(self._detector), "detect_object"),
+                                   lambda: call_device(self._detector.detect_object, timeout=timeout))
+
+
+class SnapshotManipulator:
+    """
+    A manipulator that invalidates a SensorSnapshot after every actuation command.
+    All other attributes are those of the wrapped manipulator.
+    """
+    def __init__(self, manipulator: MockManipulator, snapshot: SensorSnapshot):
+        self._manipulator = manipulator
+        self._snapshot = snapshot
+
+    def __getattr__(self, name):
+        return getattr(self._manipulator, name)
+
+    def move_to_position(self, target_position: tuple[float, float, float], timeout=None) -> bool:
+        """See MockManipulator.move_to_position()."""
+        try:
+            return call_device(self._manipulator.move_to_position, target_position, timeout=timeout)
+        finally:
+            self._snapshot.invalidate()
+
+    def grasp(self) -> bool:
+        """See MockManipulator.grasp()."""
+        try:
+            return self._manipulator.grasp()
+        finally:
+            self._snapshot.invalidate()
+
+    def release(self) -> bool:
+        """See MockManipulator.release()."""
+        try:
+            return self._manipulator.release()
+        finally:
+            self._snapshot.invalidate()
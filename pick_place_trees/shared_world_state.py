@@ -0,0 +1,385 @@
+import collections
+import contextlib
+import io
+import multiprocessing
+import random
+import struct
+import time
+from multiprocessing import shared_memory
+
+from .device_latency import DeviceTimeout, call_device
+from .mock_manipulator import MockManipulator, MockManipulatorState
+from .mock_object_detector import MockObjectDetector
+from .mock_force_feedback_sensor import MockForceFeedbackSensor
+from .world_state import WorldState
+
+# Binary layout of the shared block:
+#   sequence counter (odd while the state is being written), followed by the state:
+#   object position (x, y, z, valid), end effector position (x, y, z, valid),
+#   holding object, object slip simulated, gripper closed,
+#   and a stop flag that is written by the tree process, not by the driver.
+SEQUENCE = struct.Struct("<Q")
+STATE = struct.Struct("<3d?3d????")
+STATE_OFFSET = SEQUENCE.size
+STOP_OFFSET = STATE_OFFSET + STATE.size
+BLOCK_SIZE = STOP_OFFSET + 1
+
+WorldSnapshot = collections.namedtuple(
+    "WorldSnapshot",
+    ["object_position", "endeffector_position", "holding_object", "simulate_object_slip", "gripper_closed"])
+
+
+class SharedWorldState:
+    """
+    World and manipulator state in a multiprocessing.shared_memory block with a fixed binary layout.
+
+    There is a single writer (the manipulator driver process, see publish()). Readers in any process
+    get consistent snapshots without locks, IPC messages or pickling: the writer makes the sequence
+    counter odd while writing and even again afterwards, and a reader retries until it read the
+    state between two identical, even counter values (a seqlock). This relies on the stores of the
+    writer becoming visible in order, as they do on x86.
+
+    The properties mirror WorldState and MockManipulatorState, so that the mocks of the sensor
+    drivers can use a block as their world and manipulator state.
+    """
+    def __init__(self, name=None, create=False):
+        """
+        Args:
+            name (str): name of the shared memory block, a new name is chosen if None and create is True
+            create (bool): create the block (the owner has to unlink() it) or attach to an existing one
+        """
+        self._memory = shared_memory.SharedMemory(name=name, create=create, size=BLOCK_SIZE if create else 0)
+        self._buffer = self._memory.buf
+        self.read_retries = 0  # reads that overlapped with a write and had to be repeated
+        if create:
+            self._buffer[:BLOCK_SIZE] = bytes(BLOCK_SIZE)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def close(self) -> None:
+        """Detaches from the block."""
+        self._buffer = None
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Destroys the block, to be called once by its creator after closing all users."""
+        self._memory.unlink()
+
+    def publish(self, world_state: WorldState, manipulator_state: MockManipulatorState) -> None:
+        """
+        Writes the current state. Must only be called by a single writer.
+
+        Args:
+            world_state (WorldState): the world to publish
+            manipulator_state (MockManipulatorState): the manipulator state to publish
+        """
+        object_position = world_state.object_position
+        endeffector_position = manipulator_state.endeffector_position
+        sequence = SEQUENCE.unpack_from(self._buffer, 0)[0]
+        SEQUENCE.pack_into(self._buffer, 0, sequence + 1)
+        STATE.pack_into(
+            self._buffer, STATE_OFFSET,
+            *(object_position or (0.0, 0.0, 0.0)), object_position is not None,
+            *(endeffector_position or (0.0, 0.0, 0.0)), endeffector_position is not None,
+            world_state.holding_object,
+            world_state._simulate_object_slip,
+            manipulator_state.gripper_closed)
+        SEQUENCE.pack_into(self._buffer, 0, sequence + 2)
+
+    def read(self) -> WorldSnapshot:
+        """Returns a consistent snapshot of the state."""
+        buffer = self._buffer
+        while True:
+            before = SEQUENCE.unpack_from(buffer, 0)[0]
+            if before % 2 == 0:
+                values = STATE.unpack_from(buffer, STATE_OFFSET)
+                if SEQUENCE.unpack_from(buffer, 0)[0] == before:
+                    break
+            self.read_retries += 1
+            # the writer may have been preempted in the middle of a write, let it finish
+            time.sleep(0)
+        return WorldSnapshot(
+            object_position=values[0:3] if values[3] else None,
+            endeffector_position=values[4:7] if values[7] else None,
+            holding_object=values[8],
+            simulate_object_slip=values[9],
+            gripper_closed=values[10])
+
+    @property
+    def stop_requested(self) -> bool:
+        """Whether the manipulator is to be stopped, see RemoteManipulator.stop()"""
+        return bool(self._buffer[STOP_OFFSET])
+
+    @stop_requested.setter
+    def stop_requested(self, stop: bool) -> None:
+        self._buffer[STOP_OFFSET] = int(stop)
+
+    @property
+    def object_position(self) -> tuple[float, float, float]:
+        """See WorldState.object_position"""
+        return self.read().object_position
+
+    @property
+    def holding_object(self) -> bool:
+        """See WorldState.holding_object"""
+        return self.read().holding_object
+
+    def is_object_within_fov(self) -> bool:
+        """See WorldState.is_object_within_fov()"""
+        return True
+
+    @property
+    def endeffector_position(self) -> tuple[float, float, float]:
+        """See MockManipulatorState.endeffector_position"""
+        return self.read().endeffector_position
+
+    @property
+    def gripper_closed(self) -> bool:
+        """See MockManipulatorState.gripper_closed"""
+        return self.read().gripper_closed
+
+    def __str__(self):
+        state = self.read()
+        return ("World State:  \n"
+                f"- Object at {state.object_position} \n"
+                f"- EE at {state.endeffector_position}\n"
+                f"    gripper closed: {state.gripper_closed}\n"
+                f"    holding the object: {state.holding_object}")
+
+
+def _serve(connection, device, after_command=None) -> None:
+    """
+    Executes (method, args, timeout) requests on device until None is received, replying with the
+    results, or with the DeviceTimeout of a call that missed its deadline.
+    """
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        method, args, timeout = request
+        try:
+            result = call_device(getattr(device, method), *args, timeout=timeout)
+        except DeviceTimeout as e:
+            result = e
+        if after_command is not None:
+            after_command()
+        connection.send(result)
+
+
+def _run_manipulator_driver(connection, block_name, object_position, slip_probability, grasp_success,
+                            move_success, grasp_offset_z, seed, quiet) -> None:
+    """Driver process of the manipulator: the only writer of the shared world state."""
+    block = SharedWorldState(block_name)
+    rng = random.Random(seed)
+    manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=grasp_offset_z)
+    world_state = WorldState(manipulator_state=manipulator_state, object_position=object_position,
+                             object_slip_probability=slip_probability, rng=rng)
+    manipulator = MockManipulator(state=manipulator_state, world_state=world_state,
+                                  grasp_success_rate=grasp_success, move_success_rate=move_success, rng=rng)
+
+    class Driver:
+        """Applies the stop flag of the tree process before every command"""
+        def __getattr__(self, name):
+            if block.stop_requested:
+                manipulator.stop()
+            elif manipulator.stopped:
+                manipulator.resume()
+            return getattr(manipulator, name)
+
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        block.publish(world_state, manipulator_state)
+        connection.send(True)  # ready
+        _serve(connection, Driver(), lambda: block.publish(world_state, manipulator_state))
+    block.close()
+
+
+def _run_sensor_driver(connection, block_name, sensor_type, detection_success, seed) -> None:
+    """Driver process of a sensor: reads the world state from the shared block."""
+    block = SharedWorldState(block_name)
+    rng = random.Random(seed)
+    if sensor_type == "object_detector":
+        sensor = MockObjectDetector(world_state=block, detection_success=detection_success, rng=rng)
+    else:
+        sensor = MockForceFeedbackSensor(manipulator_state=block, world_state=block,
+                                         detection_success=detection_success, rng=rng)
+    connection.send(True)  # ready
+    _serve(connection, sensor)
+    block.close()
+
+
+class RemoteDevice:
+    """Proxy of a device in a driver process, commands are sent over a pipe."""
+    def __init__(self, connection):
+        self._connection = connection
+
+    def _call(self, method, *args, timeout=None):
+        """Calls method on the device in the driver, the timeout is enforced by the device."""
+        self._connection.send((method, args, timeout))
+        result = self._connection.recv()
+        if isinstance(result, DeviceTimeout):
+            raise result
+        return result
+
+
+class RemoteManipulator(RemoteDevice):
+    """
+    Proxy of a MockManipulator in a driver process. Commands are sent to the driver, the state is
+    read from the shared block.
+    """
+    def __init__(self, connection, block: SharedWorldState, grasp_offset_z=0.1):
+        """
+        Args:
+            connection (multiprocessing.connection.Connection): pipe to the manipulator driver
+            block (SharedWorldState): the shared state published by the driver
+            grasp_offset_z (float): the grasp offset of the manipulator, see MockManipulatorState
+        """
+        super(RemoteManipulator, self).__init__(connection)
+        self._block = block
+        self._geometry = MockManipulatorState(name="MyManipulator", grasp_offset_z=grasp_offset_z)
+
+    @property
+    def name(self):
+        return "MyMockManipulator"
+
+    @property
+    def gripper_closed(self):
+        """Returns whether the gripper is closed"""
+        return self._block.gripper_closed
+
+    @property
+    def endeffector_position(self):
+        """See MockManipulator.endeffector_position"""
+        return self._block.endeffector_position
+
+    @property
+    def stopped(self) -> bool:
+        """See MockManipulator.stopped"""
+        return self._block.stop_requested
+
+    def get_grasp_position_for(self, object_position: tuple[float, float, float]) -> tuple[float, float, float]:
+        """See MockManipulator.get_grasp_position_for()"""
+        return self._geometry.get_grasp_position_for(object_position)
+
+    def is_object_within_grasp_offset(self, object_position: tuple[float, float, float]) -> bool:
+        """See MockManipulator.is_object_within_grasp_offset()"""
+        self._geometry.endeffector_position = self._block.endeffector_position
+        return self._geometry.is_object_within_grasp_offset(object_position)
+
+    def move_to_position(self, target_position: tuple[float, float, float], timeout=None) -> bool:
+        """See MockManipulator.move_to_position()"""
+        return self._call("move_to_position", target_position, timeout=timeout)
+
+    def grasp(self) -> bool:
+        """See MockManipulator.grasp()"""
+        return self._call("grasp")
+
+    def release(self) -> bool:
+        """See MockManipulator.release()"""
+        return self._call("release")
+
+    def stop(self) -> bool:
+        """
+        Makes further moves fail until resume(), see MockManipulator.stop(). Only sets a flag in the
+        shared block, so it can be called from any thread or signal handler.
+        """
+        self._block.stop_requested = True
+        return True
+
+    def resume(self) -> None:
+        """See MockManipulator.resume()"""
+        self._block.stop_requested = False
+
+
+class RemoteObjectDetector(RemoteDevice):
+    """Proxy of a MockObjectDetector in a driver process."""
+    def detect_object(self, timeout=None):
+        """See MockObjectDetector.detect_object()"""
+        return self._call("detect_object", timeout=timeout)
+
+
+class RemoteForceFeedbackSensor(RemoteDevice):
+    """Proxy of a MockForceFeedbackSensor in a driver process."""
+    def detect_force(self, timeout=None) -> bool:
+        """See MockForceFeedbackSensor.detect_force()"""
+        return self._call("detect_force", timeout=timeout)
+
+
+class OutOfProcessDevices:
+    """
+    Runs the manipulator, the object detector and the force feedback sensor as separate driver
+    processes, sharing the world state through a SharedWorldState block. Provides proxies of the
+    devices for the tree, and the block as (debugging) world state:
+
+        with OutOfProcessDevices(slip_probability=0.3) as devices:
+            root = create_pickup_tree(devices.manipulator, devices.object_detector, devices.force_sensor)
+            run_tree(root, devices.world_state)
+    """
+    def __init__(self, object_detect_success=0.8, move_success=0.9, grasp_success=0.9,
+                 slip_probability=0.3, force_detect_success=0.9, object_position=(1, 2, 3),
+                 grasp_offset_z=0.1, seed=None, quiet=True):
+        """
+        Args:
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            object_position (tuple[float, float, float]): initial position of the object
+            grasp_offset_z (float): the grasp offset of the manipulator, see MockManipulatorState
+            seed (int): seeds the drivers' random number generators, unseeded if None
+            quiet (bool): silence the prints of the world state in the manipulator driver
+        """
+        self.world_state = SharedWorldState(create=True)
+        seeds = [None] * 3 if seed is None else [f"{seed}:{device}" for device in range(3)]
+        self._processes = []
+        self._connections = []
+        try:
+            manipulator_connection = self._start(
+                _run_manipulator_driver, self.world_state.name, object_position, slip_probability,
+                grasp_success, move_success, grasp_offset_z, seeds[0], quiet)
+            detector_connection = self._start(
+                _run_sensor_driver, self.world_state.name, "object_detector", object_detect_success, seeds[1])
+            force_connection = self._start(
+                _run_sensor_driver, self.world_state.name, "force_sensor", force_detect_success, seeds[2])
+        except BaseException:
+            self.close()
+            raise
+        self.manipulator = RemoteManipulator(manipulator_connection, self.world_state, grasp_offset_z)
+        self.object_detector = RemoteObjectDetector(detector_connection)
+        self.force_sensor = RemoteForceFeedbackSensor(force_connection)
+
+    def _start(self, target, *args):
+        """Starts a driver process and waits until it is ready, returns the pipe to it."""
+        connection, driver_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=target, args=(driver_connection, *args), daemon=True)
+        process.start()
+        self._processes.append(process)
+        self._connections.append(connection)
+        connection.recv()
+        return connection
+
+    def close(self) -> None:
+        """Stops the driver processes and destroys the shared block."""
+        for connection in self._connections:
+            with contextlib.suppress(OSError):
+                connection.send(None)
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+        for connection in self._connections:
+            connection.close()
+        self._processes = []
+        self._connections = []
+        if self.world_state is not None:
+            self.world_state.close()
+            self.world_state.unlink()
+            self.world_state = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
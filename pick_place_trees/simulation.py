@@ -0,0 +1,158 @@
+import contextlib
+import io
+
+import py_trees
+from py_trees.blackboard import Blackboard
+
+from .mock_manipulator import MockManipulator, MockManipulatorState
+from .mock_object_detector import MockObjectDetector
+from .mock_force_feedback_sensor import MockForceFeedbackSensor
+from .world_state import WorldState
+
+from .behavior_tree import create_pickup_tree
+from .compiled_tree import FAILURE, SUCCESS, compile_tree
+
+# Attributes making up the state of the simulated world, see get_state()
+WORLD_STATE_FIELDS = ("_object_position", "_holding_object", "_manipulator_state_to_object", "_simulate_object_slip")
+MANIPULATOR_STATE_FIELDS = ("endeffector_position", "gripper_closed")
+
+# The mocks drawing random events, by their attribute name in PickupSimulation, see device_rngs
+DEVICES = ("object_detector", "manipulator", "world_state", "force_sensor")
+
+
+class _Discard(io.TextIOBase):
+    """A text stream that drops everything written to it."""
+    def write(self, text: str) -> int:
+        return len(text)
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silences py_trees logging and the debug prints of the mocks, e.g. while running many episodes.
+    The output is discarded rather than buffered, so that long runs do not accumulate it.
+    """
+    level = py_trees.logging.level
+    py_trees.logging.level = py_trees.logging.Level.ERROR
+    try:
+        with contextlib.redirect_stdout(_Discard()):
+            yield
+    finally:
+        py_trees.logging.level = level
+
+
+class PickupSimulation:
+    """
+    The mocks, the world and a compiled pickup tree, set up like in run_behavior_tree.main(),
+    for running many episodes without printing or sleeping in-between ticks.
+
+    An episode corresponds to run_tree() with max_num_runs=1: the tree is ticked until the root
+    succeeds or fails. Every episode starts from the state the simulation was created in.
+    """
+    def __init__(self, object_detect_success=0.8, move_success=0.9, grasp_success=0.9,
+                 slip_probability=0.3, force_detect_success=0.9, rng=None,
+                 tree_factory=create_pickup_tree, object_position=(1, 2, 3), compiler=compile_tree,
+                 device_rngs=None, tree_rng=None):
+        """
+        Args:
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            rng (random.Random): source of randomness shared by all mocks, the random module is used if None.
+            tree_factory (callable): creates the tree from (manipulator, object_detector, force_sensor),
+                e.g. create_pickup_tree
+            object_position (tuple[float, float, float]): initial position of the object
+            compiler (callable): lowers the tree, e.g. compile_tree or incremental.compile_incremental
+            device_rngs (dict[str, random.Random]): sources of randomness of single mocks by name (see
+                DEVICES), used instead of rng for them, e.g. to give every mock a stream of its own
+            tree_rng (random.Random): passed to tree_factory as rng if given, e.g. for the exploration
+                of create_pickup_tree's adaptive recovery
+        """
+        self.rng = rng
+        rngs = {device: rng for device in DEVICES}
+        rngs.update(device_rngs or {})
+        self.manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+        self.world_state = WorldState(
+            manipulator_state=self.manipulator_state,
+            object_slip_probability=slip_probability,
+            object_position=object_position,
+            rng=rngs["world_state"])
+        self.manipulator = MockManipulator(
+            state=self.manipulator_state,
+            world_state=self.world_state,
+            grasp_success_rate=grasp_success,
+            move_success_rate=move_success,
+            rng=rngs["manipulator"])
+        self.object_detector = MockObjectDetector(
+            world_state=self.world_state, detection_success=object_detect_success, rng=rngs["object_detector"])
+        self.force_sensor = MockForceFeedbackSensor(
+            manipulator_state=self.manipulator_state,
+            world_state=self.world_state,
+            detection_success=force_detect_success,
+            rng=rngs["force_sensor"])
+
+        if tree_rng is None:
+            self.root = tree_factory(self.manipulator, self.object_detector, self.force_sensor)
+        else:
+            self.root = tree_factory(self.manipulator, self.object_detector, self.force_sensor, rng=tree_rng)
+        self.tree = compiler(self.root)
+        self.tree.setup(15)
+        self.blackboard_keys = sorted({
+            key
+            for node in self.tree.nodes
+            for client in getattr(node, "blackboards", [])
+            for key in client.remappings.values()})
+        self.initial_state = self.get_state()
+
+    def get_state(self) -> tuple:
+        """
+        Captures the tree, world, manipulator and blackboard state as a hashable tuple.
+        """
+        return (
+            self.tree.get_state(),
+            tuple(getattr(self.world_state, field) for field in WORLD_STATE_FIELDS),
+            tuple(getattr(self.manipulator_state, field) for field in MANIPULATOR_STATE_FIELDS),
+            tuple(Blackboard.storage.get(key) for key in self.blackboard_keys),
+        )
+
+    def set_state(self, state: tuple) -> None:
+        """
+        Restores a state captured by get_state().
+        """
+        tree_state, world_values, manipulator_values, blackboard_values = state
+        self.tree.set_state(tree_state)
+        for field, value in zip(WORLD_STATE_FIELDS, world_values):
+            setattr(self.world_state, field, value)
+        for field, value in zip(MANIPULATOR_STATE_FIELDS, manipulator_values):
+            setattr(self.manipulator_state, field, value)
+        for key, value in zip(self.blackboard_keys, blackboard_values):
+            Blackboard.storage[key] = value
+
+    def reset(self) -> None:
+        """Restores the state the simulation was created in."""
+        self.set_state(self.initial_state)
+
+    def run_episode(self, max_ticks=None) -> tuple[bool, int]:
+        """
+        Resets the simulation and ticks the tree until the root succeeds or fails.
+
+        Args:
+            max_ticks (int): stop after this many ticks (counted as failure), unlimited if None
+
+        Returns:
+            tuple[bool, int]: whether the task succeeded, and the number of ticks it took.
+        """
+        self.reset()
+        tree = self.tree
+        status = tree.status
+        ticks = 0
+        while max_ticks is None or ticks < max_ticks:
+            tree.tick()
+            ticks += 1
+            if status[0] == SUCCESS:
+                return True, ticks
+            if status[0] == FAILURE:
+                return False, ticks
+        return False, ticks
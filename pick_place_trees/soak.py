@@ -0,0 +1,349 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from .abort import LatencyHistogram
+from .behavior_tree import create_pickup_tree, release_tree, run_tree
+from .mock_force_feedback_sensor import MockForceFeedbackSensor
+from .mock_manipulator import MockManipulator, MockManipulatorState
+from .mock_object_detector import MockObjectDetector
+from .simulation import quiet
+from .world_state import WorldState
+
+MIB = 1024 * 1024
+TRACEBACK_FRAMES = 4  # frames traced per allocation, to find the subsystem that made it
+
+
+def resident_set_size() -> int:
+    """
+    Resident set size of the process in bytes. Where /proc is not available, the peak resident set
+    size is returned instead, which still grows with the memory. 0 if neither is available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def subsystem(filename: str) -> str:
+    """
+    The subsystem an allocation belongs to, from the file it was made in: "py_trees.<module>",
+    "pick_place_trees.<module>", or "other" for the standard library and everything else.
+    """
+    parts = filename.replace("\\", "/").split("/")
+    for package in ("pick_place_trees", "py_trees"):
+        if package in parts[:-1]:
+            return f"{package}.{os.path.splitext(parts[-1])[0]}"
+    return "other"
+
+
+def memory_by_subsystem(snapshot: tracemalloc.Snapshot) -> dict:
+    """
+    Sums the traced memory of a snapshot by subsystem(), in bytes. An allocation counts for the
+    innermost frame of its traceback that belongs to a subsystem, so that e.g. the uuids of the
+    blackboard clients count for py_trees.blackboard rather than for the uuid module.
+    """
+    sizes = {}
+    for statistic in snapshot.statistics("traceback"):
+        name = "other"
+        for frame in reversed(statistic.traceback):  # innermost first
+            name = subsystem(frame.filename)
+            if name != "other":
+                break
+        sizes[name] = sizes.get(name, 0) + statistic.size
+    return sizes
+
+
+class TickLatencyMonitor:
+    """
+    Records the duration of every tick of the trees it is attached to, including the tick handlers
+    that were added before it (e.g. the tree rendering of run_tree()), in windows.
+    """
+    def __init__(self, clock=time.perf_counter):
+        """
+        Args:
+            clock (callable): returns the current time in seconds
+        """
+        self._clock = clock
+        self._started = 0.0
+        self.histogram = LatencyHistogram()
+
+    def attach(self, tree) -> None:
+        """Adds the pre and post tick handlers measuring the ticks of a py_trees or compiled tree."""
+        tree.add_pre_tick_handler(self._begin_tick)
+        tree.add_post_tick_handler(self._end_tick)
+
+    def _begin_tick(self, tree) -> None:
+        self._started = self._clock()
+
+    def _end_tick(self, tree) -> None:
+        self.histogram.record(self._clock() - self._started)
+
+    def next_window(self) -> LatencyHistogram:
+        """Returns the latencies since the previous call and starts a new window."""
+        histogram = self.histogram
+        self.histogram = LatencyHistogram()
+        return histogram
+
+
+class DriftThresholds:
+    """How far a soak may drift from its first sample before it fails."""
+    def __init__(self, rss_growth=32 * MIB, traced_growth=4 * MIB, p50_drift=1.5, p99_drift=2.0):
+        """
+        Args:
+            rss_growth (int): maximum growth of the resident set size in bytes
+            traced_growth (int): maximum growth of the memory traced by tracemalloc in bytes
+            p50_drift (float): maximum ratio of the median tick latency of a window to the first one
+            p99_drift (float): maximum ratio of the 99th percentile tick latency of a window to the first one
+        """
+        self.rss_growth = rss_growth
+        self.traced_growth = traced_growth
+        self.p50_drift = p50_drift
+        self.p99_drift = p99_drift
+
+
+class SoakSample:
+    """Memory and tick latencies after a window of cycles."""
+    def __init__(self, cycles: int, elapsed: float, successes: int, ticks: int, rss: int, traced: int,
+                 p50: float, p99: float, subsystems: dict):
+        self.cycles = cycles
+        self.elapsed = elapsed
+        self.successes = successes
+        self.ticks = ticks
+        self.rss = rss
+        self.traced = traced  # None without tracemalloc
+        self.p50 = p50
+        self.p99 = p99
+        self.subsystems = subsystems
+
+    def to_dict(self, top=8) -> dict:
+        """The sample as written to the time series, with the top subsystems by traced memory."""
+        largest = sorted(self.subsystems.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {"cycles": self.cycles, "elapsed": round(self.elapsed, 3), "successes": self.successes,
+                "ticks": self.ticks, "rss": self.rss, "traced": self.traced, "p50": self.p50, "p99": self.p99,
+                "subsystems": dict(largest)}
+
+    def __str__(self):
+        traced = f", traced {self.traced / MIB:.2f} MiB" if self.traced is not None else ""
+        return (f"{self.cycles} cycles in {self.elapsed:.0f} s: {self.successes} succeeded, rss {self.rss / MIB:.1f} MiB"
+                f"{traced}, tick p50 {self.p50 * 1e6:.0f} us p99 {self.p99 * 1e6:.0f} us")
+
+
+class SoakReport:
+    """The samples of a soak, and the drift violations that failed it."""
+    def __init__(self, samples: list, violations: list):
+        self.samples = samples
+        self.violations = violations
+
+    @property
+    def passed(self) -> bool:
+        return not self.violations
+
+    def growth_by_subsystem(self) -> dict:
+        """Traced memory growth from the first to the last sample by subsystem, largest first."""
+        if len(self.samples) < 2:
+            return {}
+        first, last = self.samples[0].subsystems, self.samples[-1].subsystems
+        growth = {name: last.get(name, 0) - first.get(name, 0) for name in set(first) | set(last)}
+        return dict(sorted(growth.items(), key=lambda item: item[1], reverse=True))
+
+    def __str__(self):
+        lines = [str(self.samples[-1])] if self.samples else []
+        growth = [f"{name} {size / 1024:+.0f} KiB" for name, size in self.growth_by_subsystem().items() if size]
+        if growth:
+            lines.append(f"traced growth: {', '.join(growth[:5])}")
+        lines.append("PASSED" if self.passed else "FAILED: " + "; ".join(self.violations))
+        return "\n".join(lines)
+
+
+class SoakRunner:
+    """
+    Runs pick-and-place cycles with run_tree() for a long time and checks that memory and tick
+    latency stay flat.
+
+    Every cycle puts the object back at the pickup position and runs the tree once like
+    run_behavior_tree, i.e. through py_trees with the tree rendering after every tick, but without
+    waiting in-between ticks and with the output discarded. The tree is reused for all cycles, or
+    created anew for every cycle (and released with release_tree() afterwards, unless release is False).
+
+    After every window of sample_interval cycles, the resident set size, the memory traced by
+    tracemalloc by subsystem and the median and 99th percentile tick latency of the window are
+    sampled and appended to the time series file, as JSON lines. The first sample is the baseline:
+    the soak fails, and stops, as soon as a sample drifts from it by more than the thresholds.
+
+        report = SoakRunner(output="soak.jsonl").run(1000000, progress=print)
+        print(report)
+    """
+    def __init__(self, sample_interval=10000, rebuild=False, release=True, trace_memory=True,
+                 thresholds=None, output=None, object_detect_success=0.8, move_success=0.9, grasp_success=0.9,
+                 slip_probability=0.3, force_detect_success=0.9, seed=0, tree_factory=create_pickup_tree,
+                 pickup_position=(1, 2, 3)):
+        """
+        Args:
+            sample_interval (int): cycles per window
+            rebuild (bool): create a new tree for every cycle
+            release (bool): release the trees created for every cycle
+            trace_memory (bool): trace the allocations with tracemalloc, which slows the cycles down
+            thresholds (DriftThresholds): the allowed drift, the defaults if None
+            output (str): file to write the samples to, as JSON lines
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            seed (int): seed of the mocks
+            tree_factory (callable): creates the tree from (manipulator, object_detector, force_sensor)
+            pickup_position (tuple[float, float, float]): where the object is put for every cycle
+        """
+        self.sample_interval = sample_interval
+        self.rebuild = rebuild
+        self.release = release
+        self.trace_memory = trace_memory
+        self.thresholds = thresholds if thresholds is not None else DriftThresholds()
+        self.output = output
+        self.tree_factory = tree_factory
+        self.pickup_position = pickup_position
+        rng = random.Random(seed)
+        self.manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+        self.world_state = WorldState(manipulator_state=self.manipulator_state,
+                                      object_slip_probability=slip_probability,
+                                      object_position=pickup_position, rng=rng)
+        self.manipulator = MockManipulator(state=self.manipulator_state, world_state=self.world_state,
+                                           grasp_success_rate=grasp_success, move_success_rate=move_success, rng=rng)
+        self.object_detector = MockObjectDetector(world_state=self.world_state,
+                                                  detection_success=object_detect_success, rng=rng)
+        self.force_sensor = MockForceFeedbackSensor(manipulator_state=self.manipulator_state,
+                                                    world_state=self.world_state,
+                                                    detection_success=force_detect_success, rng=rng)
+        self.monitor = TickLatencyMonitor()
+        self._root = None if rebuild else self._create_tree()
+
+    def _create_tree(self):
+        return self.tree_factory(self.manipulator, self.object_detector, self.force_sensor)
+
+    def _run_cycle(self) -> bool:
+        root = self._root if self._root is not None else self._create_tree()
+        success = run_tree(root, self.world_state, tick_period=0.0, tick_monitor=self.monitor)
+        # open the gripper and put the object (back) at the pickup position for the next cycle
+        self.manipulator_state.gripper_closed = False
+        self.world_state.update_holding_object()
+        self.world_state.object_position = self.pickup_position
+        if self._root is None and self.release:
+            release_tree(root)
+        return success
+
+    def _sample(self, cycles, elapsed, successes) -> SoakSample:
+        gc.collect()
+        window = self.monitor.next_window()
+        traced, subsystems = None, {}
+        if self.trace_memory:
+            # without the allocations of tracemalloc and of the samples kept here
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+            subsystems = memory_by_subsystem(snapshot)
+            traced = sum(subsystems.values())
+        return SoakSample(cycles, elapsed, successes, window.count, resident_set_size(), traced,
+                          window.quantile(0.5), window.quantile(0.99), subsystems)
+
+    def _check(self, baseline: SoakSample, sample: SoakSample) -> list:
+        """Returns the violations of the thresholds by a sample."""
+        thresholds = self.thresholds
+        violations = []
+        if baseline.rss and sample.rss - baseline.rss > thresholds.rss_growth:
+            violations.append(f"rss grew by {(sample.rss - baseline.rss) / MIB:.1f} MiB "
+                              f"after {sample.cycles} cycles")
+        if baseline.traced is not None and sample.traced - baseline.traced > thresholds.traced_growth:
+            violations.append(f"traced memory grew by {(sample.traced - baseline.traced) / MIB:.2f} MiB "
+                              f"after {sample.cycles} cycles")
+        if baseline.p50 > 0 and sample.p50 / baseline.p50 > thresholds.p50_drift:
+            violations.append(f"tick p50 drifted to {sample.p50 / baseline.p50:.2f}x after {sample.cycles} cycles")
+        if baseline.p99 > 0 and sample.p99 / baseline.p99 > thresholds.p99_drift:
+            violations.append(f"tick p99 drifted to {sample.p99 / baseline.p99:.2f}x after {sample.cycles} cycles")
+        return violations
+
+    def run(self, cycles: int, progress=None) -> SoakReport:
+        """
+        Runs cycles, until the drift exceeds the thresholds.
+
+        Args:
+            cycles (int): number of cycles
+            progress (callable): called with every sample
+
+        Returns:
+            SoakReport: the samples and the violations.
+        """
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEBACK_FRAMES)
+        output = open(self.output, "w") if self.output else None
+        samples, violations = [], []
+        successes = 0
+        began = time.perf_counter()
+        try:
+            done = 0
+            while done < cycles and not violations:
+                window = min(self.sample_interval, cycles - done)
+                with quiet():
+                    for _ in range(window):
+                        successes += self._run_cycle()
+                done += window
+                sample = self._sample(done, time.perf_counter() - began, successes)
+                samples.append(sample)
+                if output is not None:
+                    output.write(json.dumps(sample.to_dict()) + "\n")
+                    output.flush()
+                if progress is not None:
+                    progress(sample)
+                violations = self._check(samples[0], sample)
+        finally:
+            if output is not None:
+                output.close()
+            if started_tracing:
+                tracemalloc.stop()
+        return SoakReport(samples, violations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run pick-and-place cycles for a long time, checking memory and tick latency drift.")
+    parser.add_argument('--cycles', type=int, default=1000000, help="Number of pick-and-place cycles")
+    parser.add_argument('--sample-interval', type=int, default=10000, help="Cycles between samples")
+    parser.add_argument('--output', default=None, help="Time series file (JSON lines), none is written if not given")
+    parser.add_argument('--rebuild', action='store_true', help="Create a new tree for every cycle")
+    parser.add_argument('--no-release', action='store_true', help="Do not release the trees created for every cycle")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="Only sample the resident set size")
+    parser.add_argument('--max-rss-growth', type=float, default=32.0, help="Allowed resident set size growth in MiB")
+    parser.add_argument('--max-traced-growth', type=float, default=4.0, help="Allowed traced memory growth in MiB")
+    parser.add_argument('--max-p50-drift', type=float, default=1.5, help="Allowed ratio of the median tick latency")
+    parser.add_argument('--max-p99-drift', type=float, default=2.0, help="Allowed ratio of the p99 tick latency")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the mocks")
+    args = parser.parse_args(argv)
+
+    runner = SoakRunner(
+        sample_interval=args.sample_interval,
+        rebuild=args.rebuild,
+        release=not args.no_release,
+        trace_memory=not args.no_tracemalloc,
+        thresholds=DriftThresholds(rss_growth=args.max_rss_growth * MIB, traced_growth=args.max_traced_growth * MIB,
+                                   p50_drift=args.max_p50_drift, p99_drift=args.max_p99_drift),
+        output=args.output,
+        seed=args.seed)
+    report = runner.run(args.cycles, progress=print)
+    print(report)
+    if not report.passed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
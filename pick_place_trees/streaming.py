@@ -0,0 +1,274 @@
+import argparse
+import collections
+import math
+import random
+
+from .abort import LatencyHistogram
+from .behavior_tree import create_pickup_tree
+from .compiled_tree import FAILURE, SUCCESS
+from .simulation import PickupSimulation, quiet
+
+
+def poisson_arrivals(rate: float, rng=None):
+    """
+    Arrival times of parts in seconds, with exponentially distributed gaps.
+
+    Args:
+        rate (float): mean number of parts per second
+        rng (random.Random): source of randomness, the random module is used if None
+    """
+    rng = rng if rng is not None else random
+    time = 0.0
+    while True:
+        time += rng.expovariate(rate)
+        yield time
+
+
+def conveyor_arrivals(period: float, jitter=0.0, rng=None):
+    """
+    Arrival times of parts in seconds, one every period, e.g. from a conveyor belt.
+
+    Args:
+        period (float): seconds between two parts
+        jitter (float): every arrival is shifted by up to +-jitter seconds, without overtaking the previous one
+        rng (random.Random): source of randomness for the jitter, the random module is used if None
+    """
+    rng = rng if rng is not None else random
+    previous = 0.0
+    count = 1
+    while True:
+        time = count * period
+        if jitter:
+            time = max(previous, time + rng.uniform(-jitter, jitter))
+        previous = time
+        count += 1
+        yield time
+
+
+class StreamStatistics:
+    """Statistics of a stream of parts over the simulated time, in constant memory."""
+    def __init__(self):
+        self.elapsed = 0.0
+        self.busy_time = 0.0
+        self.queue_area = 0.0  # integral of the queue length over time
+        self.max_queue = 0
+        self.arrived = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.ticks = 0
+        self.latency = LatencyHistogram()  # from arrival until the part was placed
+        self.service_time = LatencyHistogram()  # from the start of the pickup until the part was placed
+
+    @property
+    def throughput(self) -> float:
+        """Placed parts per second."""
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Fraction of the time the tree was running."""
+        return self.busy_time / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mean_queue_length(self) -> float:
+        """Time-averaged number of parts waiting to be picked."""
+        return self.queue_area / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"{self.elapsed:.0f} s: {self.arrived} arrived, {self.completed} placed, {self.failed} failed, "
+                f"{self.dropped} dropped; throughput {self.throughput * 3600:.1f} parts/h, "
+                f"utilization {self.utilization:.1%}, queue mean {self.mean_queue_length:.2f} max {self.max_queue}, "
+                f"latency mean {self.latency.mean:.2f} s p50 {self.latency.quantile(0.5):.2f} s "
+                f"p99 {self.latency.quantile(0.99):.2f} s")
+
+
+class StreamingSimulation:
+    """
+    Runs the pickup tree continuously on a stream of parts, on a virtual clock.
+
+    Parts arrive at the pickup position according to an arrival process (a generator of arrival times,
+    e.g. poisson_arrivals() or conveyor_arrivals()) and wait in a queue of limited capacity, parts
+    arriving at a full queue are dropped. Whenever the manipulator is free, the next part is put at the
+    pickup position and the tree is ticked until it has placed the part and moved home (or failed, in
+    which case the part is removed from the cell), and is then re-armed for the next part. Every tick
+    takes tick_period seconds, while waiting for parts the clock jumps to the next arrival.
+
+        simulation = StreamingSimulation(poisson_arrivals(0.5, random.Random(1)))
+        print(simulation.run(3600))
+    """
+    def __init__(self, arrivals, tick_period=0.1, queue_capacity=100, object_detect_success=0.8,
+                 move_success=0.9, grasp_success=0.9, slip_probability=0.3, force_detect_success=0.9,
+                 rng=None, tree_factory=create_pickup_tree, pickup_position=(1, 2, 3)):
+        """
+        Args:
+            arrivals (iterator[float]): increasing arrival times of the parts in seconds
+            tick_period (float): seconds per tick
+            queue_capacity (int): maximum number of parts waiting to be picked
+            object_detect_success(float): probability [0..1] that object detection succeeds
+            move_success(float): probability [0..1] that moving the manipulator end effector succeeds
+            grasp_success(float): probability [0..1] that grasping the object succeeds (it may still slip!)
+            slip_probability(float): probability [0..1] that object slips from the gripper
+            force_detect_success(float): probability [0..1] that the force feedback sensor succeeds
+            rng (random.Random): source of randomness shared by all mocks, the random module is used if None
+            tree_factory (callable): creates the tree from (manipulator, object_detector, force_sensor)
+            pickup_position (tuple[float, float, float]): where the parts arrive
+        """
+        self.simulation = PickupSimulation(
+            object_detect_success=object_detect_success,
+            move_success=move_success,
+            grasp_success=grasp_success,
+            slip_probability=slip_probability,
+            force_detect_success=force_detect_success,
+            rng=rng,
+            tree_factory=tree_factory,
+            object_position=pickup_position)
+        self.tick_period = tick_period
+        self.queue_capacity = queue_capacity
+        self.pickup_position = pickup_position
+        self.now = 0.0
+        self.statistics = StreamStatistics()
+        self._arrivals = iter(arrivals)
+        self._next_arrival = self._next_arrival_time()
+        self._queue = collections.deque()  # arrival times of the waiting parts
+        self._part = None  # arrival time of the part being picked
+        self._service_start = 0.0
+
+    def _next_arrival_time(self) -> float:
+        return next(self._arrivals, math.inf)
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._queue)
+
+    @property
+    def busy(self) -> bool:
+        """Whether a part is being picked and placed."""
+        return self._part is not None
+
+    def _advance(self, seconds: float) -> None:
+        self.statistics.queue_area += len(self._queue) * seconds
+        self.statistics.elapsed += seconds
+        self.now += seconds
+
+    def _admit_arrivals(self) -> None:
+        statistics = self.statistics
+        while self._next_arrival <= self.now:
+            statistics.arrived += 1
+            if len(self._queue) < self.queue_capacity:
+                self._queue.append(self._next_arrival)
+                statistics.max_queue = max(statistics.max_queue, len(self._queue))
+            else:
+                statistics.dropped += 1
+            self._next_arrival = self._next_arrival_time()
+
+    def _load_part(self) -> None:
+        self._part = self._queue.popleft()
+        self._service_start = self.now
+        self.simulation.world_state.object_position = self.pickup_position
+
+    def _clear_cell(self) -> None:
+        """Removes a part that could not be placed, and opens the gripper."""
+        self.simulation.manipulator_state.gripper_closed = False
+        self.simulation.world_state.update_holding_object()
+
+    def _finish_part(self, placed: bool) -> None:
+        statistics = self.statistics
+        if placed:
+            statistics.completed += 1
+            statistics.latency.record(self.now - self._part)
+            statistics.service_time.record(self.now - self._service_start)
+        else:
+            statistics.failed += 1
+            self._clear_cell()
+        self._part = None
+
+    def run(self, duration: float, report_interval=None, progress=None) -> StreamStatistics:
+        """
+        Simulates the stream for a duration, continuing where the previous run() stopped.
+
+        Args:
+            duration (float): seconds to simulate
+            report_interval (float): seconds between calls of progress, no reports if None
+            progress (callable): called with the statistics every report_interval seconds, no reports if None
+
+        Returns:
+            StreamStatistics: the statistics since the start of the stream.
+        """
+        end = self.now + duration
+        next_report = self.now + report_interval if report_interval and progress is not None else math.inf
+        while self.now < end:
+            with quiet():
+                self._simulate(min(end, next_report))
+            if self.now >= next_report:
+                progress(self.statistics)
+                next_report += report_interval
+        return self.statistics
+
+    def _simulate(self, end: float) -> None:
+        tree = self.simulation.tree
+        status = tree.status
+        statistics = self.statistics
+        while self.now < end:
+            self._admit_arrivals()
+            if self._part is None:
+                if not self._queue:
+                    self._advance(min(self._next_arrival, end) - self.now)
+                else:
+                    self._load_part()
+            else:
+                tree.tick()
+                statistics.ticks += 1
+                statistics.busy_time += self.tick_period
+                self._advance(self.tick_period)
+                if status[0] == SUCCESS or status[0] == FAILURE:
+                    self._finish_part(status[0] == SUCCESS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the pickup task on a stream of arriving parts.")
+    parser.add_argument('--arrivals', choices=["poisson", "conveyor"], default="poisson",
+                        help="Arrival process of the parts")
+    parser.add_argument('--rate', type=float, default=1.0, help="Parts per second of the poisson arrivals")
+    parser.add_argument('--period', type=float, default=1.0, help="Seconds between parts on the conveyor")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Jitter of the conveyor arrivals in seconds")
+    parser.add_argument('--duration', type=float, default=8 * 3600.0, help="Seconds to simulate")
+    parser.add_argument('--tick-period', type=float, default=0.1, help="Seconds per tick")
+    parser.add_argument('--queue-capacity', type=int, default=100, help="Maximum number of waiting parts")
+    parser.add_argument('--report-interval', type=float, default=3600.0, help="Seconds between reports")
+    parser.add_argument('--object-detect', type=float, default=0.8,
+                        help="Object detection success probability, [0.0..1.0]")
+    parser.add_argument('--move', type=float, default=0.9,
+                        help="Manipulator moving success probability, [0.0..1.0]")
+    parser.add_argument('--grasp', type=float, default=0.9,
+                        help="Manipulator grasp success probability, [0.0..1.0]")
+    parser.add_argument('--slip', type=float, default=0.3,
+                        help="Probability for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--force-detect', type=float, default=0.9,
+                        help="Force-feedback detection success probability, [0.0..1.0]")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the arrivals and the mocks")
+    args = parser.parse_args(argv)
+
+    arrival_rng = random.Random(args.seed)
+    if args.arrivals == "poisson":
+        arrivals = poisson_arrivals(args.rate, arrival_rng)
+    else:
+        arrivals = conveyor_arrivals(args.period, args.jitter, arrival_rng)
+    simulation = StreamingSimulation(
+        arrivals,
+        tick_period=args.tick_period,
+        queue_capacity=args.queue_capacity,
+        object_detect_success=args.object_detect,
+        move_success=args.move,
+        grasp_success=args.grasp,
+        slip_probability=args.slip,
+        force_detect_success=args.force_detect,
+        rng=random.Random(args.seed + 1))
+    statistics = simulation.run(args.duration, report_interval=args.report_interval, progress=print)
+    print(f"Total: {statistics}")
+    print(f"Service time: mean {statistics.service_time.mean:.2f} s, p99 {statistics.service_time.quantile(0.99):.2f} s, "
+          f"{statistics.ticks} ticks")
+
+
+if __name__ == '__main__':
+    main()
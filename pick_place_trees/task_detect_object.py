@@ -1,15 +1,19 @@
 import py_trees
 
+from pick_place_trees.device_latency import DeviceTimeout, call_device
 from pick_place_trees.mock_object_detector import MockObjectDetector
 
 class DetectObject(py_trees.behaviour.Behaviour):
-    def __init__(self, name="Detect Object", object_detector: MockObjectDetector = None):
+    def __init__(self, name="Detect Object", object_detector: MockObjectDetector = None, namespace: str = None,
+                 timeout: float = None):
         super(DetectObject, self).__init__(name=name)
         self.logger.debug("%s.__init__()" % (self.__class__.__name__))
 
         self.key_object_pose = "object_pose"
         self.object_detector = object_detector
-        self.blackboard = self.attach_blackboard_client(name=self.__class__.__name__)
+        self.timeout = timeout  # deadline of a detection in seconds, see device_latency
+        self.timeouts = 0
+        self.blackboard = self.attach_blackboard_client(name=self.__class__.__name__, namespace=namespace)
         self.blackboard.register_key(key=self.key_object_pose, access=py_trees.common.Access.WRITE)
 
 
@@ -17,7 +21,13 @@ class DetectObject(py_trees.behaviour.Behaviour):
         """
         Detects an object in the environment and sets the object position if successful.
         """
-        position = self.object_detector.detect_object()
+        try:
+            position = call_device(self.object_detector.detect_object, timeout=self.timeout)
+        except DeviceTimeout:
+            self.timeouts += 1
+            self.blackboard.object_pose = None
+            self.logger.warning("Object detection timed out.")
+            return py_trees.common.Status.FAILURE
         if position is not None:
             self.blackboard.object_pose = position
             self.logger.info("Object detected at position: {}".format(position))
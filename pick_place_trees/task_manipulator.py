@@ -1,9 +1,13 @@
 import py_trees
 
+from pick_place_trees.device_latency import DeviceTimeout, call_device
 from pick_place_trees.mock_manipulator import MockManipulator
 
 class ManipulatorCalculatePosition(py_trees.behaviour.Behaviour):
-    def __init__(self, name="Calculate Pick Position", manipulator: MockManipulator = None, key_object_position: str = "", object_position: tuple[float, float, float] = None):
+    # Only computes the target from the object position, see incremental.IncrementalTree
+    pure = True
+
+    def __init__(self, name="Calculate Pick Position", manipulator: MockManipulator = None, key_object_position: str = "", object_position: tuple[float, float, float] = None, namespace: str = None):
         super(ManipulatorCalculatePosition, self).__init__(name=name)
         self.logger.debug("%s.__init__()" % (self.__class__.__name__))
 
@@ -12,7 +16,7 @@ class ManipulatorCalculatePosition(py_trees.behaviour.Behaviour):
         self.object_position = object_position
         self.manipulator = manipulator
 
-        self.blackboard = self.attach_blackboard_client(name=self.__class__.__name__)
+        self.blackboard = self.attach_blackboard_client(name=self.__class__.__name__, namespace=namespace)
         self.blackboard.register_key(key=self.key_manipulator_target_position, access=py_trees.common.Access.WRITE)
         if self.key_object_position != "":
             self.blackboard.register_key(key=self.key_object_position, access=py_trees.common.Access.READ)
@@ -36,16 +40,18 @@ class ManipulatorCalculatePosition(py_trees.behaviour.Behaviour):
 
 
 class ManipulatorMoveToPosition(py_trees.behaviour.Behaviour):
-    def __init__(self, name="Move to Position", manipulator: MockManipulator = None, key_target_pose: str = "", target_position: tuple[float, float, float] = None):
+    def __init__(self, name="Move to Position", manipulator: MockManipulator = None, key_target_pose: str = "", target_position: tuple[float, float, float] = None, namespace: str = None, timeout: float = None):
         super(ManipulatorMoveToPosition, self).__init__(name=name)
         self.logger.debug("%s.__init__()" % (self.__class__.__name__))
         
         self.manipulator = manipulator
         self.key_target_pose = key_target_pose
         self.target_position = target_position
+        self.timeout = timeout  # deadline of a move in seconds, see device_latency
+        self.timeouts = 0
 
         if self.key_target_pose != "":
-            self.blackboard = self.attach_blackboard_client(name=self.__class__.__name__)
+            self.blackboard = self.attach_blackboard_client(name=self.__class__.__name__, namespace=namespace)
             self.blackboard.register_key(key=self.key_target_pose, access=py_trees.common.Access.READ)
 
     def update(self) -> py_trees.common.Status:
@@ -58,7 +64,13 @@ class ManipulatorMoveToPosition(py_trees.behaviour.Behaviour):
         else:
             target_position = getattr(self.blackboard, self.key_target_pose, None)
 
-        if self.manipulator.move_to_position(target_position=target_position):
+        try:
+            moved = call_device(self.manipulator.move_to_position, target_position, timeout=self.timeout)
+        except DeviceTimeout:
+            self.timeouts += 1
+            self.logger.warning(f"Manipulator move to target position timed out: [{target_position}]")
+            return py_trees.common.Status.FAILURE
+        if moved:
             self.logger.info(f"Manipulator moved to target position: [{target_position}]")
             return py_trees.common.Status.SUCCESS
 
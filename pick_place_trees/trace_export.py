@@ -0,0 +1,207 @@
+import argparse
+import json
+import random
+import time
+
+import py_trees
+from py_trees.common import Status
+
+from .simulation import PickupSimulation, quiet
+
+
+class VirtualClock:
+    """
+    A deterministic clock for reproducible traces: every reading advances it by `step` seconds, so
+    events keep their order, and advance() models time passing, e.g. between ticks.
+    """
+    def __init__(self, step=1e-6):
+        self._time = 0.0
+        self._step = step
+
+    def __call__(self) -> float:
+        now = self._time
+        self._time += self._step
+        return now
+
+    def advance(self, seconds: float) -> None:
+        self._time += seconds
+
+
+class TraceRecorder:
+    """
+    Records the execution of behavior tree episodes and writes it in the Chrome Trace Event format,
+    which can be opened in Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+    instrument() wraps the initialise()/update()/terminate() methods of every behaviour and the
+    tick() of every composite and decorator, to record their spans and status changes. attach()
+    records a span per tick of a BehaviourTree or CompiledTree. Events are buffered as tuples and only
+    formatted and written at the end of every episode, every episode being a process in the viewer:
+
+        recorder = TraceRecorder("trace.json")
+        recorder.instrument(root)
+        recorder.attach(tree)
+        ... tick an episode ...
+        recorder.end_episode()
+        recorder.close()
+
+    With a CompiledTree, only the spans of the leaves and of opaque nodes are recorded, as the
+    compiled composites and decorators do not call tick().
+    """
+    def __init__(self, path: str, clock=time.perf_counter):
+        """
+        Args:
+            path (str): the file to write
+            clock (callable): returns the current time in seconds, e.g. time.perf_counter or a VirtualClock
+        """
+        self._file = open(path, "w")
+        self._file.write("[\n")
+        self._separator = ""
+        self.clock = clock
+        self._events = []  # (phase, name, category, start, duration, args)
+        self._tick_start = None
+        self.episodes = 0
+
+    def _span(self, name, category, start, args=None) -> None:
+        self._events.append(("X", name, category, start, self.clock() - start, args))
+
+    def _status_change(self, node, old: Status, new: Status) -> None:
+        self._events.append(("i", f"{node.name} -> {new.name}", "status", self.clock(), 0,
+                             {"from": old.name, "to": new.name}))
+
+    def instrument(self, root: py_trees.behaviour.Behaviour) -> None:
+        """Wraps the methods of every behaviour in the tree of root to record spans and status changes."""
+        for node in root.iterate():
+            if node.children or isinstance(node, py_trees.decorators.Decorator):
+                self._wrap_tick(node)
+            else:
+                self._wrap_leaf(node)
+
+    def _wrap_leaf(self, node) -> None:
+        initialise, update, terminate = node.initialise, node.update, node.terminate
+        category = type(node).__name__
+
+        def traced_initialise():
+            start = self.clock()
+            initialise()
+            self._span(f"{node.name}.initialise", category, start)
+
+        def traced_update():
+            start = self.clock()
+            old = node.status
+            new = update()
+            self._span(f"{node.name}.update", category, start, {"status": getattr(new, "name", str(new))})
+            if new != old:
+                self._status_change(node, old, new)
+            return new
+
+        def traced_terminate(new_status):
+            start = self.clock()
+            terminate(new_status)
+            self._span(f"{node.name}.terminate", category, start, {"status": new_status.name})
+            if new_status == Status.INVALID and node.status != Status.INVALID:
+                self._status_change(node, node.status, new_status)
+
+        node.initialise, node.update, node.terminate = traced_initialise, traced_update, traced_terminate
+
+    def _wrap_tick(self, node) -> None:
+        tick = node.tick
+        category = type(node).__name__
+
+        def traced_tick():
+            start = self.clock()
+            old = node.status
+            for behaviour in tick():
+                # a node yields itself last, with its new status. Record it before the parent sees it: a
+                # parent stops pulling the generator once a child is RUNNING or FAILED
+                if behaviour is node:
+                    self._span(node.name, category, start, {"status": node.status.name})
+                    if node.status != old:
+                        self._status_change(node, old, node.status)
+                yield behaviour
+
+        node.tick = traced_tick
+
+    def attach(self, tree) -> None:
+        """Records a span for every tick of a BehaviourTree or CompiledTree."""
+        tree.add_pre_tick_handler(self._begin_tick)
+        tree.add_post_tick_handler(self._end_tick)
+
+    def _begin_tick(self, tree) -> None:
+        self._tick_start = self.clock()
+
+    def _end_tick(self, tree) -> None:
+        self._span(f"tick {tree.count}", "tick", self._tick_start)
+
+    def end_episode(self, name=None) -> None:
+        """
+        Writes the events of the episode and starts a new one.
+
+        Args:
+            name (str): label of the episode in the viewer, "Episode <number>" if None
+        """
+        pid = self.episodes
+        events = [{"ph": "M", "name": "process_name", "pid": pid, "tid": 0,
+                   "args": {"name": name if name is not None else f"Episode {pid}"}}]
+        for phase, event_name, category, start, duration, args in self._events:
+            event = {"ph": phase, "name": event_name, "cat": category, "pid": pid, "tid": 0, "ts": round(start * 1e6, 3)}
+            if phase == "X":
+                event["dur"] = round(duration * 1e6, 3)
+            else:
+                event["s"] = "t"
+            if args:
+                event["args"] = args
+            events.append(event)
+        for event in events:
+            self._file.write(self._separator + json.dumps(event))
+            self._separator = ",\n"
+        self._events.clear()
+        self.episodes += 1
+
+    def close(self) -> None:
+        """Writes the pending events and closes the file."""
+        if self._events:
+            self.end_episode()
+        self._file.write("\n]\n")
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Write a Chrome/Perfetto trace of pickup task episodes.")
+    parser.add_argument('--output', default="trace.json", help="The trace file to write")
+    parser.add_argument('--episodes', type=int, default=5, help="Number of episodes")
+    parser.add_argument('--slip', type=float, default=0.3,
+                        help="Probability for object to slip from gripper, [0.0..1.0]")
+    parser.add_argument('--seed', type=int, default=None, help="Seed of the mocks")
+    parser.add_argument('--tick-period', type=float, default=None,
+                        help="Use a virtual clock advancing by this many seconds per tick, instead of wall time")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    clock = time.perf_counter if args.tick_period is None else VirtualClock()
+    with TraceRecorder(args.output, clock=clock) as recorder, quiet():
+        # the py_trees tree rather than the compiled one, to see the composites' spans. It is reused for
+        # all episodes, so that no blackboard clients pile up in the py_trees registry
+        simulation = PickupSimulation(slip_probability=args.slip, rng=rng)
+        tree = py_trees.trees.BehaviourTree(simulation.root)
+        recorder.instrument(simulation.root)
+        recorder.attach(tree)
+        for episode in range(args.episodes):
+            simulation.reset()
+            first_tick = tree.count
+            tree.tick()
+            while simulation.root.status == Status.RUNNING:
+                if args.tick_period is not None:
+                    clock.advance(args.tick_period)
+                tree.tick()
+            recorder.end_episode(f"Episode {episode} ({simulation.root.status.name}, {tree.count - first_tick} ticks)")
+    print(f"Wrote {args.episodes} episodes to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import random
+import threading
 
 from .mock_manipulator import MockManipulatorState
 
@@ -13,7 +14,8 @@ class WorldState:
     def __init__(self,
                  manipulator_state: MockManipulatorState,
                  object_position: tuple[float, float, float] = (0,0,0),
-                 object_slip_probability = 0.3):
+                 object_slip_probability = 0.3,
+                 rng = None):
         """
         Initializes the world state.
 
@@ -22,6 +24,7 @@ class WorldState:
             object_position (tuple[float, float, float]): The iniital global position of the object.
             object_slip_probablility (float): the probability that a gripping action will not
                 fully succeed and the object will slip. 
+            rng (random.Random): source of randomness, the random module is used if None.
         """
         self._object_position = object_position
         self._manipulator_state = manipulator_state
@@ -31,6 +34,10 @@ class WorldState:
         # Sets the world is in a state in which the last grip action was unsuccessful and the
         # object slipped out of the gripper
         self._simulate_object_slip = False
+        self._rng = rng if rng is not None else random
+        # Guards the object state, which is changed by the manipulator and read by the sensors,
+        # possibly from different threads. Taken after the lock of the manipulator, never before it.
+        self._lock = threading.Lock()
 
     def _get_attached_object_position(self):
         """Return the manipulator position plus the _manipulator_to_object distance"""
@@ -53,9 +60,10 @@ class WorldState:
         Returns:
             tuple[float, float, float]: The 3D position of the object in the world.
         """
-        if self.holding_object:
-            return self._get_attached_object_position()
-        return self._object_position
+        with self._lock:
+            if self._holding_object:
+                return self._get_attached_object_position()
+            return self._object_position
 
     @object_position.setter
     def object_position(self, position: tuple[float, float, float]):
@@ -65,9 +73,10 @@ class WorldState:
         Args:
             position (tuple[float, float, float]): The 3D position of the object.
         """
-        if self._holding_object:
-            raise RuntimeError("Do not set the object position while the object is being held. If it has been released, call update_holding_object() first")
-        self._object_position = position
+        with self._lock:
+            if self._holding_object:
+                raise RuntimeError("Do not set the object position while the object is being held. If it has been released, call update_holding_object() first")
+            self._object_position = position
 
     @property
     def holding_object(self):
@@ -88,50 +97,51 @@ class WorldState:
 
         **Needs to be called at least every time the holding state could have changed!!!**
         """
-        is_gripped = self._manipulator_state.gripper_closed
+        with self._lock:
+            is_gripped = self._manipulator_state.gripper_closed
+
+            if self._holding_object:
+                # Object has already been registered as "held", check if it needs to be released
+                if not is_gripped:
+                    # Object needs to be released
+                    # update global object position
+                    self._object_position = self._get_attached_object_position()
+                    self._manipulator_state_to_object = None  # Reset relative position when not holding
+                    self._simulate_object_slip = False # reset slip simulation
+                    self._holding_object = False
+            else:
+                # Object is not already held: check whether it needs to be attached
+                in_grasppos = self._manipulator_state.is_object_within_grasp_offset(self._object_position)
+                if in_grasppos and is_gripped:
+                    # Object can potentially be attached. Either a gripping action has just taken place
+                    # or we are in the "object slip" simulation mode.
+                    if self._simulate_object_slip:
+                        # Slip simulation: do nothing until the gripper is opened and closed again (retry)
+                        return
+
+                    # A gripping action has just taken place, determine whether the object is held.
+                    slip = self._rng.random() < self._object_slip_probability
+                    if slip:
+                        # Enter the slipping simulation and don't attach the object
+                        self._simulate_object_slip = True
+                        return
+                    
+                    # Gripping was successful, attach the object
+                    assert(not self._manipulator_state_to_object) 
+                    # Calculate the relative position offset between manipulator and object
+                    # (needed to compute object position while moving)
+                    endeffector_position = self._manipulator_state.endeffector_position
+                    assert(endeffector_position)
+                    self._manipulator_state_to_object = tuple(
+                        self._object_position[i] - endeffector_position[i]
+                        for i in range(3)
+                    )
+                    self._holding_object = True
 
-        if self._holding_object:
-            # Object has already been registered as "held", check if it needs to be released
             if not is_gripped:
-                # Object needs to be released
-                # update global object position
-                self._object_position = self._get_attached_object_position()
-                self._manipulator_state_to_object = None  # Reset relative position when not holding
-                self._simulate_object_slip = False # reset slip simulation
-                self._holding_object = False
-        else:
-            # Object is not already held: check whether it needs to be attached
-            in_grasppos = self._manipulator_state.is_object_within_grasp_offset(self._object_position)
-            if in_grasppos and is_gripped:
-                # Object can potentially be attached. Either a gripping action has just taken place
-                # or we are in the "object slip" simulation mode.
-                if self._simulate_object_slip:
-                    # Slip simulation: do nothing until the gripper is opened and closed again (retry)
-                    return
-
-                # A gripping action has just taken place, determine whether the object is held.
-                slip = random.random() < self._object_slip_probability
-                if slip:
-                    # Enter the slipping simulation and don't attach the object
-                    self._simulate_object_slip = True
-                    return
-                    
-                # Gripping was successful, attach the object
-                assert(not self._manipulator_state_to_object) 
-                # Calculate the relative position offset between manipulator and object
-                # (needed to compute object position while moving)
-                endeffector_position = self._manipulator_state.endeffector_position
-                assert(endeffector_position)
-                self._manipulator_state_to_object = tuple(
-                    self._object_position[i] - endeffector_position[i]
-                    for i in range(3)
-                )
-                self._holding_object = True
-
-        if not is_gripped:
-            # Gripper is open, reset slip simulation
-            self._simulate_object_slip = False
-            print("Reset slip simulation (gripper open)")
+                # Gripper is open, reset slip simulation
+                self._simulate_object_slip = False
+                print("Reset slip simulation (gripper open)")
 
     def is_object_within_grasp_offset(self) -> bool:
         """
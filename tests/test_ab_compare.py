@@ -0,0 +1,56 @@
+import math
+import statistics
+import unittest
+
+from pick_place_trees.ab_compare import VARIANTS, ABComparison, PairedDifference
+from pick_place_trees.behavior_tree import create_pickup_tree
+
+
+class TestPairedDifference(unittest.TestCase):
+    def test_statistics(self):
+        baseline = [3, 5, 2, 8, 4]
+        variant = [2, 5, 1, 6, 4]
+        difference = PairedDifference("ticks")
+        for pair in zip(baseline, variant):
+            difference.add(*pair)
+        differences = [b - a for a, b in zip(baseline, variant)]
+        self.assertAlmostEqual(difference.mean, statistics.mean(differences))
+        self.assertAlmostEqual(difference.standard_error, statistics.stdev(differences) / math.sqrt(5))
+        self.assertAlmostEqual(difference.independent_standard_error,
+                               math.sqrt((statistics.variance(baseline) + statistics.variance(variant)) / 5))
+        low, high = difference.interval()
+        self.assertAlmostEqual(high - low, 2 * 1.96 * difference.standard_error)
+
+
+class TestABComparison(unittest.TestCase):
+    def test_identical_variants(self):
+        """Identical trees see identical device outcomes, so every pair of episodes is the same"""
+        comparison = ABComparison({"a": create_pickup_tree, "b": create_pickup_tree}, seed=1)
+        results = [comparison.run_episode() for _ in range(50)]
+        self.assertTrue(all(result["a"] == result["b"] for result in results))
+        self.assertGreater(len(set(result["a"] for result in results)), 1)
+        result, = comparison.run(200)
+        self.assertEqual((result.success.mean, result.success.standard_error), (0.0, 0.0))
+        self.assertEqual((result.ticks.mean, result.ticks.standard_error), (0.0, 0.0))
+
+    def test_identical_adaptive_variants(self):
+        """The exploration of the adaptive recovery draws from a common stream as well"""
+        adaptive = VARIANTS["adaptive"]
+        comparison = ABComparison({"a": adaptive, "b": adaptive}, slip_probability=0.7, seed=3)
+        results = [comparison.run_episode() for _ in range(200)]
+        self.assertTrue(all(result["a"] == result["b"] for result in results))
+
+    def test_variance_reduction(self):
+        """Common random numbers make the paired difference much more precise than independent episodes"""
+        result, = ABComparison(VARIANTS, seed=2).run(500)
+        self.assertGreater(result.success.variance_reduction, 4.0)
+        self.assertGreater(result.ticks.variance_reduction, 1.5)
+        self.assertLess(result.ticks.interval()[1], 0.0)  # adaptive recovery takes fewer ticks
+
+    def test_single_variant(self):
+        with self.assertRaises(ValueError):
+            ABComparison({"baseline": create_pickup_tree})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import contextlib
+import io
+import os
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+import py_trees
+from py_trees.common import Status
+
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.mock_object_detector import MockObjectDetector
+from pick_place_trees.mock_force_feedback_sensor import MockForceFeedbackSensor
+from pick_place_trees.world_state import WorldState
+
+from pick_place_trees.abort import AbortController, GRIPPER_OPEN, LatencyHistogram
+from pick_place_trees.behavior_tree import create_pickup_tree, run_tree
+from pick_place_trees.trace_export import TraceRecorder
+
+
+class RequestAbort(py_trees.behaviour.Behaviour):
+    """Leaf requesting an abort while it is executed"""
+    def __init__(self, name, abort):
+        super(RequestAbort, self).__init__(name=name)
+        self.abort = abort
+
+    def update(self):
+        self.abort.request("test")
+        return Status.SUCCESS
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        """Quantiles are upper bounds within one bucket (10 per decade) of the true value"""
+        histogram = LatencyHistogram()
+        for i in range(1, 101):
+            histogram.record(i / 1000)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.max, 0.1)
+        self.assertGreaterEqual(histogram.quantile(0.5), 0.05)
+        self.assertLessEqual(histogram.quantile(0.5), 0.05 * 10 ** 0.1)
+        self.assertAlmostEqual(histogram.quantile(1.0), 0.1)
+
+
+class TestAbort(unittest.TestCase):
+    def setUp(self):
+        self.manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+        self.world_state = WorldState(
+            manipulator_state=self.manipulator_state, object_slip_probability=0.0, object_position=(1, 2, 3))
+        self.manipulator = MockManipulator(
+            state=self.manipulator_state, world_state=self.world_state,
+            grasp_success_rate=1.0, move_success_rate=1.0, motion_duration=0.01)
+        self.object_detector = MockObjectDetector(world_state=self.world_state, detection_success=1.0)
+        self.force_sensor = MockForceFeedbackSensor(
+            manipulator_state=self.manipulator_state, world_state=self.world_state, detection_success=1.0)
+
+    def test_stop_cancels_motion(self):
+        """A move in progress is cancelled by stop() from another thread, and moves fail until resume()"""
+        manipulator = MockManipulator(state=self.manipulator_state, world_state=None,
+                                      move_success_rate=1.0, motion_duration=10.0)
+        threading.Timer(0.05, manipulator.stop).start()
+        start = time.perf_counter()
+        self.assertFalse(manipulator.move_to_position((1, 1, 1)))
+        self.assertLess(time.perf_counter() - start, 5.0)
+        self.assertIsNone(manipulator.endeffector_position)
+        self.assertFalse(manipulator.move_to_position((1, 1, 1)))
+
+        manipulator = MockManipulator(state=self.manipulator_state, world_state=None, move_success_rate=1.0)
+        manipulator.stop()
+        manipulator.resume()
+        self.assertTrue(manipulator.move_to_position((1, 1, 1)))
+
+    def test_preempts_between_leaves(self):
+        """No leaf is executed after the abort request, and all behaviours are stopped"""
+        abort = AbortController()
+        after = py_trees.behaviours.Success(name="After")
+        root = py_trees.composites.Sequence(name="Root", memory=False, children=[
+            RequestAbort("Request", abort), after])
+        tree = py_trees.trees.BehaviourTree(root)
+        self.assertFalse(abort.tick(tree))
+        self.assertEqual(after.status, Status.INVALID)
+        self.assertEqual(tree.count, 0)
+
+        latency = abort.abort(tree)
+        self.assertEqual(abort.reason, "test")
+        self.assertEqual(root.status, Status.INVALID)
+        self.assertEqual(abort.latencies.count, 1)
+        self.assertGreaterEqual(latency, 0.0)
+
+    def test_run_tree_aborts_to_safe_state(self):
+        """An abort while the pickup tree runs stops the arm and opens the gripper with the open policy"""
+        abort = AbortController(self.manipulator, gripper_policy=GRIPPER_OPEN)
+        # the object is never detected, so the tree keeps running until aborted
+        self.object_detector._detection_success = 0.0
+        self.manipulator_state.gripper_closed = True
+        root = create_pickup_tree(self.manipulator, self.object_detector, self.force_sensor)
+
+        threading.Timer(0.2, abort.request, args=("timer",)).start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(run_tree(root, self.world_state, max_num_runs=10, abort=abort))
+        self.assertLess(time.perf_counter() - start, 0.45)  # woken up from the sleep between ticks
+        self.assertTrue(self.manipulator.stopped)
+        self.assertFalse(self.manipulator.gripper_closed)
+        self.assertEqual(abort.reason, "timer")
+
+        abort.reset()
+        self.assertFalse(self.manipulator.stopped)
+
+    def test_run_tree_records_aborted_episode(self):
+        """The episode that was aborted is written to the trace"""
+        abort = AbortController(self.manipulator)
+        abort.request("test")
+        root = create_pickup_tree(self.manipulator, self.object_detector, self.force_sensor)
+        with tempfile.TemporaryDirectory() as directory:
+            with TraceRecorder(os.path.join(directory, "trace.json")) as recorder, \
+                    contextlib.redirect_stdout(io.StringIO()):
+                self.assertFalse(run_tree(root, self.world_state, abort=abort, trace_recorder=recorder))
+            self.assertEqual(recorder.episodes, 1)
+
+    def test_signal_requests_abort(self):
+        """An installed signal handler requests an abort"""
+        abort = AbortController()
+        previous = abort.install_signal_handler(signals=(signal.SIGUSR1,))
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertTrue(abort.wait(1.0))
+            self.assertEqual(abort.reason, "signal SIGUSR1")
+        finally:
+            abort.restore_signal_handlers(previous)
+        self.assertIs(signal.getsignal(signal.SIGUSR1), previous[signal.SIGUSR1])
+
+
+if __name__ == '__main__':
+    unittest.main()
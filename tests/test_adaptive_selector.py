@@ -0,0 +1,90 @@
+import functools
+import random
+import statistics
+import unittest
+
+import py_trees
+from py_trees.common import Status
+
+from pick_place_trees.adaptive_selector import AdaptiveSelector
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.simulation import PickupSimulation, quiet
+
+
+class Bernoulli(py_trees.behaviour.Behaviour):
+    """Leaf succeeding with a fixed probability, after running for a fixed number of ticks"""
+    def __init__(self, name, success_probability, duration=1, rng=random):
+        super(Bernoulli, self).__init__(name=name)
+        self.success_probability = success_probability
+        self.duration = duration
+        self.rng = rng
+
+    def initialise(self):
+        self.ticks = 0
+
+    def update(self):
+        self.ticks += 1
+        if self.ticks < self.duration:
+            return Status.RUNNING
+        return Status.SUCCESS if self.rng.random() < self.success_probability else Status.FAILURE
+
+
+class TestAdaptiveSelector(unittest.TestCase):
+    def run_attempts(self, selector, num_attempts):
+        tree = py_trees.trees.BehaviourTree(selector)
+        for _ in range(num_attempts):
+            tree.tick()
+            while selector.status == Status.RUNNING:
+                tree.tick()
+
+    def test_orders_by_cost_per_success(self):
+        """Alternatives are ordered by mean cost / success probability"""
+        rng = random.Random(0)
+        unlikely = Bernoulli("Unlikely", 0.1, rng=rng)
+        slow = Bernoulli("Slow", 0.9, duration=4, rng=rng)
+        fast = Bernoulli("Fast", 0.8, rng=rng)
+        selector = AdaptiveSelector(name="Selector", children=[unlikely, slow, fast], exploration=0.0, rng=rng)
+        self.run_attempts(selector, 500)
+        self.assertEqual(selector.children, [fast, slow, unlikely])
+        self.assertAlmostEqual(selector.statistics_for(slow).mean_cost, 4.0, delta=0.1)
+        self.assertAlmostEqual(selector.statistics_for(fast).success_probability, 0.8, delta=0.1)
+
+    def test_exploration_is_bounded(self):
+        """Without exploration, an alternative that looked worse is not tried first again"""
+        attempts = {}
+        for exploration in (0.0, 1.0):
+            rng = random.Random(1)
+            worse = Bernoulli("Worse", 0.5, rng=rng)
+            better = Bernoulli("Better", 0.9, rng=rng)
+            selector = AdaptiveSelector(name="Selector", children=[better, worse], exploration=exploration, rng=rng)
+            self.run_attempts(selector, 200)
+            attempts[exploration] = selector.statistics_for(worse).attempts
+        # worse is only tried after better failed, i.e. in about 10% of the attempts
+        self.assertLess(attempts[0.0], 40)
+        self.assertGreater(attempts[1.0], attempts[0.0])
+
+    def test_interrupted_attempt_is_not_recorded(self):
+        """An attempt that is interrupted while running counts neither as success nor as failure"""
+        slow = Bernoulli("Slow", 1.0, duration=3)
+        selector = AdaptiveSelector(name="Selector", children=[slow], exploration=0.0)
+        tree = py_trees.trees.BehaviourTree(selector)
+        tree.tick()
+        selector.stop(Status.INVALID)
+        statistics = selector.statistics_for(slow)
+        self.assertEqual((statistics.successes, statistics.failures, statistics.pending_cost), (1.0, 1.0, 0))
+
+    def test_reduces_cycle_time(self):
+        """The adaptive grasp recovery takes fewer ticks per episode than the fixed one"""
+        mean_ticks = {}
+        for adaptive_recovery in (False, True):
+            tree_factory = functools.partial(
+                create_pickup_tree, adaptive_recovery=adaptive_recovery, rng=random.Random(3))
+            simulation = PickupSimulation(slip_probability=0.7, rng=random.Random(3), tree_factory=tree_factory)
+            with quiet():
+                mean_ticks[adaptive_recovery] = statistics.mean(
+                    ticks for _, ticks in (simulation.run_episode() for _ in range(500)))
+        self.assertLess(mean_ticks[True], 0.8 * mean_ticks[False])
+
+
+if __name__ == '__main__':
+    unittest.main()
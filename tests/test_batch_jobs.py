@@ -0,0 +1,91 @@
+import random
+import unittest
+
+from pick_place_trees.batch_jobs import BatchJob, TravelMeter, plan_sequence, sequence_path, travel_length
+from pick_place_trees.compiled_tree import FAILURE, SUCCESS, compile_tree
+from pick_place_trees.simulation import PickupSimulation, quiet
+
+HOME = (15.0, 15.0, 15.0)
+
+
+def random_positions(rng, count, z):
+    return [(rng.uniform(0, 10), rng.uniform(0, 10), z) for _ in range(count)]
+
+
+class TestPlanSequence(unittest.TestCase):
+    def test_line(self):
+        """Parts on a line are picked in the order of the line, placing every part next to the following one"""
+        picks = [(x, 0.0, 0.0) for x in (3.0, 1.0, 4.0, 2.0)]
+        places = [(x + 0.5, 0.0, 0.0) for x in (2.0, 4.0, 1.0, 3.0)]
+        sequence = plan_sequence(picks, places, start=(0.0, 0.0, 0.0))
+        self.assertEqual([picks[pick][0] for pick, _ in sequence], [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual([places[place][0] for _, place in sequence], [1.5, 2.5, 3.5, 4.5])
+        self.assertAlmostEqual(travel_length(sequence_path(sequence, picks, places, (0.0, 0.0, 0.0))), 4.5)
+
+    def test_improves_nearest_neighbour(self):
+        """The improvement passes shorten the nearest neighbour sequence, every part and slot is used once"""
+        rng = random.Random(0)
+        picks = random_positions(rng, 300, 1.0)
+        places = random_positions(rng, 400, 1.0)
+        for fixed_slots in (False, True):
+            slots = places[:300] if fixed_slots else places
+            greedy = plan_sequence(picks, slots, HOME, HOME, fixed_slots=fixed_slots, max_passes=0)
+            planned = plan_sequence(picks, slots, HOME, HOME, fixed_slots=fixed_slots)
+            self.assertEqual(sorted(pick for pick, _ in planned), list(range(300)))
+            self.assertEqual(len({place for _, place in planned}), 300)
+            if fixed_slots:
+                self.assertTrue(all(pick == place for pick, place in planned))
+            improvement = 0.98 if fixed_slots else 0.95
+            self.assertLess(travel_length(sequence_path(planned, picks, slots, HOME, HOME)),
+                            improvement * travel_length(sequence_path(greedy, picks, slots, HOME, HOME)))
+
+    def test_not_enough_places(self):
+        with self.assertRaises(ValueError):
+            plan_sequence([(0, 0, 0), (1, 1, 1)], [(2, 2, 2)], HOME)
+        with self.assertRaises(ValueError):
+            plan_sequence([(0, 0, 0)], [(2, 2, 2), (3, 3, 3)], HOME, fixed_slots=True)
+
+
+class TestBatchJob(unittest.TestCase):
+    def run_job(self, simulation, job):
+        def feed_part(position):
+            simulation.world_state.object_position = position
+
+        simulation.manipulator_state.endeffector_position = job.home_position
+        tree = compile_tree(job.create_tree(feed_part=feed_part))
+        tree.setup(15)
+        ticks = 0
+        with quiet():
+            while tree.status[0] not in (SUCCESS, FAILURE) and ticks < 100000:
+                tree.tick()
+                ticks += 1
+        return tree.status[0]
+
+    def test_travel(self):
+        """With perfect devices the job places all parts, travelling the planned distance"""
+        rng = random.Random(1)
+        simulation = PickupSimulation(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                                      slip_probability=0.0, force_detect_success=1.0, rng=rng)
+        meter = TravelMeter(simulation.manipulator)
+        job = BatchJob(meter, simulation.force_sensor, random_positions(rng, 50, 1.0),
+                       random_positions(rng, 50, 2.0), home_position=HOME)
+        report = job.report()
+        self.assertLess(report.planned, report.naive_without_home)
+        self.assertLess(report.naive_without_home, report.naive)
+        self.assertEqual(self.run_job(simulation, job), SUCCESS)
+        self.assertAlmostEqual(meter.travel, report.planned)
+        self.assertEqual(simulation.manipulator_state.endeffector_position, HOME)
+        self.assertEqual(simulation.world_state.object_position, job.places[job.sequence[-1][1]])
+
+    def test_unreliable_devices(self):
+        """With slipping parts and failing grasps, the per-part retries and recovery place all parts"""
+        rng = random.Random(2)
+        simulation = PickupSimulation(object_detect_success=1.0, slip_probability=0.3, force_detect_success=1.0,
+                                      move_success=1.0, rng=rng)
+        job = BatchJob(simulation.manipulator, simulation.force_sensor, random_positions(rng, 10, 1.0),
+                       random_positions(rng, 10, 2.0), home_position=HOME)
+        self.assertEqual(self.run_job(simulation, job), SUCCESS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import contextlib
+import io
+import random
+import unittest
+
+import py_trees
+from py_trees.common import ParallelPolicy, Status
+
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.mock_object_detector import MockObjectDetector
+from pick_place_trees.mock_force_feedback_sensor import MockForceFeedbackSensor
+from pick_place_trees.world_state import WorldState
+
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.compiled_tree import compile_tree
+
+
+class RandomStatus(py_trees.behaviour.Behaviour):
+    """Leaf returning a random status, drawn from the global random module"""
+    def __init__(self, name, statuses=(Status.SUCCESS, Status.FAILURE, Status.RUNNING)):
+        super(RandomStatus, self).__init__(name=name)
+        self.statuses = statuses
+        self.calls = []
+
+    def initialise(self):
+        self.calls.append("initialise")
+
+    def update(self):
+        self.calls.append("update")
+        return random.choice(self.statuses)
+
+    def terminate(self, new_status):
+        self.calls.append(f"terminate {new_status}")
+
+
+def create_mixed_tree():
+    """A tree covering all compiled composites and decorators, including memory and RUNNING children"""
+    parallel_one = py_trees.composites.Parallel(
+        name="Parallel one", policy=ParallelPolicy.SuccessOnOne(),
+        children=[RandomStatus("P1"), RandomStatus("P2")])
+    p4 = RandomStatus("P4")
+    parallel_selected = py_trees.composites.Parallel(
+        name="Parallel selected", policy=ParallelPolicy.SuccessOnSelected(children=[p4]),
+        children=[RandomStatus("P3"), p4])
+    selector_memory = py_trees.composites.Selector(name="Selector memory", memory=True, children=[
+        py_trees.decorators.Inverter(name="Inverter", child=RandomStatus("S1")),
+        RandomStatus("S2"),
+        parallel_one,
+    ])
+    sequence_memory = py_trees.composites.Sequence(name="Sequence memory", memory=True, children=[
+        py_trees.decorators.FailureIsSuccess(name="FailureIsSuccess", child=RandomStatus("Q1")),
+        py_trees.decorators.Retry(name="Retry", child=RandomStatus("Q2"), num_failures=3),
+        parallel_selected,
+    ])
+    return py_trees.composites.Selector(name="Root", memory=False, children=[
+        py_trees.composites.Sequence(name="Sequence", memory=False, children=[
+            selector_memory,
+            py_trees.decorators.SuccessIsFailure(name="SuccessIsFailure", child=RandomStatus("R1")),
+        ]),
+        sequence_memory,
+        py_trees.decorators.Timeout(name="Opaque timeout", child=RandomStatus("T1"), duration=10.0),
+    ])
+
+
+class TestCompiledTree(unittest.TestCase):
+    def setUp(self):
+        self._log_level = py_trees.logging.level
+        py_trees.logging.level = py_trees.logging.Level.ERROR
+
+    def tearDown(self):
+        py_trees.logging.level = self._log_level
+
+    def create_pickup_tree(self, slip_probability):
+        """Creates the pickup tree with default-like (imperfect) mocks"""
+        manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+        world_state = WorldState(
+            manipulator_state=manipulator_state,
+            object_slip_probability=slip_probability,
+            object_position=(1, 2, 3))
+        manipulator = MockManipulator(
+            state=manipulator_state, world_state=world_state, grasp_success_rate=0.9, move_success_rate=0.9)
+        object_detector = MockObjectDetector(world_state=world_state, detection_success=0.8)
+        force_sensor = MockForceFeedbackSensor(
+            manipulator_state=manipulator_state, world_state=world_state, detection_success=0.9)
+        return create_pickup_tree(manipulator, object_detector, force_sensor)
+
+    def trace_reference(self, root, seed, num_ticks):
+        """Ticks root with py_trees and returns the statuses of all nodes (in compiled order) per tick"""
+        nodes = compile_tree(root).nodes
+        tree = py_trees.trees.BehaviourTree(root)
+        tree.setup(15)
+        random.seed(seed)
+        trace = []
+        for _ in range(num_ticks):
+            tree.tick()
+            trace.append([node.status for node in nodes])
+        return trace
+
+    def trace_compiled(self, root, seed, num_ticks):
+        """Ticks root with the compiled interpreter and returns the statuses of all nodes per tick"""
+        tree = compile_tree(root)
+        tree.setup(15)
+        random.seed(seed)
+        trace = []
+        for _ in range(num_ticks):
+            tree.tick()
+            trace.append(tree.statuses())
+        return trace
+
+    def test_pickup_tree_layout(self):
+        """The compiled tree keeps all nodes in pre-order, starting at the root"""
+        root = self.create_pickup_tree(slip_probability=0.3)
+        tree = compile_tree(root)
+        self.assertIs(tree.nodes[0], root)
+        self.assertListEqual([node.name for node in tree.nodes], [node.name for node in _preorder(root)])
+        self.assertEqual(tree.root_status, Status.INVALID)
+
+    def test_pickup_tree_parity(self):
+        """Compiled ticking has the same node statuses as py_trees on every tick"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            for seed in range(10):
+                for slip_probability in (0.0, 0.3, 0.9):
+                    reference = self.trace_reference(self.create_pickup_tree(slip_probability), seed, 150)
+                    compiled = self.trace_compiled(self.create_pickup_tree(slip_probability), seed, 150)
+                    self.assertEqual(reference, compiled, f"seed {seed}, slip {slip_probability}")
+
+    def test_mixed_tree_parity(self):
+        """Parity with py_trees for memory composites, parallel policies, decorators and opaque nodes"""
+        for seed in range(20):
+            reference_root = create_mixed_tree()
+            compiled_root = create_mixed_tree()
+            self.assertEqual(self.trace_reference(reference_root, seed, 60),
+                             self.trace_compiled(compiled_root, seed, 60), f"seed {seed}")
+            # leaves are initialised, updated and terminated in the same order
+            reference_calls = [node.calls for node in _preorder(reference_root) if isinstance(node, RandomStatus)]
+            compiled_calls = [node.calls for node in _preorder(compiled_root) if isinstance(node, RandomStatus)]
+            self.assertEqual(reference_calls, compiled_calls)
+
+    def test_interrupt(self):
+        """Interrupting stops all nodes, like py_trees' stop(INVALID)"""
+        random.seed(1)
+        tree = compile_tree(create_mixed_tree())
+        for _ in range(5):
+            tree.tick()
+        tree.interrupt()
+        self.assertTrue(all(status == Status.INVALID for status in tree.statuses()))
+
+    def test_write_back(self):
+        """write_back() copies statuses and retry counters to the py_trees nodes"""
+        root = self.create_pickup_tree(slip_probability=0.3)
+        tree = compile_tree(root)
+        random.seed(3)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(20):
+                tree.tick()
+        tree.write_back()
+        self.assertListEqual([node.status for node in tree.nodes], tree.statuses())
+        retries = [node for node in tree.nodes if isinstance(node, py_trees.decorators.Retry)]
+        self.assertListEqual([node.failures for node in retries],
+                             [tree.failures[tree.nodes.index(node)] for node in retries])
+
+
+def _preorder(node):
+    yield node
+    if isinstance(node, py_trees.decorators.Decorator):
+        yield from _preorder(node.decorated)
+    else:
+        for child in node.children:
+            yield from _preorder(child)
+
+
+if __name__ == '__main__':
+    unittest.main()
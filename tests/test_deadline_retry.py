@@ -0,0 +1,81 @@
+import unittest
+
+import py_trees
+from py_trees.common import Status
+
+from pick_place_trees.compiled_tree import OPAQUE, compile_tree
+from pick_place_trees.deadline_retry import DeadlineRetry
+from pick_place_trees.device_latency import SimulatedClock
+
+
+class SlowCall(py_trees.behaviour.Behaviour):
+    """Fails after its device call took `duration` seconds, or its timeout"""
+    def __init__(self, clock, duration, timeout=None):
+        super(SlowCall, self).__init__(name="Slow call")
+        self.clock = clock
+        self.duration = duration
+        self.timeout = timeout
+        self.timeouts_seen = []
+
+    def update(self):
+        self.timeouts_seen.append(self.timeout)
+        self.clock.sleep(self.duration if self.timeout is None else min(self.duration, self.timeout))
+        return Status.FAILURE
+
+
+class TestDeadlineRetry(unittest.TestCase):
+    def tick(self, node):
+        for _ in node.tick():
+            pass
+        return node.status
+
+    def test_deadline(self):
+        """The retry gives up at its deadline, with the call deadlines capped at the time left"""
+        clock = SimulatedClock()
+        child = SlowCall(clock, duration=0.3, timeout=0.25)
+        retry = DeadlineRetry(name="Retry", child=child, num_failures=10, deadline=0.6, clock=clock)
+        statuses = [self.tick(retry) for _ in range(3)]
+        self.assertEqual(statuses, [Status.RUNNING, Status.RUNNING, Status.FAILURE])
+        for seen, expected in zip(child.timeouts_seen, [0.25, 0.25, 0.1]):
+            self.assertAlmostEqual(seen, expected)
+        self.assertAlmostEqual(clock(), 0.6)
+        self.assertEqual((retry.failures, retry.expired), (3, 1))
+        self.assertEqual(child.timeout, 0.25)  # restored
+
+        # a new run has a new deadline
+        self.assertEqual(self.tick(retry), Status.RUNNING)
+        self.assertEqual(retry.failures, 1)
+
+    def test_expired_while_waiting(self):
+        """Time passing in-between ticks counts as well, a retry past its deadline fails without a new attempt"""
+        clock = SimulatedClock()
+        child = SlowCall(clock, duration=0.1)
+        retry = DeadlineRetry(name="Retry", child=child, num_failures=10, deadline=0.5, clock=clock)
+        self.assertEqual(self.tick(retry), Status.RUNNING)
+        self.assertAlmostEqual(child.timeouts_seen[0], 0.5)
+        clock.sleep(1.0)
+        self.assertEqual(self.tick(retry), Status.FAILURE)
+        self.assertEqual(len(child.timeouts_seen), 1)
+        self.assertEqual(retry.expired, 1)
+
+    def test_num_failures(self):
+        """Without slow calls, the retry behaves like a Retry"""
+        clock = SimulatedClock()
+        retry = DeadlineRetry(name="Retry", child=SlowCall(clock, duration=0.0), num_failures=3, deadline=1.0,
+                              clock=clock)
+        self.assertEqual([self.tick(retry) for _ in range(3)], [Status.RUNNING, Status.RUNNING, Status.FAILURE])
+        self.assertEqual(retry.expired, 0)
+
+    def test_compiled_opaque(self):
+        clock = SimulatedClock()
+        root = py_trees.composites.Sequence(name="Root", memory=False, children=[
+            DeadlineRetry(name="Retry", child=SlowCall(clock, duration=0.1), num_failures=3, deadline=1.0,
+                          clock=clock)])
+        tree = compile_tree(root)
+        self.assertEqual(tree.kind[1], OPAQUE)
+        tree.tick()
+        self.assertEqual(tree.status[1], 1)  # RUNNING
+
+
+if __name__ == '__main__':
+    unittest.main()
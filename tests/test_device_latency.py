@@ -0,0 +1,121 @@
+import random
+import statistics
+import threading
+import unittest
+
+from py_trees.common import Status
+
+from pick_place_trees.device_latency import (DeviceTimeout, LatencyModel, SimulatedClock, WallClock,
+                                             call_device, wait_for_response)
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.mock_object_detector import MockObjectDetector
+from pick_place_trees.task_detect_object import DetectObject
+from pick_place_trees.task_manipulator import ManipulatorMoveToPosition
+from pick_place_trees.world_state import WorldState
+
+
+class TestLatencyModel(unittest.TestCase):
+    def test_means(self):
+        """Every distribution has the documented mean"""
+        for distribution in LatencyModel.DISTRIBUTIONS:
+            model = LatencyModel(0.01, 0.02, distribution, stall_probability=0.1, stall=0.1, rng=random.Random(1))
+            samples = [model.sample() for _ in range(20000)]
+            self.assertAlmostEqual(statistics.mean(samples), model.mean, delta=0.002, msg=distribution)
+            self.assertGreaterEqual(min(samples), 0.01)
+
+    def test_scaled(self):
+        model = LatencyModel(0.01, 0.02, "exponential", stall_probability=0.1, stall=0.1)
+        self.assertAlmostEqual(model.scaled(3).mean, 3 * model.mean)
+        self.assertEqual(LatencyModel(0.05).scaled(0.0).sample(), 0.0)
+
+    def test_unknown_distribution(self):
+        with self.assertRaises(ValueError):
+            LatencyModel(0.01, 0.01, "gaussian")
+
+
+class TestClocks(unittest.TestCase):
+    def test_simulated_clock(self):
+        """Sleeps advance the virtual time, run the timers that are due, and stop when the event is set"""
+        clock = SimulatedClock()
+        event = threading.Event()
+        fired = []
+        clock.call_at(0.5, lambda: fired.append(clock()))
+        clock.call_at(1.5, event.set)
+        self.assertFalse(clock.sleep(1.0, event))
+        self.assertEqual((clock(), fired), (1.0, [0.5]))
+        self.assertTrue(clock.sleep(1.0, event))
+        self.assertEqual(clock(), 1.5)
+        self.assertTrue(clock.sleep(1.0, event))  # already set
+        self.assertEqual(clock(), 1.5)
+
+    def test_wall_clock(self):
+        clock = WallClock()
+        event = threading.Event()
+        event.set()
+        began = clock()
+        self.assertTrue(clock.sleep(10.0, event))
+        self.assertFalse(clock.sleep(0.001))
+        self.assertLess(clock() - began, 1.0)
+
+    def test_wait_for_response(self):
+        """Slow responses time out at the deadline, a cancellation ends the wait early"""
+        clock = SimulatedClock()
+        self.assertFalse(wait_for_response(0.2, clock, timeout=0.5))
+        self.assertAlmostEqual(clock(), 0.2)
+        with self.assertRaises(DeviceTimeout):
+            wait_for_response(0.8, clock, timeout=0.5)
+        self.assertAlmostEqual(clock(), 0.7)
+        cancel = threading.Event()
+        clock.call_at(0.8, cancel.set)
+        self.assertTrue(wait_for_response(0.8, clock, timeout=0.5, cancel=cancel))
+        self.assertAlmostEqual(clock(), 0.8)
+
+
+class TestSlowDevices(unittest.TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.manipulator_state = MockManipulatorState(name="Test")
+        self.world_state = WorldState(manipulator_state=self.manipulator_state, object_position=(1, 2, 3))
+
+    def test_detector(self):
+        """A slow detection takes its latency, or fails the behaviour at its deadline"""
+        detector = MockObjectDetector(self.world_state, detection_success=1.0, latency=LatencyModel(0.3),
+                                      clock=self.clock)
+        self.assertEqual(detector.detect_object(), (1, 2, 3))
+        self.assertAlmostEqual(self.clock(), 0.3)
+        with self.assertRaises(DeviceTimeout):
+            detector.detect_object(timeout=0.1)
+        self.assertAlmostEqual(self.clock(), 0.4)
+
+        behaviour = DetectObject(object_detector=detector, namespace="/slow_devices", timeout=0.1)
+        self.assertEqual(behaviour.update(), Status.FAILURE)
+        self.assertEqual(behaviour.timeouts, 1)
+        behaviour.timeout = 0.5
+        self.assertEqual(behaviour.update(), Status.SUCCESS)
+
+    def test_manipulator(self):
+        """A slow move is halted at its deadline, and cancelled right away by stop()"""
+        manipulator = MockManipulator(self.manipulator_state, self.world_state, move_success_rate=1.0,
+                                      motion_duration=0.2, latency=LatencyModel(0.1, 0.1), clock=self.clock)
+        self.assertTrue(manipulator.move_to_position((0, 0, 0)))
+        self.assertGreaterEqual(self.clock(), 0.3)
+
+        behaviour = ManipulatorMoveToPosition(manipulator=manipulator, target_position=(1, 1, 1), timeout=0.25)
+        self.assertEqual(behaviour.update(), Status.FAILURE)
+        self.assertEqual(behaviour.timeouts, 1)
+        self.assertIsNone(manipulator.endeffector_position)
+
+        stop_at = self.clock() + 0.05
+        self.clock.call_at(stop_at, manipulator.stop)
+        self.assertFalse(manipulator.move_to_position((2, 2, 2), timeout=1.0))
+        self.assertAlmostEqual(self.clock(), stop_at)
+        self.assertIsNone(manipulator.endeffector_position)
+
+    def test_call_device(self):
+        """Devices without deadlines can still be called without a timeout"""
+        self.assertEqual(call_device(lambda: 1), 1)
+        self.assertEqual(call_device(lambda timeout: timeout, timeout=0.1), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
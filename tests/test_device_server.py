@@ -0,0 +1,141 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import py_trees
+
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.mock_object_detector import MockObjectDetector
+from pick_place_trees.world_state import WorldState
+
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.device_latency import DeviceTimeout
+from pick_place_trees.device_server import (
+    FORCE_SENSOR, MANIPULATOR, OBJECT_DETECTOR,
+    DeviceClient, DeviceError, DeviceServer, create_mock_server)
+from pick_place_trees.task_manipulator import ManipulatorMoveToPosition
+from pick_place_trees.simulation import quiet
+
+
+class FaultySensor:
+    """Force sensor that fails, or responds slowly"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def detect_force(self):
+        time.sleep(self.delay)
+        if not self.delay:
+            raise ValueError("sensor fault")
+        return True
+
+
+class TestDeviceServer(unittest.TestCase):
+    def setUp(self):
+        self.server = create_mock_server(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                                         slip_probability=0.0, force_detect_success=1.0)
+        self.server.start()
+        self.client = DeviceClient(self.server.address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+
+    def test_calls(self):
+        """Every method is encoded, executed and decoded, reusing a single connection"""
+        manipulator = self.client.manipulator()
+        self.assertIsNone(manipulator.endeffector_position)
+        self.assertEqual(self.client.object_detector().detect_object(), (1, 2, 3))
+        self.assertTrue(manipulator.move_to_position((1, 2, 2.9)))
+        self.assertTrue(manipulator.is_object_within_grasp_offset((1, 2, 3)))
+        self.assertTrue(manipulator.grasp())
+        self.assertTrue(manipulator.gripper_closed)
+        self.assertTrue(self.client.force_sensor().detect_force())
+        self.assertTrue(manipulator.release())
+        self.assertFalse(manipulator.move_to_position(None))
+        self.assertEqual(self.client.connections_opened, 1)
+
+    def test_pipeline(self):
+        """Pipelined calls are answered in order"""
+        results = self.client.pipeline([
+            (MANIPULATOR, "move_to_position", (4, 5, 6)),
+            (MANIPULATOR, "state"),
+            (OBJECT_DETECTOR, "detect_object"),
+            (FORCE_SENSOR, "detect_force"),
+        ])
+        self.assertEqual(results, [True, ((4, 5, 6), False), (1, 2, 3), False])
+
+    def test_pickup_tree(self):
+        """The pickup tree uses the network adapters unchanged (perfect success probabilities)"""
+        root = create_pickup_tree(self.client.manipulator(), self.client.object_detector(),
+                                  self.client.force_sensor())
+        with quiet():
+            py_trees.trees.BehaviourTree(root).tick()
+        self.assertEqual(root.status, py_trees.common.Status.SUCCESS)
+        self.assertEqual(self.client.manipulator().endeffector_position, (15, 15, 15))
+
+
+class TestDeviceClient(unittest.TestCase):
+    def create_server(self, force_sensor, address=("127.0.0.1", 0), motion_duration=0.0):
+        manipulator_state = MockManipulatorState(name="MyManipulator")
+        world_state = WorldState(manipulator_state=manipulator_state)
+        manipulator = MockManipulator(state=manipulator_state, world_state=world_state, move_success_rate=1.0,
+                                      motion_duration=motion_duration)
+        server = DeviceServer(manipulator, MockObjectDetector(world_state=world_state), force_sensor,
+                              address=address)
+        server.start()
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_device_error(self):
+        """A failing device raises DeviceError, and the connection remains usable"""
+        client = DeviceClient(self.create_server(FaultySensor()).address)
+        with self.assertRaisesRegex(DeviceError, "sensor fault"):
+            client.force_sensor().detect_force()
+        self.assertTrue(client.manipulator().release())
+        self.assertEqual(client.connections_opened, 1)
+        client.close()
+
+    def test_timeout(self):
+        """A slow response raises DeviceTimeout, and its connection is not reused"""
+        client = DeviceClient(self.create_server(FaultySensor(delay=0.3)).address, timeout=0.05)
+        with self.assertRaises(DeviceTimeout):
+            client.force_sensor().detect_force()
+        # the server is still busy with the slow call, wait longer for this one
+        self.assertTrue(client.call(MANIPULATOR, "release", timeout=2.0))
+        self.assertEqual(client.connections_opened, 2)
+        client.close()
+
+    def test_call_timeout(self):
+        """The deadline of a device call is applied on the server: a timed-out move halts the arm"""
+        client = DeviceClient(self.create_server(FaultySensor(), motion_duration=0.5).address, timeout=5.0)
+        manipulator = client.manipulator()
+        self.assertTrue(manipulator.move_to_position((1, 1, 1)))
+        behaviour = ManipulatorMoveToPosition(manipulator=manipulator, target_position=(2, 2, 2), timeout=0.1)
+        self.assertEqual(behaviour.update(), py_trees.common.Status.FAILURE)
+        self.assertEqual(behaviour.timeouts, 1)
+        self.assertIsNone(manipulator.endeffector_position)
+        self.assertEqual(client.connections_opened, 1)  # answered by the server, the connection is reused
+        client.close()
+
+    def test_stop_cancels_move(self):
+        """Stopping on another connection cancels a move in progress"""
+        client = DeviceClient(self.create_server(FaultySensor(), motion_duration=10.0).address, timeout=5.0)
+        manipulator = client.manipulator()
+        threading.Timer(0.1, manipulator.stop).start()
+        start = time.perf_counter()
+        self.assertFalse(manipulator.move_to_position((1, 1, 1)))
+        self.assertLess(time.perf_counter() - start, 2.0)
+        client.close()
+
+    def test_unix_socket(self):
+        """The server can listen on a unix socket"""
+        path = os.path.join(tempfile.mkdtemp(), "devices.sock")
+        client = DeviceClient(self.create_server(FaultySensor(), address=path).address)
+        self.assertTrue(client.manipulator().move_to_position((1, 1, 1)))
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import functools
+import random
+import unittest
+
+import py_trees
+from py_trees.blackboard import Blackboard
+from py_trees.common import Access, Status
+
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.compiled_tree import compile_tree
+from pick_place_trees.incremental import KeyVersions, compile_incremental
+from pick_place_trees.simulation import PickupSimulation, quiet
+
+
+class Writer(py_trees.behaviour.Behaviour):
+    """Impure leaf writing a random value, drawn from the global random module"""
+    def __init__(self, name, key, values):
+        super(Writer, self).__init__(name=name)
+        self.key = key
+        self.values = values
+        self.calls = 0
+        self.blackboard = self.attach_blackboard_client(name=name)
+        self.blackboard.register_key(key=key, access=Access.WRITE)
+
+    def update(self):
+        self.calls += 1
+        self.blackboard.set(self.key, random.choice(self.values))
+        return Status.SUCCESS
+
+
+class Threshold(py_trees.behaviour.Behaviour):
+    """Pure leaf succeeding if its input is above a threshold, writing the doubled input"""
+    pure = True
+
+    def __init__(self, name, key, threshold, output=None):
+        super(Threshold, self).__init__(name=name)
+        self.key = key
+        self.threshold = threshold
+        self.output = output
+        self.calls = 0
+        self.blackboard = self.attach_blackboard_client(name=name)
+        self.blackboard.register_key(key=key, access=Access.READ)
+        if output:
+            self.blackboard.register_key(key=output, access=Access.WRITE)
+
+    def update(self):
+        self.calls += 1
+        value = self.blackboard.get(self.key)
+        if self.output:
+            self.blackboard.set(self.output, 2 * value)
+        return Status.SUCCESS if value > self.threshold else Status.FAILURE
+
+
+def create_tree():
+    """A tree with a pure leaf, a pure composite subtree and a pure retry that is RUNNING for a while"""
+    return py_trees.composites.Selector(name="Root", memory=False, children=[
+        py_trees.composites.Sequence(name="Main", memory=False, children=[
+            Writer("Write x", "x", [0, 1, 2]),
+            Threshold("Double x", "x", 0, output="y"),
+            py_trees.composites.Selector(name="Pure selector", memory=True, children=[
+                py_trees.decorators.Inverter(name="Inverter", child=Threshold("x > 1", "x", 1)),
+                py_trees.composites.Sequence(name="Pure sequence", memory=False, children=[
+                    Threshold("y > 2", "y", 2),
+                    Threshold("x > 0", "x", 0),
+                ]),
+            ]),
+            Writer("Write z", "z", [0, 1]),
+            py_trees.decorators.Retry(name="Pure retry", child=Threshold("z > 0", "z", 0), num_failures=3),
+        ]),
+        Writer("Fallback", "x", [1]),
+    ])
+
+
+def run(compiler, ticks):
+    """Returns the statuses and blackboard values after every tick, and the tree"""
+    for key in ("/x", "/y", "/z"):
+        Blackboard.storage.pop(key, None)
+    random.seed(3)
+    tree = compiler(create_tree())
+    tree.setup(15)
+    trace = []
+    for _ in range(ticks):
+        tree.tick()
+        trace.append((tree.status.tobytes(), tuple(Blackboard.storage.get(key) for key in ("/x", "/y", "/z"))))
+    return trace, tree
+
+
+class TestKeyVersions(unittest.TestCase):
+    def test_versions(self):
+        """Versions change with the value of a key, not with writes of an equal value"""
+        versions = KeyVersions()
+        Blackboard.storage.pop("/versioned", None)
+        self.assertEqual(versions.version("/versioned"), 0)
+        Blackboard.storage["/versioned"] = (1, 2)
+        self.assertEqual(versions.version("/versioned"), 1)
+        Blackboard.storage["/versioned"] = (1, 2)
+        self.assertEqual(versions.version("/versioned"), 1)
+        Blackboard.storage["/versioned"] = None
+        self.assertEqual(versions.version("/versioned"), 2)
+        del Blackboard.storage["/versioned"]
+
+
+class TestIncrementalTree(unittest.TestCase):
+    def setUp(self):
+        self._log_level = py_trees.logging.level
+        py_trees.logging.level = py_trees.logging.Level.ERROR
+
+    def tearDown(self):
+        py_trees.logging.level = self._log_level
+
+    def test_parity(self):
+        """Statuses and blackboard are the same as with full evaluation, with fewer pure updates"""
+        full, full_tree = run(compile_tree, 300)
+        incremental, tree = run(compile_incremental, 300)
+        self.assertEqual(incremental, full)
+        self.assertEqual([node.name for node in tree.pure_subtrees], ["Double x", "Pure selector", "Pure retry"])
+        self.assertGreater(tree.skips, 50)
+        self.assertGreater(tree.nodes_skipped, tree.skips)
+        pure_calls = lambda tree: sum(node.calls for node in tree.nodes if isinstance(node, Threshold))
+        impure_calls = lambda tree: [node.calls for node in tree.nodes if isinstance(node, Writer)]
+        self.assertLess(pure_calls(tree), pure_calls(full_tree))
+        self.assertEqual(impure_calls(tree), impure_calls(full_tree))
+
+    def test_pickup_parity(self):
+        """The pickup tree goes through the same states as with full evaluation, episode after episode"""
+        def create(name, compiler):
+            return PickupSimulation(rng=random.Random(7), compiler=compiler,
+                                    tree_factory=functools.partial(create_pickup_tree, namespace=name))
+
+        full = create("/full", compile_tree)
+        incremental = create("/incremental", compile_incremental)
+        with quiet():
+            for _ in range(300):
+                full.reset()
+                incremental.reset()
+                while full.tree.status[0] in (0, 1):
+                    full.tree.tick()
+                    incremental.tree.tick()
+                    self.assertEqual(incremental.get_state(), full.get_state())
+        self.assertGreater(incremental.tree.skips, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
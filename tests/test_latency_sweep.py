@@ -0,0 +1,36 @@
+import unittest
+
+from pick_place_trees.latency_sweep import LatencySweep
+
+
+class TestLatencySweep(unittest.TestCase):
+    def test_degradation(self):
+        """Slower devices give fewer ticks per second, longer cycles and slower aborts, with the same outcomes"""
+        points = LatencySweep(seed=1).run([0.0, 1.0, 4.0], episodes=100, aborts=50)
+        self.assertEqual(len({point.successes for point in points}), 1)
+        self.assertGreater(points[0].successes, 50)
+        instant, _, slow = points
+        self.assertEqual((instant.overruns, instant.abort_latency.max, instant.timeouts), (0, 0.0, 0))
+        self.assertAlmostEqual(instant.tick_rate, 10.0)  # one tick per tick period
+        for faster, slower in zip(points, points[1:]):
+            self.assertGreater(faster.tick_rate, slower.tick_rate)
+            self.assertLess(faster.cycle_time.mean, slower.cycle_time.mean)
+        self.assertGreater(slow.abort_latency.count, 25)  # the others came after the end of the episode
+        self.assertGreater(slow.abort_latency.max, 0.2)
+
+    def test_deadlines(self):
+        """Per-call deadlines bound the abort latency, slow calls time out"""
+        sweep = LatencySweep(timeouts={"detect_object": 0.2, "detect_force": 0.05, "move_to_position": 5.0},
+                             retry_deadline=10.0, seed=1)
+        point = sweep.run_point(4.0, episodes=100, aborts=50)
+        self.assertGreater(point.timeouts, 0)
+        self.assertLessEqual(point.abort_latency.max, 0.2 + 1e-9)
+        self.assertGreater(point.successes, 0)
+
+    def test_reproducible(self):
+        sweep = LatencySweep(seed=2)
+        self.assertEqual(sweep.run_point(1.0, 50, 20).row(), sweep.run_point(1.0, 50, 20).row())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import math
+import random
+import unittest
+
+import numpy as np
+
+from pick_place_trees.markov_analysis import BranchingRandom, analyse_pickup
+from pick_place_trees.simulation import PickupSimulation, quiet
+
+
+class TestBranchingRandom(unittest.TestCase):
+    def test_enumerates_all_outcomes(self):
+        """Replaying with all scripts enumerates every outcome once, with probabilities summing to one"""
+        rng = BranchingRandom()
+        outcomes = {}
+        script = []
+        while script is not None:
+            rng.begin(script)
+            first = rng.random() < 0.3
+            # the second event only happens after the first one
+            second = rng.random() < 0.6 if first else None
+            outcomes[(first, second)] = rng.probability()
+            script = rng.next_script()
+        self.assertEqual(len(outcomes), 3)
+        self.assertAlmostEqual(outcomes[(True, True)], 0.18)
+        self.assertAlmostEqual(outcomes[(False, None)], 0.7)
+        self.assertAlmostEqual(sum(outcomes.values()), 1.0)
+
+
+class TestMarkovAnalysis(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.chain = analyse_pickup(slip_probability=0.3)
+
+    def test_perfect_success(self):
+        """With perfect success probabilities the task succeeds in a single tick"""
+        chain = analyse_pickup(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                               slip_probability=0.0, force_detect_success=1.0)
+        self.assertAlmostEqual(chain.success_probability(), 1.0)
+        self.assertAlmostEqual(chain.expected_ticks(), 1.0)
+
+    def test_always_slip(self):
+        """If the object always slips, the pick sequence is retried until its retry limit"""
+        chain = analyse_pickup(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                               slip_probability=1.0, force_detect_success=1.0)
+        self.assertAlmostEqual(chain.success_probability(), 0.0)
+        self.assertAlmostEqual(chain.outcome_probabilities()["FAILURE (Repty Pick sequence)"], 1.0)
+        self.assertAlmostEqual(chain.expected_ticks(), 100.0)
+
+    def test_tick_distribution(self):
+        """The tick distribution is consistent with the absorption probabilities and expected ticks"""
+        distribution = self.chain.tick_distribution()
+        for outcome, probability in self.chain.outcome_probabilities().items():
+            self.assertAlmostEqual(distribution[outcome].sum(), probability, places=9)
+        ticks = sum(distribution.values())
+        self.assertAlmostEqual(np.dot(np.arange(1, len(ticks) + 1), ticks), self.chain.expected_ticks(), places=6)
+
+    def test_matches_simulation(self):
+        """Success probability and expected ticks agree with simulated episodes"""
+        num_episodes = 4000
+        simulation = PickupSimulation(slip_probability=0.3, rng=random.Random(42))
+        with quiet():
+            episodes = [simulation.run_episode() for _ in range(num_episodes)]
+        success_rate = np.mean([success for success, _ in episodes])
+        ticks = np.array([ticks for _, ticks in episodes])
+
+        p = self.chain.success_probability()
+        self.assertLess(abs(success_rate - p), 4 * math.sqrt(p * (1 - p) / num_episodes))
+        self.assertLess(abs(ticks.mean() - self.chain.expected_ticks()), 4 * ticks.std() / math.sqrt(num_episodes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import random
+import sys
+import threading
+import unittest
+
+from py_trees.blackboard import Blackboard
+
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.multi_tree import MultiTreeRunner
+from pick_place_trees.world_state import WorldState
+
+
+class TestMultiTreeRunner(unittest.TestCase):
+    def test_namespaces(self):
+        """Every cell keeps its blackboard keys in its own namespace"""
+        runner = MultiTreeRunner(cells=3)
+        for cell, simulation in enumerate(runner.simulations):
+            self.assertEqual(simulation.blackboard_keys,
+                             [f"/cell_{cell}/manipulator_target", f"/cell_{cell}/object_pose"])
+
+    def test_threads_do_not_change_outcomes(self):
+        """With fixed seeds, a cell has the same outcomes alone, after other cells or in parallel with them"""
+        alone = MultiTreeRunner(cells=1, seed=5).run(100, threaded=False)
+        sequential = MultiTreeRunner(cells=4, seed=5).run(100, threaded=False)
+        threaded = MultiTreeRunner(cells=4, seed=5).run(100)
+        self.assertEqual(threaded.outcomes, sequential.outcomes)
+        self.assertEqual(threaded.outcomes[0], alone.outcomes[0])
+        self.assertEqual(threaded.episodes, 400)
+        self.assertNotEqual(threaded.outcomes[0], threaded.outcomes[1])
+        self.assertFalse(Blackboard.activity_stream)
+
+    def test_errors_are_raised(self):
+        def broken_tree(manipulator, object_detector, force_sensor, namespace):
+            raise RuntimeError("broken")
+
+        with self.assertRaises(RuntimeError):
+            MultiTreeRunner(cells=2, tree_factory=broken_tree)
+
+
+class TestConcurrentWorldState(unittest.TestCase):
+    def setUp(self):
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # switch threads as often as possible
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+    def test_grasp_while_reading(self):
+        """The object position can be read while another thread grasps and releases the object"""
+        state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+        state.endeffector_position = (1, 2, 2.9)
+        world_state = WorldState(state, object_position=(1, 2, 3), object_slip_probability=0.0,
+                                 rng=random.Random(0))
+        manipulator = MockManipulator(state, world_state, grasp_success_rate=1.0, rng=random.Random(1))
+        done = threading.Event()
+        errors = []
+
+        def grasp_and_release():
+            try:
+                for _ in range(5000):
+                    manipulator.grasp()
+                    manipulator.release()
+            except BaseException as error:
+                errors.append(error)
+            finally:
+                done.set()
+
+        thread = threading.Thread(target=grasp_and_release)
+        thread.start()
+        positions = set()
+        while not done.is_set():
+            positions.add(world_state.object_position)
+            world_state.is_object_within_grasp_offset()
+        thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(positions, {(1, 2, 3)})
+
+
+if __name__ == '__main__':
+    unittest.main()
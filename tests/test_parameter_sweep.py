@@ -0,0 +1,86 @@
+import unittest
+
+from pick_place_trees.parameter_sweep import ParameterSweep, SweepCache, parse_range, wilson_interval
+
+
+class TestParameterSweep(unittest.TestCase):
+    def setUp(self):
+        self.cache = SweepCache(":memory:")
+        self.ranges = {
+            "object_detect_success": [1.0],
+            "move_success": [1.0],
+            "grasp_success": [1.0],
+            "slip_probability": [0.0],
+            "force_detect_success": [1.0],
+        }
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_parse_range(self):
+        """Ranges can be single values, lists or inclusive ranges"""
+        self.assertListEqual(parse_range("0.5"), [0.5])
+        self.assertListEqual(parse_range("0.9,0.1"), [0.1, 0.9])
+        self.assertListEqual(parse_range("0.5:0.9:5"), [0.5, 0.6, 0.7, 0.8, 0.9])
+
+    def test_wilson_interval(self):
+        """The interval contains the observed rate and shrinks with more episodes"""
+        lower, upper = wilson_interval(50, 100)
+        self.assertLess(lower, 0.5)
+        self.assertGreater(upper, 0.5)
+        wide = upper - lower
+        lower, upper = wilson_interval(500, 1000)
+        self.assertLess(upper - lower, wide)
+
+    def test_sequential_stopping(self):
+        """A certain outcome stops after the minimum number of episodes"""
+        sweep = ParameterSweep(self.cache, batch_size=50, min_episodes=100, refine_rounds=0)
+        results = sweep.run(self.ranges)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].episodes, 100)
+        self.assertEqual(results[0].success_rate, 1.0)
+
+    def test_cache_reuse_and_extension(self):
+        """Reruns take results from the cache, tighter precision only computes the missing batches"""
+        self.ranges["move_success"] = [0.9]
+        sweep = ParameterSweep(self.cache, precision=0.1, batch_size=50, min_episodes=50, refine_rounds=0)
+        first = sweep.run(self.ranges)[0]
+        self.assertEqual(sweep.episodes_run, first.episodes)
+
+        rerun = ParameterSweep(self.cache, precision=0.1, batch_size=50, min_episodes=50, refine_rounds=0)
+        self.assertEqual(rerun.run(self.ranges)[0].successes, first.successes)
+        self.assertEqual(rerun.episodes_run, 0)
+
+        extended = ParameterSweep(self.cache, precision=0.05, batch_size=50, min_episodes=50, refine_rounds=0)
+        result = extended.run(self.ranges)[0]
+        self.assertEqual(extended.episodes_run, result.episodes - first.episodes)
+        self.assertGreater(extended.episodes_run, 0)
+
+        # a different seed is a different cache entry
+        other_seed = ParameterSweep(self.cache, seed=1, precision=0.1, batch_size=50, min_episodes=50, refine_rounds=0)
+        other_seed.run(self.ranges)
+        self.assertGreater(other_seed.episodes_run, 0)
+
+    def test_batch_size_independent(self):
+        """Cached results are the same whatever batch size computed them"""
+        self.ranges["move_success"] = [0.9]
+        results = []
+        for batch_size in (20, 50):
+            cache = SweepCache(":memory:")
+            sweep = ParameterSweep(cache, batch_size=batch_size, min_episodes=100, max_episodes=100, refine_rounds=0)
+            result = sweep.run(self.ranges)[0]
+            results.append((result.episodes, result.successes, result.ticks_sum))
+            cache.close()
+        self.assertEqual(results[0], results[1])
+
+    def test_refinement(self):
+        """Points in-between neighbours with a sharp change in success are added"""
+        self.ranges["grasp_success"] = [0.0, 1.0]
+        sweep = ParameterSweep(self.cache, precision=0.2, batch_size=20, min_episodes=20,
+                               refine_threshold=0.5, refine_rounds=1)
+        results = sweep.run(self.ranges)
+        self.assertListEqual([result.params["grasp_success"] for result in results], [0.0, 0.5, 1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
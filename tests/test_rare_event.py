@@ -0,0 +1,61 @@
+import math
+import random
+import unittest
+
+from pick_place_trees.markov_analysis import analyse_pickup
+from pick_place_trees.rare_event import PICK_EXHAUSTED, RareEventEstimator, TiltedRandom
+
+
+class TestTiltedRandom(unittest.TestCase):
+    def test_likelihood_ratio(self):
+        """The weight is the nominal probability of the drawn outcomes divided by their biased probability"""
+        rng = TiltedRandom(biasing={("slip", 0.3): 0.6}, rng=random.Random(0))
+        slip = rng.channel("slip")
+        other = rng.channel("other")
+        rng.begin()
+        outcomes = [slip.random() < 0.3 for _ in range(20)]
+        self.assertTrue(other.random() < 1.0)
+        hits = sum(outcomes)
+        self.assertAlmostEqual(rng.weight, (0.3 / 0.6) ** hits * (0.7 / 0.4) ** (20 - hits))
+        self.assertEqual(rng.trials, {("slip", 0.3): 20, ("other", 1.0): 1})
+
+    def test_unbiased(self):
+        """Weighted biased draws estimate the nominal probability"""
+        rng = TiltedRandom(biasing={(None, 0.01): 0.5}, rng=random.Random(1))
+        total = 0.0
+        for _ in range(20000):
+            rng.begin()
+            if rng.random() < 0.01:
+                total += rng.weight
+        self.assertAlmostEqual(total / 20000, 0.01, delta=0.001)
+
+
+class TestRareEventEstimator(unittest.TestCase):
+    params = dict(slip_probability=0.9)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.exact = analyse_pickup(**cls.params).outcome_probabilities()[PICK_EXHAUSTED]
+
+    def test_matches_markov_chain(self):
+        """The importance sampling estimate agrees with the exact probability of the Markov chain"""
+        estimator = RareEventEstimator(seed=2, **self.params)
+        biasing = estimator.cross_entropy(episodes=200, refinements=1)
+        self.assertGreater(biasing[("world_state", 0.9)], 0.9)
+        estimate = estimator.estimate(1000, biasing)
+        self.assertGreater(estimate.hits, 200)
+        self.assertLess(estimate.relative_error, 0.1)
+        # the weights are heavy-tailed, the standard error may underestimate the error of a single run
+        self.assertAlmostEqual(estimate.probability, self.exact, delta=0.15 * self.exact)
+
+    def test_plain_monte_carlo(self):
+        """Without biasing every episode has weight one, and the rare event is not hit"""
+        estimator = RareEventEstimator(seed=3, **self.params)
+        estimate = estimator.estimate(200)
+        self.assertEqual(estimate.hits, 0)
+        self.assertEqual(estimate.probability, 0.0)
+        self.assertTrue(math.isinf(estimate.relative_error))
+
+
+if __name__ == '__main__':
+    unittest.main()
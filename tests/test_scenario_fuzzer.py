@@ -0,0 +1,72 @@
+import glob
+import os
+import unittest
+
+from pick_place_trees.scenario_fuzzer import ScenarioFuzzer, ScriptedRandom, load_case
+
+CASES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "fuzz_cases", "*.json")))
+
+
+class TestScriptedRandom(unittest.TestCase):
+    def test_outcomes(self):
+        """Uncertain events follow the script and then their most likely outcome, certain events are not scripted"""
+        rng = ScriptedRandom()
+        rng.begin([False, True])
+        self.assertFalse(rng.random() < 0.9)
+        self.assertTrue(rng.random() < 1.0)
+        self.assertTrue(rng.random() < 0.3)
+        self.assertTrue(rng.random() < 0.9)
+        self.assertFalse(rng.random() < 0.3)
+        self.assertEqual(rng.path, [False, True, True, False])
+
+
+class TestScenarioFuzzer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fuzzer = ScenarioFuzzer(seed=0)
+
+    def test_reaches_rare_paths(self):
+        """Paths that random episodes practically never take are covered within a few thousand runs"""
+        targets = {
+            "Repty Pick sequence: RUNNING -> FAILURE",  # 100 failed pick attempts
+            "Retry Detect Object: RUNNING -> FAILURE",  # 10 failed detections in a row
+            "Monitor Gripper Closed: SUCCESS -> FAILURE",
+        }
+        fuzzer = ScenarioFuzzer(seed=1)
+        fuzzer.fuzz(max_runs=5000, targets=targets)
+        self.assertLessEqual(targets, set(fuzzer.describe(fuzzer.coverage)))
+        self.assertLess(fuzzer.runs, 5000)
+
+    def test_minimize(self):
+        """A scenario is minimized to the outcomes leading to the property"""
+        target = "Retry Detect Object: RUNNING -> FAILURE"
+        script = [True, False, True] * 10 + [False] * 12 + [True, False] * 10
+        result = self.fuzzer.minimize(script, lambda candidate: target in self.fuzzer.describe(candidate.coverage))
+        # ten failed detections in a row, everything else takes its most likely outcome
+        self.assertEqual(result.script, [False] * 10)
+
+    def test_regression_cases(self):
+        """The saved scenarios replay with their recorded outcome, the violations of known bugs aside"""
+        self.assertTrue(CASES)
+        for path in CASES:
+            with self.subTest(case=os.path.basename(path)):
+                case = load_case(path)
+                result = self.fuzzer.run(case["script"])
+                self.assertEqual(result.success, case["success"])
+                self.assertEqual(result.ticks, case["ticks"])
+                if "known_bug" not in case:
+                    self.assertEqual(list(result.violations), case["violations"])
+                self.assertEqual(self.fuzzer.describe(result.coverage), case["transitions"])
+
+    @unittest.expectedFailure
+    def test_known_bugs(self):
+        """The scenarios of known bugs do not violate any invariant once the bugs are fixed"""
+        cases = [load_case(path) for path in CASES]
+        known_bugs = [case for case in cases if "known_bug" in case]
+        self.assertTrue(known_bugs)
+        for case in known_bugs:
+            self.assertEqual(self.fuzzer.run(case["script"]).violations, (), msg=case["known_bug"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+import py_trees
+
+from pick_place_trees.mock_manipulator import MockManipulator, MockManipulatorState
+from pick_place_trees.mock_object_detector import MockObjectDetector
+from pick_place_trees.mock_force_feedback_sensor import MockForceFeedbackSensor
+from pick_place_trees.world_state import WorldState
+from pick_place_trees.task_gripper import GripperIsClosed
+
+from pick_place_trees.behavior_tree import create_pickup_tree, run_tree
+from pick_place_trees.device_latency import DeviceTimeout, LatencyModel, SimulatedClock
+from pick_place_trees.sensor_snapshot import SensorSnapshot
+
+
+class CountingForceSensor:
+    """Force sensor returning alternating readings, counting the device reads"""
+    def __init__(self):
+        self.reads = 0
+
+    def detect_force(self):
+        self.reads += 1
+        return self.reads % 2 == 1
+
+
+class TestSensorSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.target_object_position = (1, 2, 3)
+        self.manipulator_state = MockManipulatorState(name="MyManipulator", grasp_offset_z=0.1)
+        self.world_state = WorldState(
+            manipulator_state=self.manipulator_state,
+            object_slip_probability=0.0,
+            object_position=self.target_object_position)
+        self.manipulator = MockManipulator(
+            state=self.manipulator_state, world_state=self.world_state, grasp_success_rate=1.0, move_success_rate=1.0)
+        self.object_detector = MockObjectDetector(world_state=self.world_state, detection_success=1.0)
+        self.force_sensor = MockForceFeedbackSensor(
+            manipulator_state=self.manipulator_state, world_state=self.world_state, detection_success=1.0)
+
+    def test_one_read_per_tick(self):
+        """All reads of a sensor within a tick are served the same reading"""
+        snapshot = SensorSnapshot()
+        sensor = CountingForceSensor()
+        cached = snapshot.force_sensor(sensor)
+        self.assertTrue(cached.detect_force())
+        self.assertTrue(cached.detect_force())
+        self.assertEqual(sensor.reads, 1)
+        self.assertEqual(snapshot.reads_saved, 1)
+        snapshot.new_tick()
+        self.assertFalse(cached.detect_force())
+        self.assertEqual(sensor.reads, 2)
+
+    def test_actuation_invalidates(self):
+        """Actuation commands of the wrapped manipulator drop the readings"""
+        snapshot = SensorSnapshot()
+        sensor = CountingForceSensor()
+        cached = snapshot.force_sensor(sensor)
+        manipulator = snapshot.manipulator(self.manipulator)
+        cached.detect_force()
+        self.assertTrue(manipulator.grasp())
+        cached.detect_force()
+        self.assertEqual(sensor.reads, 2)
+        self.assertEqual(snapshot.invalidations, 1)
+        # non-actuation attributes are those of the manipulator
+        self.assertTrue(manipulator.gripper_closed)
+
+    def test_freshness_window(self):
+        """With a freshness window, readings are reused across ticks until they are too old"""
+        now = [0.0]
+        snapshot = SensorSnapshot(max_age=0.1, clock=lambda: now[0])
+        sensor = CountingForceSensor()
+        cached = snapshot.force_sensor(sensor)
+        cached.detect_force()
+        snapshot.new_tick()
+        now[0] = 0.05
+        cached.detect_force()
+        self.assertEqual(sensor.reads, 1)
+        now[0] = 0.2
+        cached.detect_force()
+        self.assertEqual(sensor.reads, 2)
+
+    def test_parallel_monitors_share_reading(self):
+        """Two monitors of the same sensor in a parallel cause a single device read per tick"""
+        snapshot = SensorSnapshot()
+        sensor = CountingForceSensor()
+        cached = snapshot.force_sensor(sensor)
+        root = py_trees.composites.Parallel(
+            name="Monitors", policy=py_trees.common.ParallelPolicy.SuccessOnAll(synchronise=False),
+            children=[GripperIsClosed(name="Monitor 1", force_sensor=cached),
+                      GripperIsClosed(name="Monitor 2", force_sensor=cached)])
+        tree = py_trees.trees.BehaviourTree(root)
+        tree.add_pre_tick_handler(snapshot.new_tick)
+        tree.tick()
+        self.assertEqual(root.status, py_trees.common.Status.SUCCESS)
+        tree.tick()
+        self.assertEqual(root.status, py_trees.common.Status.FAILURE)
+        self.assertEqual(sensor.reads, 2)
+        self.assertEqual(snapshot.reads_saved, 2)
+
+    def test_timeout(self):
+        """The deadline of a read applies to the device, a timed-out read is not kept"""
+        clock = SimulatedClock()
+        detector = MockObjectDetector(world_state=self.world_state, detection_success=1.0,
+                                      latency=LatencyModel(0.3), clock=clock)
+        snapshot = SensorSnapshot()
+        cached = snapshot.object_detector(detector)
+        with self.assertRaises(DeviceTimeout):
+            cached.detect_object(timeout=0.1)
+        self.assertEqual(snapshot.reads, 0)
+        self.assertEqual(cached.detect_object(timeout=0.5), self.target_object_position)
+        self.assertEqual(cached.detect_object(timeout=0.1), self.target_object_position)  # served from the snapshot
+        self.assertEqual(snapshot.reads, 1)
+
+    def test_successful_pickup(self):
+        """The pickup tree works unchanged on snapshot devices"""
+        snapshot = SensorSnapshot()
+        root = create_pickup_tree(snapshot.manipulator(self.manipulator),
+                                  snapshot.object_detector(self.object_detector),
+                                  snapshot.force_sensor(self.force_sensor),
+                                  object_target_position=self.target_object_position)
+        self.assertTrue(run_tree(root, self.world_state, sensor_snapshot=snapshot))
+        self.assertListEqual(list(self.world_state.object_position), list(self.target_object_position))
+        self.assertGreater(snapshot.reads, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
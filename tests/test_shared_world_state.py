@@ -0,0 +1,105 @@
+import multiprocessing
+import types
+import unittest
+
+import py_trees
+
+from pick_place_trees.behavior_tree import create_pickup_tree
+from pick_place_trees.device_latency import DEVICE_CALLS
+from pick_place_trees.shared_world_state import OutOfProcessDevices, SharedWorldState
+from pick_place_trees.simulation import quiet
+
+
+def states(i):
+    """A world and manipulator state whose fields are all derived from i, to detect torn reads"""
+    world_state = types.SimpleNamespace(object_position=(i, i, i), holding_object=i % 2 == 0,
+                                        _simulate_object_slip=i % 3 == 0)
+    manipulator_state = types.SimpleNamespace(endeffector_position=(i, -i, i), gripper_closed=i % 2 == 0)
+    return world_state, manipulator_state
+
+
+def write_continuously(block_name, num_writes):
+    block = SharedWorldState(block_name)
+    for i in range(num_writes):
+        block.publish(*states(i))
+    block.close()
+
+
+class TestSharedWorldState(unittest.TestCase):
+    def setUp(self):
+        self.block = SharedWorldState(create=True)
+
+    def tearDown(self):
+        self.block.close()
+        self.block.unlink()
+
+    def test_publish_and_read(self):
+        """Published states are read back, including unknown positions"""
+        world_state, manipulator_state = states(4)
+        self.block.publish(world_state, manipulator_state)
+        snapshot = self.block.read()
+        self.assertEqual(snapshot.object_position, (4, 4, 4))
+        self.assertEqual(snapshot.endeffector_position, (4, -4, 4))
+        self.assertTrue(snapshot.holding_object)
+        self.assertFalse(snapshot.simulate_object_slip)
+        self.assertTrue(self.block.gripper_closed)
+
+        manipulator_state.endeffector_position = None
+        self.block.publish(world_state, manipulator_state)
+        self.assertIsNone(self.block.endeffector_position)
+
+    def test_reads_are_consistent(self):
+        """Reads in another process than the writer never see a partially written state"""
+        self.block.publish(*states(0))
+        writer = multiprocessing.Process(target=write_continuously, args=(self.block.name, 200000))
+        writer.start()
+        reads = 0
+        while writer.is_alive() or reads == 0:
+            snapshot = self.block.read()
+            i = int(snapshot.object_position[0])
+            self.assertEqual(snapshot.object_position, (i, i, i))
+            self.assertEqual(snapshot.endeffector_position, (i, -i, i))
+            self.assertEqual(snapshot.holding_object, i % 2 == 0)
+            self.assertEqual(snapshot.gripper_closed, i % 2 == 0)
+            self.assertEqual(snapshot.simulate_object_slip, i % 3 == 0)
+            reads += 1
+        writer.join()
+        self.assertEqual(writer.exitcode, 0)
+
+
+class TestOutOfProcessDevices(unittest.TestCase):
+    def test_successful_pickup(self):
+        """The pickup tree succeeds with devices in driver processes (perfect success probabilities)"""
+        with OutOfProcessDevices(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                                 slip_probability=0.0, force_detect_success=1.0, seed=0) as devices:
+            root = create_pickup_tree(devices.manipulator, devices.object_detector, devices.force_sensor)
+            tree = py_trees.trees.BehaviourTree(root)
+            with quiet():
+                tree.tick()
+            self.assertEqual(root.status, py_trees.common.Status.SUCCESS)
+            self.assertEqual(devices.world_state.object_position, (5, 5, 5))
+            self.assertFalse(devices.world_state.holding_object)
+
+    def test_timeouts(self):
+        """Device calls with deadlines are passed on to the drivers"""
+        with OutOfProcessDevices(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                                 slip_probability=0.0, force_detect_success=1.0, seed=0) as devices:
+            root = create_pickup_tree(devices.manipulator, devices.object_detector, devices.force_sensor,
+                                      timeouts={call: 1.0 for call in DEVICE_CALLS})
+            tree = py_trees.trees.BehaviourTree(root)
+            with quiet():
+                tree.tick()
+            self.assertEqual(root.status, py_trees.common.Status.SUCCESS)
+
+    def test_stop(self):
+        """Moves fail in the driver after the manipulator has been stopped, until it is resumed"""
+        with OutOfProcessDevices(move_success=1.0, seed=0) as devices:
+            devices.manipulator.stop()
+            self.assertFalse(devices.manipulator.move_to_position((1, 1, 1)))
+            devices.manipulator.resume()
+            self.assertTrue(devices.manipulator.move_to_position((1, 1, 1)))
+            self.assertEqual(devices.manipulator.endeffector_position, (1, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
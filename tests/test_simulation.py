@@ -0,0 +1,41 @@
+import random
+import unittest
+
+from pick_place_trees.simulation import PickupSimulation, quiet
+
+
+class TestPickupSimulation(unittest.TestCase):
+    def test_successful_episode(self):
+        """With perfect success probabilities an episode succeeds in a single tick"""
+        simulation = PickupSimulation(object_detect_success=1.0, move_success=1.0, grasp_success=1.0,
+                                      slip_probability=0.0, force_detect_success=1.0)
+        with quiet():
+            self.assertEqual(simulation.run_episode(), (True, 1))
+            # episodes always start from the initial state
+            self.assertEqual(simulation.run_episode(), (True, 1))
+        self.assertListEqual(list(simulation.world_state.object_position), [5, 5, 5])
+
+    def test_failed_episode(self):
+        """If the object always slips, the episode fails after the pick sequence retries"""
+        simulation = PickupSimulation(slip_probability=1.0, rng=random.Random(0))
+        with quiet():
+            success, ticks = simulation.run_episode()
+        self.assertFalse(success)
+        self.assertGreaterEqual(ticks, 100)
+
+    def test_state_round_trip(self):
+        """Restoring a captured state replays the same episode"""
+        simulation = PickupSimulation(rng=random.Random(0))
+        with quiet():
+            simulation.tree.tick()
+            state = simulation.get_state()
+            simulation.world_state._rng.seed(1)
+            first = [simulation.tree.tick() or simulation.get_state() for _ in range(5)]
+            simulation.set_state(state)
+            simulation.world_state._rng.seed(1)
+            second = [simulation.tree.tick() or simulation.get_state() for _ in range(5)]
+        self.assertEqual(first, second)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+
+from py_trees.blackboard import Blackboard
+
+from pick_place_trees.behavior_tree import create_pickup_tree, release_tree
+from pick_place_trees.simulation import PickupSimulation
+from pick_place_trees.soak import DriftThresholds, SoakRunner, TickLatencyMonitor, subsystem
+
+# latency thresholds that short, noisy test windows never exceed
+RELAXED = dict(p50_drift=100.0, p99_drift=100.0)
+
+
+class SlowingClock:
+    """Clock whose ticks take longer and longer, by 0.1 ms per 1000 ticks"""
+    def __init__(self):
+        self.now = 0.0
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        self.now += 1e-4 * (1 + self.calls / 2000)
+        return self.now
+
+
+class TestSoak(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, "soak.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_subsystem(self):
+        self.assertEqual(subsystem("/usr/lib/python3/site-packages/py_trees/blackboard.py"), "py_trees.blackboard")
+        self.assertEqual(subsystem("/src/pick_place_trees/world_state.py"), "pick_place_trees.world_state")
+        self.assertEqual(subsystem("/usr/lib/python3.11/json/encoder.py"), "other")
+
+    def test_release_tree(self):
+        """Released trees leave no blackboard clients behind"""
+        simulation = PickupSimulation()
+        clients = len(Blackboard.clients)
+        root = create_pickup_tree(simulation.manipulator, simulation.object_detector, simulation.force_sensor)
+        self.assertGreater(len(Blackboard.clients), clients)
+        release_tree(root)
+        self.assertEqual(len(Blackboard.clients), clients)
+
+    def test_flat(self):
+        """Reusing the tree, the memory stays flat, and every window is written to the time series"""
+        runner = SoakRunner(sample_interval=100, output=self.output,
+                            thresholds=DriftThresholds(traced_growth=64 * 1024, **RELAXED))
+        report = runner.run(400)
+        self.assertTrue(report.passed, report.violations)
+        self.assertEqual([sample.cycles for sample in report.samples], [100, 200, 300, 400])
+        with open(self.output) as series:
+            lines = [json.loads(line) for line in series]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1]["cycles"], 400)
+        self.assertGreater(lines[-1]["successes"], 200)
+        self.assertIn("py_trees.blackboard", lines[-1]["subsystems"])
+        self.assertLessEqual(lines[-1]["p50"], lines[-1]["p99"])
+
+    def test_leak(self):
+        """Trees created for every cycle and not released make the soak fail on memory growth"""
+        # the global key metadata of the blackboard may still grow its tables once, with the clients that
+        # other tests left behind
+        thresholds = DriftThresholds(traced_growth=256 * 1024, **RELAXED)
+        released = SoakRunner(sample_interval=100, rebuild=True, thresholds=thresholds).run(600)
+        self.assertTrue(released.passed, released.violations)
+        leaking = SoakRunner(sample_interval=100, rebuild=True, release=False, thresholds=thresholds)
+        report = leaking.run(1500)
+        self.assertFalse(report.passed)
+        self.assertLess(len(report.samples), 15)  # stopped at the violation
+        self.assertIn("traced memory grew", report.violations[0])
+        self.assertEqual(next(iter(report.growth_by_subsystem())), "py_trees.blackboard")
+
+    def test_latency_drift(self):
+        """Ticks getting slower make the soak fail on the tick latency"""
+        runner = SoakRunner(sample_interval=100, trace_memory=False)
+        runner.monitor = TickLatencyMonitor(clock=SlowingClock())
+        report = runner.run(1000)
+        self.assertFalse(report.passed)
+        self.assertIn("tick p50 drifted", report.violations[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
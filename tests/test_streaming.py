@@ -0,0 +1,77 @@
+import itertools
+import random
+import unittest
+
+from pick_place_trees.streaming import StreamingSimulation, conveyor_arrivals, poisson_arrivals
+
+PERFECT = dict(object_detect_success=1.0, move_success=1.0, grasp_success=1.0, slip_probability=0.0,
+               force_detect_success=1.0)
+
+
+class TestArrivals(unittest.TestCase):
+    def test_conveyor(self):
+        """Conveyor arrivals are periodic, jittered arrivals keep their order"""
+        self.assertEqual(list(itertools.islice(conveyor_arrivals(2.0), 3)), [2.0, 4.0, 6.0])
+        times = list(itertools.islice(conveyor_arrivals(1.0, jitter=0.9, rng=random.Random(0)), 1000))
+        self.assertEqual(times, sorted(times))
+        self.assertAlmostEqual(times[-1], 1000, delta=1.0)
+
+    def test_poisson(self):
+        """Poisson arrivals have the given rate"""
+        times = list(itertools.islice(poisson_arrivals(4.0, random.Random(0)), 10000))
+        self.assertAlmostEqual(len(times) / times[-1], 4.0, delta=0.2)
+
+
+class TestStreamingSimulation(unittest.TestCase):
+    def test_perfect_conveyor(self):
+        """With perfect devices every part is placed within a tick, and the manipulator idles in-between"""
+        simulation = StreamingSimulation(conveyor_arrivals(1.0), tick_period=0.1, **PERFECT)
+        statistics = simulation.run(100.5)
+        self.assertEqual(statistics.arrived, 100)
+        self.assertEqual(statistics.completed, 100)
+        self.assertEqual(statistics.ticks, 100)
+        self.assertAlmostEqual(statistics.latency.max, 0.1)
+        self.assertAlmostEqual(statistics.utilization, 10 / 100.5)
+        self.assertEqual(statistics.mean_queue_length, 0.0)
+
+    def test_progress(self):
+        """Reports are made every report interval, and only if there is a progress callback"""
+        simulation = StreamingSimulation(conveyor_arrivals(1.0), tick_period=0.1, **PERFECT)
+        reports = []
+        simulation.run(10.5, report_interval=2.0, progress=lambda statistics: reports.append(statistics.elapsed))
+        self.assertEqual(len(reports), 5)
+        self.assertEqual(simulation.run(10.0, report_interval=2.0).arrived, 20)
+
+    def test_overload(self):
+        """Arrivals faster than the manipulator fill the queue up to its capacity, further parts are dropped"""
+        simulation = StreamingSimulation(poisson_arrivals(20.0, random.Random(1)), tick_period=0.1,
+                                         queue_capacity=10, rng=random.Random(2), **PERFECT)
+        statistics = simulation.run(60)
+        self.assertEqual(statistics.max_queue, 10)
+        self.assertLessEqual(simulation.queue_length, 10)
+        self.assertGreater(statistics.dropped, 0)
+        self.assertAlmostEqual(statistics.utilization, 1.0, places=3)
+        self.assertAlmostEqual(statistics.throughput, 10.0, delta=0.2)
+        self.assertEqual(statistics.arrived, statistics.completed + statistics.dropped + simulation.queue_length
+                         + simulation.busy)
+
+    def test_failures_and_continuation(self):
+        """Failed parts are removed from the cell, and runs continue where the previous one stopped"""
+        def simulate(durations):
+            simulation = StreamingSimulation(poisson_arrivals(1.0, random.Random(3)), rng=random.Random(4))
+            for duration in durations:
+                statistics = simulation.run(duration)
+            return statistics
+
+        statistics = simulate([900, 900])
+        self.assertGreater(statistics.failed, 0)
+        self.assertGreater(statistics.completed, 5 * statistics.failed / 2)
+        self.assertLess(statistics.utilization, 1.0)
+        whole = simulate([1800])
+        self.assertEqual((statistics.completed, statistics.failed, statistics.ticks),
+                         (whole.completed, whole.failed, whole.ticks))
+        self.assertAlmostEqual(statistics.elapsed, whole.elapsed)
+
+
+if __name__ == '__main__':
+    unittest.main()
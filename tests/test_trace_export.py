@@ -0,0 +1,95 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import py_trees
+from py_trees.common import Status
+
+from pick_place_trees.compiled_tree import compile_tree
+from pick_place_trees.simulation import PickupSimulation, quiet
+from pick_place_trees.trace_export import TraceRecorder, VirtualClock
+
+
+class TestTraceRecorder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "trace.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, episodes, compiled=False, seed=3):
+        rng = random.Random(seed)
+        clock = VirtualClock()
+        with TraceRecorder(self.path, clock=clock) as recorder, quiet():
+            for _ in range(episodes):
+                simulation = PickupSimulation(slip_probability=0.5, rng=rng)
+                root = simulation.root
+                tree = compile_tree(root) if compiled else py_trees.trees.BehaviourTree(root)
+                recorder.instrument(root)
+                recorder.attach(tree)
+                tree.tick()
+                while root.status == Status.RUNNING:
+                    clock.advance(0.01)
+                    tree.tick()
+                recorder.end_episode()
+        with open(self.path) as trace:
+            return json.load(trace)
+
+    def test_episodes(self):
+        """Every episode is a named process whose spans lie within its ticks"""
+        events = self.record(episodes=3)
+        names = [event["args"]["name"] for event in events if event["ph"] == "M"]
+        self.assertEqual(names, ["Episode 0", "Episode 1", "Episode 2"])
+        for pid in range(3):
+            ticks = [e for e in events if e["pid"] == pid and e.get("cat") == "tick"]
+            spans = [e for e in events if e["pid"] == pid and e["ph"] == "X" and e["cat"] != "tick"]
+            self.assertTrue(ticks)
+            for span in spans:
+                self.assertTrue(any(tick["ts"] <= span["ts"] and span["ts"] + span["dur"] <= tick["ts"] + tick["dur"]
+                                    for tick in ticks), span)
+
+    def test_spans_and_status_changes(self):
+        """Leaves get initialise/update/terminate spans, composites tick spans, the root's final status is recorded"""
+        events = self.record(episodes=1)
+        names = {event["name"] for event in events}
+        self.assertIn("Detect object.initialise", names)
+        self.assertIn("Detect object.update", names)
+        self.assertIn("Detect object.terminate", names)
+        self.assertIn("Pick and place", names)
+        changes = [event for event in events if event["ph"] == "i"]
+        self.assertTrue(changes)
+        self.assertEqual(changes[-1]["name"].split(" -> ")[0], "Pick and place")
+
+    def test_running_and_failed_ticks(self):
+        """Nodes whose parent stops pulling their tick (RUNNING, FAILURE) get a span on every tick"""
+        retry = py_trees.decorators.Retry(name="Retry", child=py_trees.behaviours.Failure(name="Fail"),
+                                          num_failures=2)
+        root = py_trees.composites.Sequence(name="Root", memory=False, children=[retry])
+        tree = py_trees.trees.BehaviourTree(root)
+        with TraceRecorder(self.path, clock=VirtualClock()) as recorder:
+            recorder.instrument(root)
+            for _ in range(4):
+                tree.tick()
+        with open(self.path) as trace:
+            events = json.load(trace)
+        statuses = [event["args"]["status"] for event in events if event["name"] == "Retry"]
+        self.assertEqual(statuses, ["RUNNING", "FAILURE", "RUNNING", "FAILURE"])
+
+    def test_compiled_tree(self):
+        """With a compiled tree, the leaves' spans are recorded"""
+        events = self.record(episodes=2, compiled=True)
+        names = {event["name"] for event in events}
+        self.assertIn("Detect object.update", names)
+        self.assertNotIn("Pick and place", names)
+        self.assertEqual(len([e for e in events if e["ph"] == "M"]), 2)
+
+    def test_deterministic(self):
+        """With a virtual clock and seeded mocks, the trace is reproducible"""
+        self.assertEqual(self.record(episodes=2), self.record(episodes=2))
+
+
+if __name__ == '__main__':
+    unittest.main()